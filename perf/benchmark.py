@@ -0,0 +1,401 @@
+"""
+Benchmark suite for ducktools.scriptmetadata
+
+Times parse_file, parse_source (with each engine), iter_parse, a MetadataCache hit
+and the regex from the PEP over the synthetic corpus in perf/corpus.py and writes
+the results as JSON.
+Two result files can be compared, exiting with an error if any benchmark
+is slower than the baseline by more than the threshold.
+
+The scaling command parses one shared copy of the corpus from 1 to N threads
+and reports the speedup over a single thread. With the GIL the speedup stays
+near 1, on a free-threaded build it should grow with the number of threads.
+
+python perf/benchmark.py run --output new.json
+python perf/benchmark.py scaling --threads 1 2 4 8 --output scaling.json
+python perf/benchmark.py compare base.json new.json --threshold 0.1
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import timeit
+from functools import partial
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+from corpus import CASES, generate_source, write_corpus  # noqa: E402
+from regex_parse import stream as regex_stream  # noqa: E402
+
+import ducktools.scriptmetadata as scriptmetadata  # noqa: E402
+from ducktools.scriptmetadata import iter_parse, parse_file, parse_source  # noqa: E402
+from ducktools.scriptmetadata.cache import MetadataCache  # noqa: E402
+
+# Engines timed separately, "auto" is timed as plain parse_file/parse_source
+ENGINES = ["statemachine", "regex", "bytes"]
+
+
+def _benchmarks(path: str, source: str, cache: MetadataCache) -> dict:
+    """
+    Get the functions to time for one corpus file
+
+    :param path: Path of the corpus file
+    :param source: Source of the corpus file as read in text mode
+    :param cache: MetadataCache already holding the entry for the file
+    :return: dict of benchmark name to function
+    """
+    def run_parse_file(engine="auto"):
+        parse_file(path, engine=engine)
+
+    def run_parse_source(engine="auto"):
+        parse_source(source, engine=engine)
+
+    def run_iter_parse():
+        for _ in iter_parse(io.StringIO(source)):
+            pass
+
+    def run_cache_hit():
+        # An unchanged file, should be faster than parse_file
+        cache.parse_file(path)
+
+    def run_regex():
+        # As in regex_parse.get_blocks, reading the file is included
+        with open(path, encoding="utf-8") as f:
+            src = f.read()
+        dict(regex_stream(src))
+
+    benchmarks = {
+        "parse_file": run_parse_file,
+        "parse_source": run_parse_source,
+        "iter_parse": run_iter_parse,
+        "cache.parse_file": run_cache_hit,
+        "regex": run_regex,
+    }
+    for engine in ENGINES:
+        benchmarks[f"parse_file[{engine}]"] = partial(run_parse_file, engine)
+        benchmarks[f"parse_source[{engine}]"] = partial(run_parse_source, engine)
+    return benchmarks
+
+
+def time_function(func, repeat: int, min_time: float) -> dict:
+    """
+    Time a function with timeit
+
+    The number of calls per sample is chosen so each sample takes at least min_time.
+
+    :param func: Function to time
+    :param repeat: Number of samples
+    :param min_time: Minimum time of each sample in seconds
+    :return: dict of best and median seconds per call and the calls per sample
+    """
+    timer = timeit.Timer(func)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 2 if elapsed == 0 else max(2, min(int(min_time / elapsed) + 1, 10))
+
+    samples = [t / number for t in timer.repeat(repeat=repeat, number=number)]
+    return {
+        "best": min(samples),
+        "median": statistics.median(samples),
+        "number": number,
+    }
+
+
+def run(args) -> int:
+    cases = CASES
+    if args.filter:
+        cases = [case for case in cases if any(f in case.name for f in args.filter)]
+
+    results = {}
+    with (
+        tempfile.TemporaryDirectory() as tmp,
+        MetadataCache(os.path.join(tmp, "cache.sqlite")) as cache,
+    ):
+        paths = write_corpus(tmp, cases)
+        for case in cases:
+            path = paths[case.name]
+            size = os.path.getsize(path)
+            # Text mode reading, as a user of parse_source would
+            source = generate_source(case).replace("\r\n", "\n")
+            cache.parse_file(path)
+
+            for bench_name, func in _benchmarks(path, source, cache).items():
+                if bench_name in args.skip:
+                    continue
+                key = f"{case.name}/{bench_name}"
+                timing = time_function(func, args.repeat, args.min_time)
+                timing["bytes"] = size
+                results[key] = timing
+
+                if not args.quiet:
+                    mb_per_s = size / timing["best"] / 1e6
+                    print(
+                        f"{key:50} {timing['best'] * 1e6:12.2f}us {mb_per_s:10.1f}MB/s",
+                        file=sys.stderr,
+                    )
+
+    output = {
+        "version": scriptmetadata.__version__,
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+
+    data = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data)
+    else:
+        print(data)
+    return 0
+
+
+def _scaling_tasks(paths: dict[str, str]) -> dict:
+    """
+    Get the functions to run for each corpus file in the scaling benchmark
+
+    :param paths: corpus case names to file paths
+    :return: dict of benchmark name to a list of functions, one per corpus file
+    """
+    sources = {}
+    lines = {}
+    for name, path in paths.items():
+        with open(path, encoding="utf-8") as f:
+            sources[name] = f.read()
+        lines[name] = sources[name].splitlines(keepends=True)
+
+    def run_iter_parse(source_lines):
+        for _ in iter_parse(source_lines):
+            pass
+
+    return {
+        "parse_file": [partial(parse_file, path) for path in paths.values()],
+        "parse_source": [partial(parse_source, source) for source in sources.values()],
+        "iter_parse": [partial(run_iter_parse, ls) for ls in lines.values()],
+    }
+
+
+def time_threads(funcs: list, threads: int, passes: int) -> float:
+    """
+    Time running every function 'passes' times, split between threads
+
+    All threads share the same functions and their inputs. Timing starts once
+    every thread is ready and ends when the last thread finishes.
+
+    :param funcs: Functions to run
+    :param threads: Number of threads
+    :param passes: Number of times to run each function
+    :return: elapsed seconds
+    """
+    work = funcs * passes
+    barrier = threading.Barrier(threads + 1)
+
+    def worker(items):
+        barrier.wait()
+        for func in items:
+            func()
+
+    workers = [
+        threading.Thread(target=worker, args=(work[i::threads],))
+        for i in range(threads)
+    ]
+    for t in workers:
+        t.start()
+
+    barrier.wait()
+    start = timeit.default_timer()
+    for t in workers:
+        t.join()
+    return timeit.default_timer() - start
+
+
+def scaling(args) -> int:
+    gil_check = getattr(sys, "_is_gil_enabled", None)
+    gil_enabled = True if gil_check is None else gil_check()
+
+    cases = [case for case in CASES if not case.name.startswith("large")]
+    if args.filter:
+        cases = [case for case in cases if any(f in case.name for f in args.filter)]
+
+    results = {}
+    speedups = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        paths = write_corpus(tmp, cases)
+        size = sum(os.path.getsize(path) for path in paths.values()) * args.passes
+
+        for bench_name, funcs in _scaling_tasks(paths).items():
+            if bench_name in args.skip:
+                continue
+            single = None
+            for threads in args.threads:
+                samples = [
+                    time_threads(funcs, threads, args.passes) for _ in range(args.repeat)
+                ]
+                best = min(samples)
+                if single is None:
+                    single = best
+                speedup = single / best
+
+                key = f"scaling/{bench_name}[{threads}]"
+                results[key] = {
+                    "best": best,
+                    "median": statistics.median(samples),
+                    "number": 1,
+                    "bytes": size,
+                    "speedup": speedup,
+                }
+                speedups[bench_name] = speedup
+
+                if not args.quiet:
+                    print(
+                        f"{key:50} {best * 1e3:10.2f}ms "
+                        f"{size / best / 1e6:10.1f}MB/s {speedup:6.2f}x",
+                        file=sys.stderr,
+                    )
+
+    output = {
+        "version": scriptmetadata.__version__,
+        "python": sys.version,
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "gil_enabled": gil_enabled,
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+    data = json.dumps(output, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(data)
+    else:
+        print(data)
+
+    if args.min_speedup is not None:
+        slow = {
+            name: speedup for name, speedup in speedups.items()
+            if speedup < args.min_speedup
+        }
+        if slow:
+            for name, speedup in slow.items():
+                print(
+                    f"{name}: {speedup:.2f}x speedup with {args.threads[-1]} threads "
+                    f"is below {args.min_speedup:.2f}x",
+                    file=sys.stderr,
+                )
+            return 1
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    print(f"baseline: {baseline['version']} ({baseline['implementation']})")
+    print(f"current:  {current['version']} ({current['implementation']})")
+    print()
+
+    regressions = []
+    for key, timing in current["results"].items():
+        base_timing = baseline["results"].get(key)
+        if base_timing is None:
+            print(f"{key:50} {'new':>12}")
+            continue
+        ratio = timing[args.stat] / base_timing[args.stat]
+        flag = ""
+        if ratio > 1 + args.threshold:
+            regressions.append(key)
+            flag = "  REGRESSION"
+        print(
+            f"{key:50} {base_timing[args.stat] * 1e6:12.2f}us "
+            f"{timing[args.stat] * 1e6:12.2f}us {ratio:8.2f}x{flag}"
+        )
+
+    if regressions:
+        print()
+        print(
+            f"{len(regressions)} benchmark(s) slower than the baseline "
+            f"by more than {args.threshold:.0%}"
+        )
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--output", "-o", help="File to write the JSON results to")
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument(
+        "--min-time", type=float, default=0.05,
+        help="Minimum time of each sample in seconds",
+    )
+    run_parser.add_argument(
+        "--filter", action="append",
+        help="Only run corpus cases with names containing this text",
+    )
+    run_parser.add_argument(
+        "--skip", action="append", default=[],
+        help="Benchmark to skip, eg: 'regex' or 'parse_file[statemachine]'",
+    )
+    run_parser.add_argument("--quiet", "-q", action="store_true")
+    run_parser.set_defaults(func=run)
+
+    scaling_parser = subparsers.add_parser(
+        "scaling", help="Time parsing a shared corpus from multiple threads"
+    )
+    scaling_parser.add_argument("--output", "-o", help="File to write the JSON results to")
+    scaling_parser.add_argument(
+        "--threads", type=int, nargs="+", default=[1, 2, 4, 8],
+        help="Numbers of threads to run, speedups are relative to the first",
+    )
+    scaling_parser.add_argument(
+        "--passes", type=int, default=20,
+        help="Number of times each corpus file is parsed per sample",
+    )
+    scaling_parser.add_argument("--repeat", type=int, default=5)
+    scaling_parser.add_argument(
+        "--filter", action="append",
+        help="Only use corpus cases with names containing this text",
+    )
+    scaling_parser.add_argument(
+        "--skip", action="append", default=[],
+        help="Benchmark to skip, eg: 'parse_file'",
+    )
+    scaling_parser.add_argument(
+        "--min-speedup", type=float, default=None,
+        help="Exit with an error if any speedup with the most threads is below this",
+    )
+    scaling_parser.add_argument("--quiet", "-q", action="store_true")
+    scaling_parser.set_defaults(func=scaling)
+
+    compare_parser = subparsers.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument(
+        "--threshold", type=float, default=0.1,
+        help="Allowed slowdown as a fraction of the baseline time",
+    )
+    compare_parser.add_argument("--stat", choices=["best", "median"], default="best")
+    compare_parser.set_defaults(func=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.func(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Synthetic source generator for the benchmark suite
+
+Each corpus case describes one python source file. Cases vary the file size,
+the number of metadata blocks, where in the file the blocks are placed,
+the line endings and the fraction of blocks that are malformed.
+
+python perf/corpus.py DEST_DIR    # Write every case to DEST_DIR
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+from dataclasses import dataclass
+
+CODE_LINES = [
+    "import os\n",
+    "import sys\n",
+    "\n",
+    "def main(argv=None):\n",
+    "    args = parse_args(argv)\n",
+    "    for item in args.items:\n",
+    "        print(f'{item!r}')\n",
+    "    return 0\n",
+    "# A plain comment about the code\n",
+    "#\n",
+    "x = {'key': [1, 2, 3]}  # trailing comment\n",
+    "class Example:\n",
+    "    '''Docstring with # /// script inside'''\n",
+]
+
+BLOCK_BODY = [
+    "# requires-python = \">=3.11\"\n",
+    "# dependencies = [\n",
+    "#   \"requests<3\",\n",
+    "#   \"rich\",\n",
+    "# ]\n",
+]
+
+MALFORMED_KINDS = ("unclosed", "invalid_name", "new_block_before_close")
+
+
+@dataclass(frozen=True)
+class CorpusCase:
+    name: str
+    lines: int
+    blocks: int
+    position: str = "start"  # "start", "middle" or "end"
+    crlf: bool = False
+    malformed: float = 0.0  # Fraction of blocks that are malformed
+    seed: int = 723
+
+
+# Cases run by the benchmark, names are used as keys in the results
+CASES = [
+    CorpusCase("tiny-1block", lines=20, blocks=1),
+    CorpusCase("small-0blocks", lines=200, blocks=0),
+    CorpusCase("small-1block", lines=200, blocks=1),
+    CorpusCase("small-1block-end", lines=200, blocks=1, position="end"),
+    CorpusCase("small-1block-crlf", lines=200, blocks=1, crlf=True),
+    CorpusCase("medium-0blocks", lines=5_000, blocks=0),
+    CorpusCase("medium-1block", lines=5_000, blocks=1),
+    CorpusCase("medium-1block-end", lines=5_000, blocks=1, position="end"),
+    CorpusCase("medium-4blocks-middle", lines=5_000, blocks=4, position="middle"),
+    CorpusCase("medium-4blocks-malformed", lines=5_000, blocks=4, malformed=0.5),
+    CorpusCase("medium-4blocks-crlf", lines=5_000, blocks=4, crlf=True),
+    CorpusCase("large-1block", lines=100_000, blocks=1),
+    CorpusCase("large-8blocks-end-malformed", lines=100_000, blocks=8, position="end", malformed=0.5),
+]
+
+
+def _block(name: str, kind: str | None) -> list[str]:
+    if kind == "unclosed":
+        return [f"# /// {name}\n", *BLOCK_BODY, "import unclosed\n"]
+    if kind == "invalid_name":
+        return [f"# /// {name}!\n", *BLOCK_BODY, "# ///\n"]
+    if kind == "new_block_before_close":
+        return [f"# /// {name}\n", *BLOCK_BODY, f"# /// {name}-inner\n", "# ///\n"]
+    return [f"# /// {name}\n", *BLOCK_BODY, "# ///\n"]
+
+
+def generate_source(case: CorpusCase) -> str:
+    """
+    Generate the source code for a corpus case
+
+    :param case: Description of the source to generate
+    :return: python source code
+    """
+    rng = random.Random(case.seed)
+
+    malformed_count = round(case.blocks * case.malformed)
+    kinds: list[str | None] = [
+        MALFORMED_KINDS[i % len(MALFORMED_KINDS)] for i in range(malformed_count)
+    ]
+    kinds += [None] * (case.blocks - malformed_count)
+    rng.shuffle(kinds)
+
+    blocks = []
+    for i, kind in enumerate(kinds):
+        # Every block is separated from the next by a code line
+        blocks.append(_block("script" if i == 0 else f"block-{i}", kind) + ["\n"])
+
+    block_lines = sum(len(block) for block in blocks)
+    code = rng.choices(CODE_LINES, k=max(case.lines - block_lines, 0))
+
+    if case.position == "start":
+        insert_at = [0] * len(blocks)
+    elif case.position == "end":
+        insert_at = [len(code)] * len(blocks)
+    elif case.position == "middle":
+        insert_at = sorted(rng.randrange(len(code) + 1) for _ in blocks)
+    else:
+        raise ValueError(f"Unknown block position {case.position!r}")
+
+    lines: list[str] = []
+    prev = 0
+    for at, block in zip(insert_at, blocks):
+        lines.extend(code[prev:at])
+        lines.extend(block)
+        prev = at
+    lines.extend(code[prev:])
+
+    source = "".join(lines)
+    if case.crlf:
+        source = source.replace("\n", "\r\n")
+    return source
+
+
+def write_corpus(dest: str, cases: list[CorpusCase] = CASES) -> dict[str, str]:
+    """
+    Write the source for each case to dest
+
+    :param dest: Directory to write the files to
+    :param cases: Corpus cases to write
+    :return: dict of case name to file path
+    """
+    os.makedirs(dest, exist_ok=True)
+    paths = {}
+    for case in cases:
+        path = os.path.join(dest, f"{case.name}.py")
+        # newline="" so CRLF cases are written as generated
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(generate_source(case))
+        paths[case.name] = path
+    return paths
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("dest")
+    args = parser.parse_args()
+
+    for name, path in write_corpus(args.dest).items():
+        print(f"{name}: {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Import time regression check for ducktools.scriptmetadata
+
+Runs 'python -X importtime' in a subprocess several times and reports the
+cumulative import time of the module. Exits with an error if the median
+time exceeds --max-us or if any slow module is imported as a side effect.
+
+python perf/import_time.py --runs 20 --max-us 3000
+"""
+import argparse
+import statistics
+import subprocess
+import sys
+
+MODULE = "ducktools.scriptmetadata"
+
+# Modules that should never be imported just by importing the parser
+SLOW_MODULES = {
+    "re",
+    "enum",
+    "typing",
+    "mmap",
+    "fnmatch",
+    "json",
+    "sqlite3",
+    "concurrent.futures",
+    "ducktools.classbuilder",
+}
+
+
+def import_times() -> dict[str, int]:
+    """
+    Run one import of MODULE and get the cumulative import time of every
+    module imported, in microseconds.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.removeprefix("import time:").split("|")
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--max-us", type=int, default=None)
+    args = parser.parse_args()
+
+    # First run to make sure bytecode is cached
+    imported = import_times()
+
+    slow_imports = sorted(SLOW_MODULES & imported.keys())
+
+    samples = [import_times()[MODULE] for _ in range(args.runs)]
+    median = statistics.median(samples)
+
+    print(f"{MODULE} import time over {args.runs} runs")
+    print(f"  min:    {min(samples)}us")
+    print(f"  median: {median}us")
+    print(f"  max:    {max(samples)}us")
+
+    failed = False
+    if slow_imports:
+        print(f"Slow modules imported: {', '.join(slow_imports)}")
+        failed = True
+    if args.max_us is not None and median > args.max_us:
+        print(f"Median import time {median}us exceeds the limit of {args.max_us}us")
+        failed = True
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -29,4 +29,5 @@ def get_blocks(pth: str):
     return {name: content for name, content in stream(src)}
 
 
-print(get_blocks(sample_path))
+if __name__ == "__main__":
+    print(get_blocks(sample_path))
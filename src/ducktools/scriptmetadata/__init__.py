@@ -27,38 +27,147 @@ Embedded Python metadata format parser.
 # deferred annotations
 from __future__ import annotations
 
-import io
+import codecs
 import os
-
-from ducktools.classbuilder.prefab import Prefab
+# 'io' and 'time' are already imported by the interpreter at startup
+from io import IncrementalNewlineDecoder, TextIOWrapper
+from time import perf_counter
 
 from ._version import __version__ as __version__
 
+# Avoid importing 'typing' and 'mmap' at runtime
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    import mmap
+    from collections.abc import Callable, Generator
+    from typing import IO
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 try:
     # Faster
-    from _collections_abc import Iterable, Iterator
+    from _collections_abc import AsyncIterable, AsyncIterator, Iterable, Iterator
 except ImportError:  # pragma: nocover
-    from collections.abc import Iterable, Iterator
+    from collections.abc import AsyncIterable, AsyncIterator, Iterable, Iterator
 
 __all__ = [
     "parse_source",
     "parse_file",
+    "parse_files",
+    "parse_files_async",
     "parse_iterable",
+    "has_metadata_file",
+    "has_metadata_source",
+    "scan_tree",
+    "parse_archive",
     "ScriptMetadata",
     "iter_parse",
+    "aiter_parse",
+    "MetadataParser",
+    "iter_spans",
+    "BlockSpan",
     "MetadataWarning",
+    "WarningCode",
+    "ParseStats",
 ]
 
 
-class MetadataWarning(Prefab):
+class WarningCode:
+    """
+    Codes identifying the type of a MetadataWarning
+    """
+    # Plain integers are used instead of an Enum as 'enum' is slow to import
+    OTHER = 0
+    UNCLOSED_BLOCK = 1
+    NEW_BLOCK_BEFORE_CLOSE = 2
+    INVALID_BLOCK_NAME = 3
+
+
+_WARNING_TEMPLATES = {
+    WarningCode.UNCLOSED_BLOCK: (
+        "Potential unclosed block {0!r} detected. "
+        "A '# ///' block is needed to indicate the end of the block."
+    ),
+    WarningCode.NEW_BLOCK_BEFORE_CLOSE: (
+        "New {0!r} block encountered before block {1!r} closed."
+    ),
+    WarningCode.INVALID_BLOCK_NAME: (
+        "{0!r} is not a valid block name. "
+        "Block names must consist of alphanumeric characters and '-' only."
+    ),
+}
+
+
+class MetadataWarning:
+    """
+    Warning about a potentially malformed metadata block
+
+    Warnings created by the parser store a code and the block names involved,
+    the message text is only formatted when it is first used.
+
+    :param line_number: Line number the warning refers to
+    :param message: Warning text, if not given it is formatted from the code
+    :param code: WarningCode value identifying the type of warning
+    :param block_names: Block names used to format the message
+    """
+    __slots__ = ("line_number", "code", "block_names", "_message")
+    __match_args__ = ("line_number", "message")
+
     line_number: int
-    message: str
+    code: int
+    block_names: tuple[str, ...]
+    _message: str | None
+
+    def __init__(
+        self,
+        line_number: int,
+        message: str | None = None,
+        *,
+        code: int = WarningCode.OTHER,
+        block_names: tuple[str, ...] = (),
+    ):
+        if message is None and code not in _WARNING_TEMPLATES:
+            raise TypeError("A message must be given for warnings without a known code.")
+
+        self.line_number = line_number
+        self.code = code
+        self.block_names = block_names
+        self._message = message
+
+    @property
+    def message(self) -> str:
+        if self._message is None:
+            self._message = _WARNING_TEMPLATES[self.code].format(*self.block_names)
+        return self._message
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}("
+            f"line_number={self.line_number!r}, message={self.message!r})"
+        )
+
+    def __eq__(self, other):
+        if self.__class__ is other.__class__:
+            return (
+                self.line_number == other.line_number
+                and self.message == other.message
+            )
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
 
     def __str__(self):
         return f"Line {self.line_number}: {self.message}"
 
 
 # The string library imports 're' so some extra manual work here
+_VALID_TYPE_CHARACTERS = frozenset(
+    "abcdefghijklmnopqrstuvwxyz"
+    "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    "0123456789"
+    "-"
+)
+
+
 def _is_valid_type(txt: str) -> bool:
     """
     The specification requires TYPE be alphanumeric + hyphens
@@ -66,102 +175,168 @@ def _is_valid_type(txt: str) -> bool:
     :param txt: the block name/TYPE
     :return: True if the text given is a valid TYPE, False otherwise
     """
-    ascii_lowercase = "abcdefghijklmnopqrstuvwxyz"
-    ascii_uppercase = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
-    digits = "0123456789"
-    extra_characters = "-"
-    valid_type = ascii_lowercase + ascii_uppercase + digits + extra_characters
-
-    return all(c in valid_type for c in txt)
+    return _VALID_TYPE_CHARACTERS.issuperset(txt)
 
 
-# noinspection PyArgumentList
-def iter_parse(
-    script_data: Iterable[str],
-    *,
-    start_line: int = 1,
-) -> Iterator[tuple[str | None, str | None, list[MetadataWarning]]]:
+class _ParserState:
     """
-    Iterate over source and yield embedded metadata.
+    State of the parser between batches of lines
+    """
+    __slots__ = (
+        "in_block",
+        "end_seen",
+        "block_name",
+        "block_data",
+        "partial_block_data",
+        "block_start",
+        "block_end",
+        "used_blocks",
+        "warnings_list",
+        "line_no",
+    )
 
-    This function implements the actual parsing logic. If a user wishes
-    to implement early exit or raising warnings directly this can be used.
+    def __init__(self):
+        # Is the parser within a potential metadata block
+        self.in_block: bool = False
 
-    :param script_data: an iterable of source code: eg an open file
-    :param start_line: line number to start iterating from
-    :yields: tuples of block_name, block_text, warnings
-             will yield a None block_name if there are unused warnings at EOF
-    """
+        # Has a potential closing '# ///' line been seen for
+        # the current metadata block
+        self.end_seen: bool = False
 
-    # Is the parser within a potential metadata block
-    in_block = False
+        self.block_name: str | None = None
+        self.block_data: list[str] = []
+        self.partial_block_data: list[str] = []
+
+        # Line numbers of the opening line and last closing line
+        self.block_start: int = 0
+        self.block_end: int = 0
+
+        self.used_blocks: set[str] = set()
+        self.warnings_list: list[MetadataWarning] = []
+
+        # Number of the last line parsed
+        self.line_no: int = 0
+
+    def copy(self) -> _ParserState:
+        new_state = _ParserState()
+        new_state.in_block = self.in_block
+        new_state.end_seen = self.end_seen
+        new_state.block_name = self.block_name
+        new_state.block_data = self.block_data.copy()
+        new_state.partial_block_data = self.partial_block_data.copy()
+        new_state.block_start = self.block_start
+        new_state.block_end = self.block_end
+        new_state.used_blocks = self.used_blocks.copy()
+        new_state.warnings_list = self.warnings_list.copy()
+        new_state.line_no = self.line_no
+        return new_state
+
+
+# noinspection PyArgumentList
+def _iter_parse_numbered(
+    numbered_lines: Iterable[tuple[int, str]],
+    *,
+    build_text: bool = True,
+    collect_warnings: bool = True,
+    state: _ParserState | None = None,
+    final: bool = True,
+    stats: ParseStats | None = None,
+) -> Generator[tuple[str | None, str | None, list[MetadataWarning], int, int], None, None]:
+    """
+    The parsing state machine, working on (line_number, line) pairs.
 
-    # Has a potential closing '# ///' line been seen for
-    # the current metadata block
-    end_seen = False
+    Lines may be skipped as long as every skipped line is one that
+    cannot change the parser state: a line outside of a block that is
+    not a '# /// TYPE' opening line.
 
-    block_name = None
-    block_data: list[str] = []
-    partial_block_data: list[str] = []
+    Parsing can be split over several calls by passing the same state,
+    with final=False for every batch of lines except the last.
 
-    used_blocks: set[str] = set()
-    warnings_list: list[MetadataWarning] = []
+    :param numbered_lines: iterable of line numbers and lines of source code
+    :param build_text: Join the block text, if False None is given as the text
+    :param collect_warnings: Create warnings, if False the warning lists are empty
+    :param state: parser state to resume from and to store the state in
+    :param final: True if these are the last lines, False to skip the EOF checks
+    :param stats: ParseStats to add the time taken to join block text to
+    :yields: tuples of block_name, block_text, warnings,
+             line number of the opening line, line number of the closing line
+    """
+    if state is None:
+        state = _ParserState()
 
-    line_no = 0  # Make sure line number is defined even if there is no data
+    # Local variables are faster in the loop
+    in_block = state.in_block
+    end_seen = state.end_seen
+    block_name = state.block_name
+    block_data = state.block_data
+    partial_block_data = state.partial_block_data
+    block_start = state.block_start
+    block_end = state.block_end
+    used_blocks = state.used_blocks
+    warnings_list = state.warnings_list
+    line_no = state.line_no
 
-    for line_no, line in enumerate(script_data, start=start_line):
+    for line_no, line in numbered_lines:
         if in_block:
             if line.rstrip() == "# ///":
                 # Potential end block
                 # Block doesn't definitely end until an invalid line is encountered or EOF
                 # So extend the block data with everything up to now and reset partial data.
-                block_data.extend("".join(partial_block_data))
+                block_data.extend(partial_block_data)
                 end_seen = True
+                block_end = line_no
 
                 # reset partial data - add this line
-                partial_block_data = [line[2:]]
+                partial_block_data = [line[2:]] if build_text else []
 
             elif line.rstrip() == "#" or line.startswith("# "):
                 # Metadata line
-                if line.startswith("# /// "):
+                if collect_warnings and line.startswith("# /// "):
                     # Possibly an unclosed block. Make note.
                     invalid_block_name = line[6:].strip()
 
                     if _is_valid_type(invalid_block_name):
+                        # block_name is always set while in a block
+                        assert block_name is not None
                         message = MetadataWarning(
                             line_no,
-                            (
-                                f"New {invalid_block_name!r} block encountered "
-                                f"before block {block_name!r} closed."
-                            ),
+                            code=WarningCode.NEW_BLOCK_BEFORE_CLOSE,
+                            block_names=(invalid_block_name, block_name),
                         )
                         warnings_list.append(message)
 
-                # Remove '# ' or '#' prefix
-                line = line[2:] if line.startswith("# ") else line[1:]
-                partial_block_data.append(line)
+                if build_text:
+                    # Remove '# ' or '#' prefix
+                    line = line[2:] if line.startswith("# ") else line[1:]
+                    partial_block_data.append(line)
 
             else:
                 # Metadata block has ended
                 if end_seen:
                     # Block was closed with "# ///" at some point.
-                    block_data_str = "".join(block_data)
-                    yield block_name, block_data_str, warnings_list
+                    if not build_text:
+                        block_data_str = None
+                    elif stats is None:
+                        block_data_str = "".join(block_data)
+                    else:
+                        join_start = perf_counter()
+                        block_data_str = "".join(block_data)
+                        stats.join_time += perf_counter() - join_start
+                    yield block_name, block_data_str, warnings_list, block_start, block_end
                     warnings_list = []
-                else:
+                elif collect_warnings:
                     # Warn about potentially unclosed block
+                    assert block_name is not None
                     message = MetadataWarning(
                         line_no,
-                        (
-                            f"Potential unclosed block {block_name!r} detected. "
-                            "A '# ///' block is needed to indicate the end of the block."
-                        ),
+                        code=WarningCode.UNCLOSED_BLOCK,
+                        block_names=(block_name,),
                     )
                     warnings_list.append(message)
 
                 # Reset
                 in_block = False
-                block_name, block_data = None, []
+                block_name, block_data, partial_block_data = None, [], []
                 end_seen = False
 
         else:
@@ -178,108 +353,2363 @@ def iter_parse(
                             )
                         used_blocks.add(block_name)
                         in_block = True
+                        block_start = line_no
                     else:
-                        message = MetadataWarning(
-                            line_no,
-                            (
-                                f"{block_name!r} is not a valid block name. "
-                                "Block names must consist of alphanumeric characters and '-' only."
-                            ),
-                        )
-                        warnings_list.append(message)
+                        if collect_warnings:
+                            message = MetadataWarning(
+                                line_no,
+                                code=WarningCode.INVALID_BLOCK_NAME,
+                                block_names=(block_name,),
+                            )
+                            warnings_list.append(message)
                         # Not valid type, remove block name
                         block_name = None
 
+    if not final:
+        state.in_block = in_block
+        state.end_seen = end_seen
+        state.block_name = block_name
+        state.block_data = block_data
+        state.partial_block_data = partial_block_data
+        state.block_start = block_start
+        state.block_end = block_end
+        state.warnings_list = warnings_list
+        state.line_no = line_no
+        return
+
     if in_block:
         if end_seen:
-            block_data_str = "".join(block_data)
-            yield block_name, block_data_str, warnings_list
+            if not build_text:
+                block_data_str = None
+            elif stats is None:
+                block_data_str = "".join(block_data)
+            else:
+                join_start = perf_counter()
+                block_data_str = "".join(block_data)
+                stats.join_time += perf_counter() - join_start
+            yield block_name, block_data_str, warnings_list, block_start, block_end
             warnings_list = []
 
-        else:
+        elif collect_warnings:
+            assert block_name is not None
             message = MetadataWarning(
                 line_no,
-                (
-                    f"Potential unclosed block {block_name!r} detected. "
-                    "A '# ///' block is needed to indicate the end of the block."
-                ),
+                code=WarningCode.UNCLOSED_BLOCK,
+                block_names=(block_name,),
             )
             warnings_list.append(message)
 
     if warnings_list:
-        yield None, None, warnings_list
+        yield None, None, warnings_list, 0, 0
+
+
+def iter_parse(
+    script_data: Iterable[str],
+    *,
+    start_line: int = 1,
+    collect_warnings: bool = True,
+    stats: ParseStats | None = None,
+) -> Iterator[tuple[str | None, str | None, list[MetadataWarning]]]:
+    """
+    Iterate over source and yield embedded metadata.
+
+    This function implements the actual parsing logic. If a user wishes
+    to implement early exit or raising warnings directly this can be used.
 
+    All parser state is local to each call, so any number of threads may
+    call this, or the parse functions built on it, at the same time.
 
-class ScriptMetadata(Prefab):
+    :param script_data: an iterable of source code: eg an open file
+    :param start_line: line number to start iterating from
+    :param collect_warnings: Set to False to skip creating warnings,
+                             duplicate blocks still raise ValueError
+    :param stats: ParseStats object to add counters and timings to
+    :yields: tuples of block_name, block_text, warnings
+             will yield a None block_name if there are unused warnings at EOF
     """
-    Embedded metadata extracted from a python source file
+    numbered_lines = enumerate(script_data, start=start_line)
+    if stats is None:
+        parsed = _iter_parse_numbered(numbered_lines, collect_warnings=collect_warnings)
+    else:
+        parsed = _iter_parse_stats(
+            numbered_lines,
+            stats,
+            count_size=True,
+            collect_warnings=collect_warnings,
+        )
 
-    :param blocks: Metadata dict extracted from python source
-                   Keys are block names and values the raw text of block data.
-    :param warnings: Possible errors found during parsing
+    try:
+        for block_name, block_text, warnings, _, _ in parsed:
+            yield block_name, block_text, warnings
+    finally:
+        parsed.close()
+
+
+class MetadataParser:
     """
-    blocks: dict[str, str | None]
-    warnings: list[MetadataWarning]
+    Push parser for source code that arrives in chunks
 
+    Chunks may be split at any point, including in the middle of a line
+    or of a multibyte character. Lines are split on '\\n' only.
 
-def parse_iterable(
-    iterable_data: Iterable[str],
+    feed and close return the blocks that were completed by the data given,
+    in the same form as iter_parse. All results are also gathered in the
+    'metadata' attribute.
+
+    A parser holds the state of one source and must not be fed from
+    several threads at once.
+
+    :param start_line: Line number of the first line of the source
+    :param encoding: Encoding used to decode chunks given as bytes
+    :param collect_warnings: Set to False to skip creating warnings,
+                             duplicate blocks still raise ValueError
+    """
+    def __init__(
+        self,
+        *,
+        start_line: int = 1,
+        encoding: str = "utf-8",
+        collect_warnings: bool = True,
+    ):
+        self.encoding = encoding
+        self.collect_warnings = collect_warnings
+
+        # noinspection PyArgumentList
+        self.metadata = ScriptMetadata({}, [])
+
+        self._state = _ParserState()
+        self._line_no = start_line - 1  # Number of the last complete line
+        self._closed = False
+
+        # Bytes are searched directly if the encoding allows it
+        # otherwise they are decoded incrementally and handled as str
+        self._bytes_mode: bool | None = None
+        self._decoder: codecs.IncrementalDecoder | None = None
+        self._str_buffer: list[str] = []
+        self._bytes_buffer = bytearray()
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}("
+            f"encoding={self.encoding!r}, collect_warnings={self.collect_warnings!r})"
+        )
+
+    def _parse(
+        self,
+        data: str | bytes | bytearray,
+        final: bool,
+    ) -> list[tuple[str | None, str | None, list[MetadataWarning]]]:
+        if isinstance(data, str):
+            lines = _iter_candidate_lines(
+                data,
+                start_line=self._line_no + 1,
+                in_run=self._state.in_block,
+            )
+        else:
+            lines = _iter_candidate_lines_bytes(
+                data,
+                encoding=self.encoding,
+                start_line=self._line_no + 1,
+                in_run=self._state.in_block,
+            )
+
+        results = []
+        for block_name, block_text, warnings, _, _ in _iter_parse_numbered(
+            lines,
+            collect_warnings=self.collect_warnings,
+            state=self._state,
+            final=final,
+        ):
+            if block_name:
+                self.metadata.blocks[block_name] = block_text
+            self.metadata.warnings.extend(warnings)
+            results.append((block_name, block_text, warnings))
+
+        return results
+
+    def feed(
+        self,
+        chunk: str | bytes,
+    ) -> list[tuple[str | None, str | None, list[MetadataWarning]]]:
+        """
+        Parse the next chunk of source code
+
+        :param chunk: the next part of the source as str or bytes
+        :return: list of block_name, block_text, warnings tuples
+                 for blocks that ended in this chunk
+        """
+        if self._closed:
+            raise ValueError("Can not feed data to a closed parser.")
+
+        if self._bytes_mode is None:
+            is_bytes = not isinstance(chunk, str)
+            self._bytes_mode = (
+                is_bytes and codecs.lookup(self.encoding).name in _BYTES_SAFE_ENCODINGS
+            )
+            if is_bytes and not self._bytes_mode:
+                self._decoder = codecs.getincrementaldecoder(self.encoding)()
+
+        if self._decoder is not None:
+            if isinstance(chunk, str):
+                raise TypeError("Can not mix str and bytes chunks.")
+            chunk = self._decoder.decode(chunk)
+
+        if self._bytes_mode:
+            if isinstance(chunk, str):
+                raise TypeError("Can not mix str and bytes chunks.")
+
+            end = chunk.rfind(b"\n")
+            if end == -1:
+                self._bytes_buffer += chunk
+                return []
+
+            buffer = self._bytes_buffer
+            buffer += chunk[:end + 1]
+            results = self._parse(buffer, final=False)
+            self._line_no += buffer.count(b"\n")
+
+            # Reuse the buffer for the partial line
+            del buffer[:]
+            buffer += chunk[end + 1:]
+
+        else:
+            if not isinstance(chunk, str):
+                raise TypeError("Can not mix str and bytes chunks.")
+
+            end = chunk.rfind("\n")
+            if end == -1:
+                if chunk:
+                    self._str_buffer.append(chunk)
+                return []
+
+            self._str_buffer.append(chunk[:end + 1])
+            data = "".join(self._str_buffer)
+            results = self._parse(data, final=False)
+            self._line_no += data.count("\n")
+
+            self._str_buffer.clear()
+            if end + 1 < len(chunk):
+                self._str_buffer.append(chunk[end + 1:])
+
+        return results
+
+    def close(self) -> list[tuple[str | None, str | None, list[MetadataWarning]]]:
+        """
+        Parse any remaining partial line and finish parsing
+
+        :return: list of block_name, block_text, warnings tuples
+                 for blocks that ended at the end of the source
+        """
+        if self._closed:
+            raise ValueError("Parser is already closed.")
+        self._closed = True
+
+        if self._decoder is not None:
+            self._str_buffer.append(self._decoder.decode(b"", final=True))
+
+        if self._bytes_mode:
+            data: str | bytearray = self._bytes_buffer
+        else:
+            data = "".join(self._str_buffer)
+
+        return self._parse(data, final=True)
+
+
+async def aiter_parse(
+    script_data: AsyncIterable[str | bytes],
     *,
     start_line: int = 1,
-) -> ScriptMetadata:
+    encoding: str = "utf-8",
+    collect_warnings: bool = True,
+) -> AsyncIterator[tuple[str | None, str | None, list[MetadataWarning]]]:
     """
-    Given an iterable of strings (lines of code), parse the object for inline metadata
-    blocks.
+    Iterate over an async source of lines and yield embedded metadata.
 
-    :param iterable_data: Iterable of lines of code
-    :param start_line: Line number where file parsing starts - used for warnings
-    :return: Embedded metadata object with blocks and warnings
+    This is the async version of iter_parse, for use with sources such as
+    asyncio.StreamReader. Blocks are yielded as soon as they end.
+
+    :param script_data: an async iterable of lines of source code, as str or bytes
+    :param start_line: line number to start iterating from
+    :param encoding: encoding used to decode lines given as bytes
+    :param collect_warnings: Set to False to skip creating warnings,
+                             duplicate blocks still raise ValueError
+    :yields: tuples of block_name, block_text, warnings
+             will yield a None block_name if there are unused warnings at EOF
     """
+    state = _ParserState()
+    line_no = start_line - 1
 
-    blocks: dict[str, str | None] = {}
-    warnings: list[MetadataWarning] = []
+    async for line in script_data:
+        line_no += 1
 
-    for block_name, block_text, warning_list in iter_parse(
-        iterable_data, start_line=start_line
+        # Outside of a block only opening lines can change the state
+        if isinstance(line, str):
+            if not state.in_block and not line.startswith("# /// "):
+                continue
+        else:
+            if not state.in_block and not line.startswith(b"# /// "):
+                continue
+            line = line.decode(encoding)
+
+        for block_name, block_text, warnings, _, _ in _iter_parse_numbered(
+            ((line_no, line),),
+            collect_warnings=collect_warnings,
+            state=state,
+            final=False,
+        ):
+            yield block_name, block_text, warnings
+
+    for block_name, block_text, warnings, _, _ in _iter_parse_numbered(
+        (),
+        collect_warnings=collect_warnings,
+        state=state,
     ):
-        if block_name:
-            blocks[block_name] = block_text
+        yield block_name, block_text, warnings
 
-        warnings.extend(warning_list)
 
-    # noinspection PyArgumentList
-    return ScriptMetadata(blocks, warnings)
+# Encodings where '#', '/', ' ' and newlines are single bytes that can not
+# appear inside of a multibyte character, so the raw bytes can be searched.
+# Names are as given by codecs.lookup(encoding).name
+_BYTES_SAFE_ENCODINGS = frozenset({
+    "utf-8", "ascii",
+    # Single byte encodings
+    "iso8859-1", "iso8859-2", "iso8859-5", "iso8859-7", "iso8859-9", "iso8859-15",
+    "cp1250", "cp1251", "cp1252", "cp1253", "cp1254", "cp1255", "cp1256", "cp1257",
+    "cp437", "cp850", "cp866", "koi8-r", "koi8-u", "mac-roman",
+    # Multibyte encodings where these bytes are never used as trail bytes
+    "shift_jis", "cp932", "euc_jp", "gb2312", "gbk", "gb18030", "big5", "cp949", "euc_kr",
+})
 
 
-def parse_source(
-    script_text: str,
+def _iter_candidate_lines(
+    data: str,
     *,
     start_line: int = 1,
-) -> ScriptMetadata:
+    offsets: dict[int, int] | None = None,
+    in_run: bool = False,
+    start_pos: int = 0,
+) -> Iterator[tuple[int, str]]:
     """
-    Parse a source code string for inline metadata blocks
+    Yield only the lines of a string that can affect the parser.
 
-    :param script_text: Source of python script as string
-    :param start_line: Line number where file parsing starts - used for warnings
-    :return: Embedded metadata object with blocks and warnings
+    The string is searched for '# /// ' opening lines, from each of these
+    the following run of comment lines and the first non-comment line are
+    yielded. Everything else is skipped without being split into lines.
+
+    Lines are split on '\\n' only.
+
+    :param data: str to scan
+    :param start_line: line number of the first line in the string
+    :param offsets: if given, the offset of each yielded line is stored here
+                    keyed by line number
+    :param in_run: treat the start of the string as the start of a run of
+                   lines to yield, for a block left open by an earlier string
+    :param start_pos: offset of the start of the first line
+    :yields: tuples of line number, line
     """
-    data = io.StringIO(script_text)
-    return parse_iterable(data, start_line=start_line)
+    data_len = len(data)
 
+    # Number of the line that starts at position 'counted'
+    line_no = start_line
+    counted = start_pos
 
-def parse_file(
-    file_path: str | bytes | os.PathLike,
+    if (in_run and data_len > start_pos) or data.startswith("# /// ", start_pos):
+        candidate = start_pos
+    else:
+        candidate = data.find("\n# /// ", start_pos)
+        if candidate != -1:
+            candidate += 1
+
+    while candidate != -1:
+        line_no += data.count("\n", counted, candidate)
+        pos = candidate
+
+        # Yield the run of comment lines and the line that ends it
+        while True:
+            if offsets is not None:
+                offsets[line_no] = pos
+
+            end = data.find("\n", pos)
+            if end == -1:
+                yield line_no, data[pos:]
+                return
+
+            line = data[pos:end + 1]
+            yield line_no, line
+
+            line_no += 1
+            pos = counted = end + 1
+
+            if not line.startswith("#"):
+                break
+
+            if pos == data_len:
+                return
+
+        # Search from the newline that ended the last line
+        candidate = data.find("\n# /// ", pos - 1)
+        if candidate != -1:
+            candidate += 1
+
+
+def _iter_candidate_lines_bytes(
+    data: bytes | bytearray | mmap.mmap,
     *,
-    encoding: str = "utf-8",
-) -> ScriptMetadata:
+    encoding: str,
+    start_line: int = 1,
+    offsets: dict[int, int] | None = None,
+    in_run: bool = False,
+    start_pos: int = 0,
+    universal_newlines: bool = False,
+) -> Iterator[tuple[int, str]]:
     """
-    Parse a python source file for inline metadata blocks
+    Yield only the lines of a bytes buffer that can affect the parser.
 
-    :param file_path: Path to the python source
-    :param encoding: Text encoding of the file
-    :return: Embedded metadata object with blocks and warnings
+    This works as _iter_candidate_lines, searching the raw bytes and only
+    decoding the lines that are yielded. The encoding must be one of
+    _BYTES_SAFE_ENCODINGS.
+
+    Lines are split on '\\n' only unless universal_newlines is set.
+    With universal_newlines the data before each yielded line is checked
+    for carriage returns as it is searched, from the first one found the
+    rest of the buffer is decoded in chunks and searched as text with the
+    line endings translated as in text mode. Data after the last line
+    needed is never checked.
+
+    :param data: bytes, bytearray or memory mapped file to scan
+    :param encoding: encoding used to decode the yielded lines
+    :param start_line: line number of the first line in the buffer
+    :param offsets: if given, the offset of each yielded line is stored here
+                    keyed by line number
+    :param in_run: treat the start of the buffer as the start of a run of
+                   lines to yield, for a block left open by an earlier buffer
+    :param start_pos: offset of the start of the first line, eg: after a BOM
+    :param universal_newlines: Translate '\\r\\n' and '\\r' line endings,
+                               offsets are not stored after a carriage return
+    :yields: tuples of line number, line
+    """
+    data_len = len(data)
+
+    # Number of the line that starts at position 'counted'
+    line_no = start_line
+    counted = start_pos
+
+    if (in_run and data_len > start_pos) or data[start_pos:start_pos + 6] == b"# /// ":
+        candidate = start_pos
+    else:
+        candidate = data.find(b"\n# /// ", start_pos)
+        if candidate != -1:
+            candidate += 1
+
+    while candidate != -1:
+        if universal_newlines and data.find(b"\r", counted, candidate) != -1:
+            yield from _iter_translated_lines(
+                data, encoding=encoding, start_line=line_no, start_pos=counted
+            )
+            return
+
+        if isinstance(data, (bytes, bytearray)):
+            line_no += data.count(b"\n", counted, candidate)
+        else:
+            # mmap has no 'count' method, so count over a slice
+            line_no += data[counted:candidate].count(b"\n")
+        pos = candidate
+
+        # Yield the run of comment lines and the line that ends it
+        while True:
+            if offsets is not None:
+                offsets[line_no] = pos
+
+            end = data.find(b"\n", pos)
+            line = data[pos:] if end == -1 else data[pos:end + 1]
+
+            if universal_newlines and b"\r" in line:
+                # This line is always yielded, so continue the run as text
+                yield from _iter_translated_lines(
+                    data,
+                    encoding=encoding,
+                    start_line=line_no,
+                    start_pos=pos,
+                    in_run=True,
+                )
+                return
+
+            yield line_no, line.decode(encoding)
+            if end == -1:
+                return
+
+            line_no += 1
+            pos = counted = end + 1
+
+            if not line.startswith(b"#"):
+                break
+
+            if pos == data_len:
+                return
+
+        # Search from the newline that ended the last line
+        candidate = data.find(b"\n# /// ", pos - 1)
+        if candidate != -1:
+            candidate += 1
+
+    # A lone carriage return can end a line before an opening line
+    if universal_newlines and data.find(b"\r", counted) != -1:
+        yield from _iter_translated_lines(
+            data, encoding=encoding, start_line=line_no, start_pos=counted
+        )
+
+
+# Size of the chunks of bytes decoded at a time once a carriage return is found
+_TRANSLATE_CHUNK_SIZE = 64 * 1024
+
+
+def _iter_translated_lines(
+    data: bytes | bytearray | mmap.mmap,
+    *,
+    encoding: str,
+    start_line: int,
+    start_pos: int,
+    in_run: bool = False,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield the lines of a bytes buffer that can affect the parser,
+    translating '\\r\\n' and '\\r' line endings as text mode does.
+
+    The buffer is decoded in chunks from start_pos, only as far as
+    the lines that are used.
+
+    :param data: bytes, bytearray or memory mapped file to scan
+    :param encoding: encoding of the data
+    :param start_line: line number of the line starting at start_pos
+    :param start_pos: offset of the start of a line to start from
+    :param in_run: the line at start_pos is part of a run of lines to yield
+    :yields: tuples of line number, line
+    """
+    chunks = (
+        data[chunk_start:chunk_start + _TRANSLATE_CHUNK_SIZE]
+        for chunk_start in range(start_pos, len(data), _TRANSLATE_CHUNK_SIZE)
+    )
+    yield from _iter_chunk_lines(
+        chunks, encoding=encoding, start_line=start_line, in_run=in_run
+    )
+
+
+def _iter_chunk_lines(
+    chunks: Iterable[bytes | bytearray],
+    *,
+    encoding: str,
+    start_line: int = 1,
+    in_run: bool = False,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield the lines of a stream of bytes that can affect the parser,
+    translating '\\r\\n' and '\\r' line endings as text mode does.
+
+    Each chunk is decoded as it is needed, so chunks after the last
+    line that is used are never requested.
+
+    :param chunks: iterable of bytes, starting at the start of a line
+    :param encoding: encoding of the data
+    :param start_line: line number of the first line
+    :param in_run: the first line is part of a run of lines to yield
+    :yields: tuples of line number, line
+    """
+    decoder = IncrementalNewlineDecoder(
+        codecs.getincrementaldecoder(encoding)(), translate=True
+    )
+    chunk_iter = iter(chunks)
+    line_no = start_line
+    partial = ""
+
+    final = False
+    while not final:
+        chunk = next(chunk_iter, None)
+        final = chunk is None
+        text = partial + decoder.decode(b"" if chunk is None else chunk, final=final)
+
+        # Only search complete lines, the rest is kept for the next chunk
+        end = len(text) if final else text.rfind("\n") + 1
+        partial = text[end:]
+        if end == 0:
+            continue
+
+        last_line = None
+        for last_line in _iter_candidate_lines(
+            text[:end], start_line=line_no, in_run=in_run
+        ):
+            yield last_line
+        line_no += text.count("\n", 0, end)
+
+        # A run continues into the next chunk if it reached the last line
+        in_run = (
+            last_line is not None
+            and last_line[0] == line_no - 1
+            and last_line[1].startswith("#")
+        )
+
+
+def _iter_split_lines(
+    data: str,
+    *,
+    start_line: int = 1,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield every line of a string, split on '\\n' only.
+
+    :param data: str to split
+    :param start_line: line number of the first line
+    :yields: tuples of line number, line
+    """
+    lines = data.split("\n")
+    last_line = lines.pop()
+    for line_no, line in enumerate(lines, start=start_line):
+        yield line_no, line + "\n"
+    if last_line:
+        yield start_line + len(lines), last_line
+
+
+# A '# /// ' opening line, the following comment lines and the line that ends them
+_REGEX_RUN = r"# /// [^\n]*(?:\n|\Z)(?:#[^\n]*(?:\n|\Z))*[^\n]*\n?"
+
+
+def _iter_regex_lines(
+    data: str,
+    *,
+    start_line: int = 1,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield the same lines as _iter_candidate_lines, using a regex to find them.
+
+    :param data: str to scan
+    :param start_line: line number of the first line
+    :yields: tuples of line number, line
+    """
+    # 're' is slow to import, only import it if this engine is used
+    import re
+
+    # Starting the pattern with a literal newline lets 're' search for the
+    # prefix quickly, a multiline '^' would test the pattern at every position
+    first_run = re.compile(_REGEX_RUN)
+    next_run = re.compile("\n" + _REGEX_RUN)
+
+    line_no = start_line
+    counted = 0
+
+    match = first_run.match(data)
+    if match is None:
+        match = next_run.search(data)
+
+    while match is not None:
+        run_start, run_end = match.span()
+        if data[run_start] == "\n":
+            run_start += 1
+
+        line_no += data.count("\n", counted, run_start)
+
+        lines = data[run_start:run_end].split("\n")
+        last_line = lines.pop()
+        for offset, line in enumerate(lines):
+            yield line_no + offset, line + "\n"
+        line_no += len(lines)
+
+        if last_line:
+            yield line_no, last_line
+            return
+
+        # Search from the newline that ended the last line
+        counted = run_end
+        match = next_run.search(data, run_end - 1)
+
+
+# Functions yielding the lines of a source string for the parser
+_SOURCE_ENGINES = {
+    "statemachine": _iter_split_lines,
+    "regex": _iter_regex_lines,
+    "bytes": _iter_candidate_lines,
+}
+
+_ENGINE_NAMES = ("auto", *_SOURCE_ENGINES)
+
+# Sources shorter than this are faster to split into lines than to search
+_AUTO_SPLIT_SIZE = 256
+
+# Files larger than this are memory mapped instead of read
+_AUTO_MMAP_SIZE = 64 * 1024
+
+
+def _check_engine(engine: str) -> None:
+    if engine not in _ENGINE_NAMES:
+        raise ValueError(
+            f"Unknown engine {engine!r}, expected one of {', '.join(map(repr, _ENGINE_NAMES))}."
+        )
+
+
+class BlockSpan:
+    """
+    Location of a metadata block in the source
+
+    Offsets are indexes into the str or bytes the block was found in.
+
+    :param name: Name/TYPE of the block
+    :param start: Offset of the start of the opening '# /// TYPE' line
+    :param end: Offset of the end of the closing '# ///' line
+    :param start_line: Line number of the opening line
+    :param end_line: Line number of the closing line
+    :param body_start: Offset of the start of the first line of block data
+    :param body_end: Offset of the start of the closing line
     """
-    with open(file_path, mode="r", encoding=encoding) as f:
-        metadata = parse_iterable(f)
+    __slots__ = (
+        "name", "start", "end", "start_line", "end_line", "body_start", "body_end"
+    )
+    __match_args__ = __slots__
+
+    name: str
+    start: int
+    end: int
+    start_line: int
+    end_line: int
+    body_start: int
+    body_end: int
+
+    def __init__(
+        self,
+        name: str,
+        start: int,
+        end: int,
+        start_line: int,
+        end_line: int,
+        body_start: int,
+        body_end: int,
+    ):
+        self.name = name
+        self.start = start
+        self.end = end
+        self.start_line = start_line
+        self.end_line = end_line
+        self.body_start = body_start
+        self.body_end = body_end
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}("
+            f"name={self.name!r}, start={self.start!r}, end={self.end!r}, "
+            f"start_line={self.start_line!r}, end_line={self.end_line!r}, "
+            f"body_start={self.body_start!r}, body_end={self.body_end!r})"
+        )
+
+    def __eq__(self, other):
+        if self.__class__ is other.__class__:
+            return all(
+                getattr(self, name) == getattr(other, name) for name in self.__slots__
+            )
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def raw(self, source: str | bytes) -> str | memoryview:
+        """
+        Get the source of the whole block including the opening and closing lines
+
+        For bytes sources this is a memoryview so no data is copied.
+
+        :param source: the str or bytes the block was found in
+        :return: slice of source or memoryview over source
+        """
+        if isinstance(source, str):
+            return source[self.start:self.end]
+        return memoryview(source)[self.start:self.end]
 
-    return metadata
+    def text(self, source: str | bytes, *, encoding: str = "utf-8") -> str:
+        """
+        Get the text of the block with the comment prefixes removed
+
+        This is the same text that is given in ScriptMetadata.blocks
+
+        :param source: the str or bytes the block was found in
+        :param encoding: encoding used to decode bytes sources
+        :return: block text
+        """
+        body = source[self.body_start:self.body_end]
+        if not isinstance(body, str):
+            body = body.decode(encoding)
+
+        # The body always ends with a newline as the closing line follows
+        return "".join(
+            (line[2:] if line.startswith("# ") else line[1:]) + "\n"
+            for line in body.split("\n")[:-1]
+        )
+
+
+# Header of ScriptMetadata.to_bytes data, the last byte is the format version
+_BINARY_MAGIC = b"SMD"
+_BINARY_VERSION = 1
+
+
+def _write_varint(buffer: bytearray, value: int) -> None:
+    """
+    Append a non-negative integer as a LEB128 variable length integer
+
+    :param buffer: buffer to append to
+    :param value: integer to write
+    """
+    while value > 0x7F:
+        buffer.append((value & 0x7F) | 0x80)
+        value >>= 7
+    buffer.append(value)
+
+
+def _read_varint(data: bytes, pos: int) -> tuple[int, int]:
+    """
+    Read a LEB128 variable length integer
+
+    :param data: buffer to read from
+    :param pos: position of the first byte
+    :return: the integer and the position after it
+    """
+    byte = data[pos]
+    pos += 1
+    if byte < 0x80:
+        return byte, pos
+
+    value = byte & 0x7F
+    shift = 7
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+
+
+def _write_optional_str(buffer: bytearray, text: str | None) -> None:
+    """
+    Append a string as its length plus one and UTF-8 data, 0 for None
+
+    :param buffer: buffer to append to
+    :param text: string to write or None
+    """
+    if text is None:
+        buffer.append(0)
+    else:
+        encoded = text.encode("utf-8", "surrogatepass")
+        _write_varint(buffer, len(encoded) + 1)
+        buffer += encoded
+
+
+def _read_optional_str(data: bytes, pos: int) -> tuple[str | None, int]:
+    """
+    Read a string written by _write_optional_str
+
+    :param data: buffer to read from
+    :param pos: position of the length
+    :return: the string or None and the position after it
+    """
+    size, pos = _read_varint(data, pos)
+    if size == 0:
+        return None, pos
+    end = pos + size - 1
+    if end > len(data):
+        raise IndexError("string extends past the end of the data")
+    return data[pos:end].decode("utf-8", "surrogatepass"), end
+
+
+class ScriptMetadata:
+    """
+    Embedded metadata extracted from a python source file
+
+    :param blocks: Metadata dict extracted from python source
+                   Keys are block names and values the raw text of block data.
+    :param warnings: Possible errors found during parsing
+    """
+    __slots__ = ("blocks", "warnings")
+    __match_args__ = ("blocks", "warnings")
+
+    blocks: dict[str, str | None]
+    warnings: list[MetadataWarning]
+
+    def __init__(
+        self,
+        blocks: dict[str, str | None],
+        warnings: list[MetadataWarning],
+    ):
+        self.blocks = blocks
+        self.warnings = warnings
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}("
+            f"blocks={self.blocks!r}, warnings={self.warnings!r})"
+        )
+
+    def __eq__(self, other):
+        if self.__class__ is other.__class__:
+            return self.blocks == other.blocks and self.warnings == other.warnings
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __reduce__(self):
+        return type(self).from_bytes, (self.to_bytes(),)
+
+    def to_bytes(self) -> bytes:
+        """
+        Serialize the metadata to a compact versioned binary format
+
+        Block names are stored once and referred to by index. Warnings created
+        by the parser are stored as their code and block names, the message
+        is only stored if it can't be formatted from these.
+
+        :return: data for ScriptMetadata.from_bytes
+        """
+        names: dict[str, int] = {}
+        body = bytearray()
+
+        _write_varint(body, len(self.blocks))
+        for block_name, block_text in self.blocks.items():
+            _write_varint(body, names.setdefault(block_name, len(names)))
+            _write_optional_str(body, block_text)
+
+        _write_varint(body, len(self.warnings))
+        for warning in self.warnings:
+            # Zigzag encode line numbers as start_line can be below 1
+            line_number = warning.line_number
+            _write_varint(
+                body, line_number * 2 if line_number >= 0 else -line_number * 2 - 1
+            )
+            _write_varint(body, warning.code)
+            _write_varint(body, len(warning.block_names))
+            for block_name in warning.block_names:
+                _write_varint(body, names.setdefault(block_name, len(names)))
+
+            message = warning._message
+            template = _WARNING_TEMPLATES.get(warning.code)
+            if (
+                message is not None
+                and template is not None
+                and message == template.format(*warning.block_names)
+            ):
+                message = None
+            _write_optional_str(body, message)
+
+        data = bytearray(_BINARY_MAGIC)
+        data.append(_BINARY_VERSION)
+        _write_varint(data, len(names))
+        for block_name in names:
+            _write_optional_str(data, block_name)
+        data += body
+        return bytes(data)
+
+    @classmethod
+    def from_bytes(cls, data: bytes | bytearray | memoryview) -> ScriptMetadata:
+        """
+        Create metadata from the data given by ScriptMetadata.to_bytes
+
+        :param data: serialized metadata
+        :return: Embedded metadata object with blocks and warnings
+        :raises ValueError: if the data is invalid or from an unknown version
+        """
+        data = bytes(data)
+        magic_len = len(_BINARY_MAGIC)
+        if data[:magic_len] != _BINARY_MAGIC or len(data) == magic_len:
+            raise ValueError("Data is not serialized ScriptMetadata.")
+        version = data[magic_len]
+        if version != _BINARY_VERSION:
+            raise ValueError(f"Unsupported ScriptMetadata data version {version}.")
+
+        try:
+            pos = magic_len + 1
+            name_count, pos = _read_varint(data, pos)
+            names: list[str] = []
+            for _ in range(name_count):
+                block_name, pos = _read_optional_str(data, pos)
+                if block_name is None:
+                    raise TypeError("block names can not be None")
+                names.append(block_name)
+
+            blocks: dict[str, str | None] = {}
+            block_count, pos = _read_varint(data, pos)
+            for _ in range(block_count):
+                index, pos = _read_varint(data, pos)
+                block_text, pos = _read_optional_str(data, pos)
+                blocks[names[index]] = block_text
+
+            warnings: list[MetadataWarning] = []
+            warning_count, pos = _read_varint(data, pos)
+            for _ in range(warning_count):
+                zigzag, pos = _read_varint(data, pos)
+                code, pos = _read_varint(data, pos)
+                name_count, pos = _read_varint(data, pos)
+                indices = []
+                for _ in range(name_count):
+                    index, pos = _read_varint(data, pos)
+                    indices.append(index)
+                message, pos = _read_optional_str(data, pos)
+                line_number = zigzag >> 1 if not zigzag & 1 else -(zigzag >> 1) - 1
+                warnings.append(
+                    MetadataWarning(
+                        line_number,
+                        message,
+                        code=code,
+                        block_names=tuple(names[i] for i in indices),
+                    )
+                )
+        except (IndexError, UnicodeDecodeError, TypeError) as e:
+            raise ValueError(f"Invalid ScriptMetadata data: {e}") from None
+
+        if pos != len(data):
+            raise ValueError("Invalid ScriptMetadata data: unexpected trailing bytes")
+
+        # noinspection PyArgumentList
+        return cls(blocks, warnings)
+
+
+class ParseStats:
+    """
+    Counters and timings gathered while parsing
+
+    Pass an instance as 'stats' to a parse function to have it filled in.
+    Counts and times are added to any existing values so one instance can
+    be used for several parses, instances can also be added together.
+
+    Timings are in seconds. Memory mapped files are read as they are
+    scanned, so for these read_time only covers mapping the file.
+
+    Updates are not atomic, give each thread its own instance and add them
+    together afterwards. parse_files already does this for its workers.
+
+    :param lines_scanned: Lines given to the parser, lines skipped by
+                          the search for opening lines are not counted
+    :param bytes_read: Size of the input, in bytes for files and
+                       characters for str sources
+    :param candidate_lines: Comment lines given to the parser
+    :param blocks: Metadata blocks found
+    :param warnings: Warnings created
+    :param open_time: Time spent opening files
+    :param read_time: Time spent reading or mapping files
+    :param scan_time: Time spent searching for and parsing lines
+    :param join_time: Time spent joining the text of blocks
+    """
+    __slots__ = (
+        "lines_scanned",
+        "bytes_read",
+        "candidate_lines",
+        "blocks",
+        "warnings",
+        "open_time",
+        "read_time",
+        "scan_time",
+        "join_time",
+    )
+
+    lines_scanned: int
+    bytes_read: int
+    candidate_lines: int
+    blocks: int
+    warnings: int
+    open_time: float
+    read_time: float
+    scan_time: float
+    join_time: float
+
+    def __init__(
+        self,
+        lines_scanned: int = 0,
+        bytes_read: int = 0,
+        candidate_lines: int = 0,
+        blocks: int = 0,
+        warnings: int = 0,
+        open_time: float = 0.0,
+        read_time: float = 0.0,
+        scan_time: float = 0.0,
+        join_time: float = 0.0,
+    ):
+        self.lines_scanned = lines_scanned
+        self.bytes_read = bytes_read
+        self.candidate_lines = candidate_lines
+        self.blocks = blocks
+        self.warnings = warnings
+        self.open_time = open_time
+        self.read_time = read_time
+        self.scan_time = scan_time
+        self.join_time = join_time
+
+    @property
+    def total_time(self) -> float:
+        return self.open_time + self.read_time + self.scan_time + self.join_time
+
+    def as_dict(self) -> dict[str, int | float]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        args = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{type(self).__name__}({args})"
+
+    def __eq__(self, other):
+        if self.__class__ is other.__class__:
+            return self.as_dict() == other.as_dict()
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __add__(self, other):
+        if self.__class__ is other.__class__:
+            return type(self)(
+                *(getattr(self, name) + getattr(other, name) for name in self.__slots__)
+            )
+        return NotImplemented
+
+    def __iadd__(self, other):
+        if self.__class__ is other.__class__:
+            for name in self.__slots__:
+                setattr(self, name, getattr(self, name) + getattr(other, name))
+            return self
+        return NotImplemented
+
+
+def _iter_counted_lines(
+    numbered_lines: Iterable[tuple[int, str]],
+    stats: ParseStats,
+    count_size: bool,
+) -> Iterator[tuple[int, str]]:
+    """
+    Count the lines given to the parser
+
+    :param numbered_lines: iterable of line numbers and lines of source code
+    :param stats: ParseStats to add the counts to
+    :param count_size: Add the length of each line to bytes_read
+    :yields: the numbered lines unchanged
+    """
+    for numbered_line in numbered_lines:
+        line = numbered_line[1]
+        stats.lines_scanned += 1
+        if line.startswith("#"):
+            stats.candidate_lines += 1
+        if count_size:
+            stats.bytes_read += len(line)
+        yield numbered_line
+
+
+def _iter_parse_stats(
+    numbered_lines: Iterable[tuple[int, str]],
+    stats: ParseStats,
+    *,
+    count_size: bool = False,
+    collect_warnings: bool = True,
+) -> Generator[tuple[str | None, str | None, list[MetadataWarning], int, int], None, None]:
+    """
+    Run _iter_parse_numbered, filling in stats
+
+    Time spent producing lines is counted as scan_time, other than any
+    open_time and read_time added to stats while doing so.
+
+    :param numbered_lines: iterable of line numbers and lines of source code
+    :param stats: ParseStats to fill in
+    :param count_size: Add the length of each line to bytes_read
+    :param collect_warnings: Create warnings, if False the warning lists are empty
+    :yields: the results of _iter_parse_numbered
+    """
+    parsed = _iter_parse_numbered(
+        _iter_counted_lines(numbered_lines, stats, count_size),
+        collect_warnings=collect_warnings,
+        stats=stats,
+    )
+
+    other_time = stats.open_time + stats.read_time + stats.join_time
+    elapsed = 0.0
+    try:
+        while True:
+            start = perf_counter()
+            try:
+                result = next(parsed)
+            except StopIteration:
+                break
+            finally:
+                elapsed += perf_counter() - start
+
+            if result[0] is not None:
+                stats.blocks += 1
+            stats.warnings += len(result[2])
+            yield result
+    finally:
+        parsed.close()
+        other_time = stats.open_time + stats.read_time + stats.join_time - other_time
+        stats.scan_time += elapsed - other_time
+
+
+def _collect_metadata(
+    parsed: Iterable[tuple[str | None, str | None, list[MetadataWarning], int, int]],
+    block_names: Iterable[str] | None = None,
+    stop_early: bool = False,
+) -> ScriptMetadata:
+    """
+    Gather the output of the parser into a ScriptMetadata object
+
+    :param parsed: tuples as yielded by _iter_parse_numbered
+    :param block_names: Names of the blocks to keep, None keeps all blocks
+    :param stop_early: Stop parsing once all blocks in block_names are found
+    :return: Embedded metadata object with blocks and warnings
+    """
+    blocks: dict[str, str | None] = {}
+    warnings: list[MetadataWarning] = []
+
+    # Number of blocks after which to stop, -1 to never stop
+    stop_count = -1
+
+    if block_names is None:
+        if stop_early:
+            raise ValueError("'stop_early' requires the 'blocks' to find to be given.")
+        wanted = None
+    else:
+        wanted = frozenset(block_names)
+        if stop_early:
+            stop_count = len(wanted)
+            if stop_count == 0:
+                # noinspection PyArgumentList
+                return ScriptMetadata(blocks, warnings)
+
+    for block_name, block_text, warning_list, _, _ in parsed:
+        warnings.extend(warning_list)
+
+        if block_name and (wanted is None or block_name in wanted):
+            blocks[block_name] = block_text
+
+            if len(blocks) == stop_count:
+                break
+
+    # noinspection PyArgumentList
+    return ScriptMetadata(blocks, warnings)
+
+
+def parse_iterable(
+    iterable_data: Iterable[str],
+    *,
+    start_line: int = 1,
+    blocks: Iterable[str] | None = None,
+    stop_early: bool = False,
+    collect_warnings: bool = True,
+    stats: ParseStats | None = None,
+) -> ScriptMetadata:
+    """
+    Given an iterable of strings (lines of code), parse the object for inline metadata
+    blocks.
+
+    :param iterable_data: Iterable of lines of code
+    :param start_line: Line number where file parsing starts - used for warnings
+    :param blocks: Names of the blocks to return, None returns all blocks
+    :param stop_early: Stop reading once every block in 'blocks' has been found.
+                       Later lines are not checked so duplicate blocks and
+                       warnings after this point are not reported.
+    :param collect_warnings: Set to False to skip creating warnings,
+                             duplicate blocks still raise ValueError
+    :param stats: ParseStats object to add counters and timings to
+    :return: Embedded metadata object with blocks and warnings
+    """
+    numbered_lines = enumerate(iterable_data, start=start_line)
+    if stats is None:
+        parsed = _iter_parse_numbered(numbered_lines, collect_warnings=collect_warnings)
+    else:
+        parsed = _iter_parse_stats(
+            numbered_lines,
+            stats,
+            count_size=True,
+            collect_warnings=collect_warnings,
+        )
+
+    try:
+        return _collect_metadata(parsed, blocks, stop_early)
+    finally:
+        # Finish the stats if parsing stopped early
+        parsed.close()
+
+
+def parse_source(
+    script_text: str,
+    *,
+    start_line: int = 1,
+    blocks: Iterable[str] | None = None,
+    stop_early: bool = False,
+    collect_warnings: bool = True,
+    engine: str = "auto",
+    stats: ParseStats | None = None,
+) -> ScriptMetadata:
+    """
+    Parse a source code string for inline metadata blocks
+
+    With the "bytes" engine the string is searched for '# /// ' opening lines
+    and only the regions following these are split into lines.
+    "statemachine" splits every line and gives each to the parser.
+    "regex" finds the same regions as "bytes" with a regular expression.
+    "auto" uses "statemachine" for short sources and "bytes" otherwise.
+    Every engine gives the same result. Lines are split on '\\n' only.
+
+    :param script_text: Source of python script as string
+    :param start_line: Line number where file parsing starts - used for warnings
+    :param blocks: Names of the blocks to return, None returns all blocks
+    :param stop_early: Stop reading once every block in 'blocks' has been found.
+                       Later lines are not checked so duplicate blocks and
+                       warnings after this point are not reported.
+    :param collect_warnings: Set to False to skip creating warnings,
+                             duplicate blocks still raise ValueError
+    :param engine: "auto", "statemachine", "regex" or "bytes"
+    :param stats: ParseStats object to add counters and timings to
+    :return: Embedded metadata object with blocks and warnings
+    """
+    _check_engine(engine)
+    if engine == "auto":
+        engine = "statemachine" if len(script_text) < _AUTO_SPLIT_SIZE else "bytes"
+
+    numbered_lines = _SOURCE_ENGINES[engine](script_text, start_line=start_line)
+    if stats is None:
+        parsed = _iter_parse_numbered(numbered_lines, collect_warnings=collect_warnings)
+    else:
+        stats.bytes_read += len(script_text)
+        parsed = _iter_parse_stats(
+            numbered_lines,
+            stats,
+            collect_warnings=collect_warnings,
+        )
+
+    try:
+        return _collect_metadata(parsed, blocks, stop_early)
+    finally:
+        # Finish the stats if parsing stopped early
+        parsed.close()
+
+
+def iter_spans(
+    source: str | bytes,
+    *,
+    start_line: int = 1,
+    encoding: str = "utf-8",
+) -> Iterator[tuple[BlockSpan | None, list[MetadataWarning]]]:
+    """
+    Iterate over source and yield the locations of metadata blocks
+
+    The block text is not built, use BlockSpan.text to get the text of
+    a block or BlockSpan.raw to get a view of the original source.
+
+    Lines are split on '\\n' only. Bytes sources must use an encoding where
+    '#', ' ', '/' and '\\n' are single bytes such as UTF-8.
+
+    :param source: Source of python script as str or bytes
+    :param start_line: Line number where parsing starts - used for warnings
+    :param encoding: Encoding used to decode lines of bytes sources
+    :yields: tuples of span, warnings
+             will yield a None span if there are unused warnings at EOF
+    """
+    offsets: dict[int, int] = {}
+    if isinstance(source, str):
+        lines = _iter_candidate_lines(source, start_line=start_line, offsets=offsets)
+    else:
+        lines = _iter_candidate_lines_bytes(
+            source,
+            encoding=encoding,
+            start_line=start_line,
+            offsets=offsets,
+        )
+
+    for block_name, _, warnings, block_start, block_end in _iter_parse_numbered(
+        lines, build_text=False
+    ):
+        if block_name is None:
+            yield None, warnings
+        else:
+            # The line after the closing line is always yielded unless at EOF
+            end = offsets.get(block_end + 1, len(source))
+            span = BlockSpan(
+                name=block_name,
+                start=offsets[block_start],
+                end=end,
+                start_line=block_start,
+                end_line=block_end,
+                body_start=offsets[block_start + 1],
+                body_end=offsets[block_end],
+            )
+            yield span, warnings
+
+
+def _map_file(f) -> mmap.mmap | None:
+    """
+    Memory map an open binary file for reading
+
+    :param f: file opened in binary mode
+    :return: memory mapped file or None if the file can not be mapped
+    """
+    # mmap is only imported when a file is parsed
+    import mmap
+
+    try:
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        # Empty files and non-regular files can not be mapped
+        return None
+
+
+def _get_normal_name(orig_enc: str) -> str:
+    """
+    Normalise the name of a coding cookie encoding as tokenize does
+
+    :param orig_enc: encoding name from the cookie
+    :return: normalised encoding name
+    """
+    enc = orig_enc[:12].lower().replace("_", "-")
+    if enc == "utf-8" or enc.startswith("utf-8-"):
+        return "utf-8"
+    if enc in ("latin-1", "iso-8859-1", "iso-latin-1") or enc.startswith(
+        ("latin-1-", "iso-8859-1-", "iso-latin-1-")
+    ):
+        return "iso-8859-1"
+    return orig_enc
+
+
+# Characters allowed in a coding cookie encoding name, '[-\w.]' in ASCII
+_COOKIE_CHARACTERS = frozenset(
+    b"abcdefghijklmnopqrstuvwxyz"
+    b"ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+    b"0123456789"
+    b"-_."
+)
+
+
+def _find_cookie(line: bytes, bom_found: bool) -> str | None:
+    """
+    Find a PEP 263 coding cookie in a line as tokenize does
+
+    Matches the regular expression '^[ \\t\\f]*#.*?coding[:=][ \\t]*([-\\w.]+)'
+    without importing 're'.
+
+    :param line: a line of source as bytes
+    :param bom_found: True if the source started with a UTF-8 BOM
+    :return: name of the encoding or None if there is no cookie
+    """
+    try:
+        line.decode("utf-8")
+    except UnicodeDecodeError:
+        raise SyntaxError("invalid or missing encoding declaration") from None
+
+    comment = line.lstrip(b" \t\f")
+    if not comment.startswith(b"#"):
+        return None
+
+    # Search each 'coding' after the '#' for the first one followed by a name
+    pos = comment.find(b"coding", 1)
+    while pos != -1:
+        start = pos + 6
+        if comment[start:start + 1] in (b":", b"="):
+            start += 1
+            while comment[start:start + 1] in (b" ", b"\t"):
+                start += 1
+            end = start
+            while end < len(comment) and comment[end] in _COOKIE_CHARACTERS:
+                end += 1
+            if end > start:
+                break
+        pos = comment.find(b"coding", pos + 1)
+    else:
+        return None
+
+    encoding = _get_normal_name(comment[start:end].decode("ascii"))
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise SyntaxError(f"unknown encoding: {encoding}") from None
+
+    if bom_found:
+        if encoding != "utf-8":
+            raise SyntaxError("encoding problem: utf-8")
+        encoding += "-sig"
+    return encoding
+
+
+def _detect_encoding(data: bytes | mmap.mmap) -> tuple[str, int]:
+    """
+    Detect the encoding of python source from a BOM or PEP 263 coding cookie
+
+    This follows tokenize.detect_encoding, which is not used as 'tokenize'
+    imports 're'. Only the first two lines of data are examined.
+
+    :param data: source as bytes or a memory mapped file
+    :return: name of the encoding and the length of the BOM to skip
+    """
+    bom_len = 3 if data[:3] == codecs.BOM_UTF8 else 0
+    default = "utf-8-sig" if bom_len else "utf-8"
+
+    first_end = data.find(b"\n", bom_len) + 1 or len(data)
+    first = data[bom_len:first_end]
+    if not first:
+        return default, bom_len
+
+    encoding = _find_cookie(first, bool(bom_len))
+    if encoding:
+        return encoding, bom_len
+
+    # The cookie may only be on the second line if the first is blank or a comment
+    if first.lstrip(b" \t\f")[:1] not in (b"#", b"\r", b"\n", b""):
+        return default, bom_len
+
+    second_end = data.find(b"\n", first_end) + 1 or len(data)
+    second = data[first_end:second_end]
+    if not second:
+        return default, bom_len
+
+    encoding = _find_cookie(second, bool(bom_len))
+    if encoding:
+        return encoding, bom_len
+
+    return default, bom_len
+
+
+def _iter_file_lines(
+    file_path: str | bytes | os.PathLike,
+    encoding: str | None,
+    engine: str,
+    stats: ParseStats | None = None,
+) -> Generator[tuple[int, str], None, None]:
+    """
+    Open a file and yield the lines to give to the parser for an engine
+
+    :param file_path: Path to the python source
+    :param encoding: Text encoding of the file, None to detect it
+    :param engine: "auto", "statemachine", "regex" or "bytes"
+    :param stats: ParseStats to add the file size, open and read times to
+    :yields: tuples of line number, line
+    """
+    if encoding is None and engine in ("statemachine", "regex"):
+        # These engines read in text mode, only the first two lines are needed
+        start = perf_counter() if stats is not None else 0.0
+        with open(file_path, mode="rb") as buffer:
+            opened = perf_counter() if stats is not None else 0.0
+            head = buffer.readline()
+            head += buffer.readline()
+            if stats is not None:
+                stats.open_time += opened - start
+                stats.read_time += perf_counter() - opened
+        encoding, _ = _detect_encoding(head)
+
+    if engine == "statemachine":
+        start = perf_counter() if stats is not None else 0.0
+        # The binary file is kept to get the number of bytes read
+        with open(file_path, mode="rb") as buffer:
+            f = TextIOWrapper(buffer, encoding=encoding)
+            if stats is None:
+                yield from enumerate(f, start=1)
+                return
+
+            stats.open_time += perf_counter() - start
+            # Reading is part of scanning as the file is read line by line
+            try:
+                yield from enumerate(f, start=1)
+            finally:
+                stats.bytes_read += buffer.tell()
+        return
+
+    if engine != "regex" and (
+        encoding is None or codecs.lookup(encoding).name in _BYTES_SAFE_ENCODINGS
+    ):
+        start = perf_counter() if stats is not None else 0.0
+        with open(file_path, mode="rb") as buffer:
+            opened = perf_counter() if stats is not None else 0.0
+            data: bytes | mmap.mmap | None = None
+            if engine == "bytes" or os.fstat(buffer.fileno()).st_size > _AUTO_MMAP_SIZE:
+                data = _map_file(buffer)
+            if data is None:
+                # Small files are faster to read than to map
+                data = buffer.read()
+            if stats is not None:
+                stats.open_time += opened - start
+                stats.read_time += perf_counter() - opened
+                stats.bytes_read += len(data)
+
+        try:
+            if encoding is None:
+                encoding, start_pos = _detect_encoding(data)
+                # Search after the BOM, 'utf-8-sig' is not needed for the lines
+                line_encoding = "utf-8" if start_pos else encoding
+            else:
+                start_pos, line_encoding = 0, encoding
+
+            if codecs.lookup(line_encoding).name in _BYTES_SAFE_ENCODINGS:
+                # Line endings are only checked in the data that is searched
+                # so stopping early still avoids reading the rest of the file
+                yield from _iter_candidate_lines_bytes(
+                    data,
+                    encoding=line_encoding,
+                    start_pos=start_pos,
+                    universal_newlines=True,
+                )
+            else:
+                # The detected encoding can not be searched as bytes
+                yield from _iter_translated_lines(
+                    data, encoding=line_encoding, start_line=1, start_pos=start_pos
+                )
+        finally:
+            if not isinstance(data, bytes):
+                data.close()
+        return
+
+    start = perf_counter() if stats is not None else 0.0
+    with open(file_path, mode="rb") as buffer:
+        opened = perf_counter() if stats is not None else 0.0
+        f = TextIOWrapper(buffer, encoding=encoding)
+        text = f.read()
+        if stats is not None:
+            stats.open_time += opened - start
+            stats.read_time += perf_counter() - opened
+            stats.bytes_read += buffer.tell()
+
+    if engine == "regex":
+        yield from _iter_regex_lines(text)
+    else:
+        yield from _iter_candidate_lines(text)
+
+
+def parse_file(
+    file_path: str | bytes | os.PathLike,
+    *,
+    encoding: str | None = "utf-8",
+    blocks: Iterable[str] | None = None,
+    stop_early: bool = False,
+    collect_warnings: bool = True,
+    engine: str = "auto",
+    stats: ParseStats | None = None,
+) -> ScriptMetadata:
+    """
+    Parse a python source file for inline metadata blocks
+
+    With the "bytes" engine files in UTF-8 or another ASCII compatible encoding
+    that never uses the bytes of '#', '/', space or newlines within a character,
+    such as latin-1, cp1251 or shift_jis, are memory mapped and searched as
+    bytes, only the lines around potential metadata blocks are decoded.
+    As the rest of the file is never decoded, invalid data outside of these
+    lines will not raise an error.
+    Files in other encodings are decoded and searched as text. From the
+    first carriage return found the rest of the file is decoded in chunks
+    and searched as text, so with stop_early data after the last block
+    needed is not read.
+
+    "statemachine" reads the file in text mode one line at a time and gives
+    each line to the parser. "regex" reads the file in text mode and finds
+    the lines around potential metadata blocks with a regular expression.
+    "auto" works as "bytes", but reads small files instead of mapping them.
+    Every engine gives the same result.
+
+    With encoding=None the encoding is detected from a UTF-8 BOM or a PEP 263
+    coding cookie in the first two lines, as the interpreter would, falling
+    back to UTF-8. With the "bytes" and "auto" engines the markers are still
+    searched for in the raw bytes and only the lines of blocks are decoded.
+
+    :param file_path: Path to the python source
+    :param encoding: Text encoding of the file, None to detect it from
+                     a BOM or coding cookie. An invalid or unknown coding
+                     cookie raises SyntaxError.
+    :param blocks: Names of the blocks to return, None returns all blocks
+    :param stop_early: Stop reading once every block in 'blocks' has been found.
+                       Later lines are not checked so duplicate blocks and
+                       warnings after this point are not reported.
+    :param collect_warnings: Set to False to skip creating warnings,
+                             duplicate blocks still raise ValueError
+    :param engine: "auto", "statemachine", "regex" or "bytes"
+    :param stats: ParseStats object to add counters and timings to
+    :return: Embedded metadata object with blocks and warnings
+    """
+    _check_engine(engine)
+
+    if stats is None:
+        lines = _iter_file_lines(file_path, encoding, engine)
+        parsed = _iter_parse_numbered(lines, collect_warnings=collect_warnings)
+    else:
+        lines = _iter_file_lines(file_path, encoding, engine, stats)
+        parsed = _iter_parse_stats(lines, stats, collect_warnings=collect_warnings)
+
+    try:
+        return _collect_metadata(parsed, blocks, stop_early)
+    finally:
+        # Close the file and finish the stats if parsing stopped early
+        parsed.close()
+        lines.close()
+
+
+def has_metadata_file(
+    file_path: str | bytes | os.PathLike,
+    *,
+    max_bytes: int | None = None,
+    encoding: str = "utf-8",
+) -> bool:
+    """
+    Quickly check if a python source file contains a closed metadata block
+
+    Returns True as soon as a valid '# /// TYPE' opening line is followed
+    by a closing '# ///' line within the block. No metadata or warning
+    objects are created and duplicate blocks are not checked for.
+
+    :param file_path: Path to the python source
+    :param max_bytes: Only check the first max_bytes of the file.
+                      Only complete lines are checked.
+    :param encoding: Text encoding of the file
+    :return: True if a metadata block was found, otherwise False
+    """
+    with open(file_path, mode="rb") as f:
+        if max_bytes is None:
+            mapped = _map_file(f)
+            if mapped is not None:
+                with mapped:
+                    return _has_metadata_buffer(mapped, None, encoding)
+
+        return _has_metadata_buffer(f.read(max_bytes), max_bytes, encoding)
+
+
+def has_metadata_source(
+    source: str | bytes,
+    *,
+    max_bytes: int | None = None,
+    encoding: str = "utf-8",
+) -> bool:
+    """
+    Quickly check if python source code contains a closed metadata block
+
+    Returns True as soon as a valid '# /// TYPE' opening line is followed
+    by a closing '# ///' line within the block. No metadata or warning
+    objects are created and duplicate blocks are not checked for.
+
+    :param source: Source of python script as str or bytes
+    :param max_bytes: Only check the first max_bytes of the source
+                      (characters for str sources). Only complete lines
+                      are checked.
+    :param encoding: Text encoding of bytes sources
+    :return: True if a metadata block was found, otherwise False
+    """
+    return _has_metadata_buffer(source, max_bytes, encoding)
+
+
+def _has_metadata_buffer(
+    data: str | bytes | mmap.mmap,
+    max_bytes: int | None,
+    encoding: str,
+) -> bool:
+    """
+    Implementation of has_metadata_file and has_metadata_source
+    for in memory or memory mapped data
+
+    :param data: str, bytes or memory mapped file to check
+    :param max_bytes: Only check the first max_bytes of data
+    :param encoding: Text encoding of bytes data
+    :return: True if a metadata block was found, otherwise False
+    """
+    lines: Iterator[tuple[int, str]]
+    if isinstance(data, str):
+        if max_bytes is not None and len(data) >= max_bytes:
+            # Drop any partial final line
+            data = data[:max_bytes]
+            data = data[:data.rfind("\n") + 1]
+        lines = _iter_candidate_lines(data)
+    else:
+        if max_bytes is not None and len(data) >= max_bytes:
+            data = data[:max_bytes]
+            data = data[:data.rfind(b"\n") + 1]
+
+        if codecs.lookup(encoding).name in _BYTES_SAFE_ENCODINGS:
+            lines = _iter_candidate_lines_bytes(
+                data, encoding=encoding, universal_newlines=True
+            )
+        else:
+            lines = _iter_translated_lines(
+                data, encoding=encoding, start_line=1, start_pos=0
+            )
+
+    in_block = False
+    for _, line in lines:
+        if in_block:
+            stripped = line.rstrip()
+            if stripped == "# ///":
+                return True
+            elif stripped == "#" or line.startswith("# "):
+                continue
+            in_block = False
+
+        if line.startswith("# /// "):
+            stripped = line.rstrip()
+            in_block = stripped != "# ///" and _is_valid_type(stripped[6:].strip())
+
+    return False
+
+
+def _parse_file_chunk(
+    file_paths: list[str | bytes | os.PathLike],
+    encoding: str | None,
+    collect_stats: bool,
+) -> tuple[
+    list[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception]],
+    ParseStats | None,
+]:
+    """
+    Parse a group of files, returning errors instead of raising them
+
+    This is the unit of work for parse_files and must be picklable.
+
+    :param file_paths: Paths to the python sources
+    :param encoding: Text encoding of the files
+    :param collect_stats: Gather ParseStats for the files
+    :return: list of path, metadata or exception pairs and the stats if gathered
+    """
+    stats = ParseStats() if collect_stats else None
+    results: list[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception]] = []
+    for file_path in file_paths:
+        try:
+            metadata = parse_file(file_path, encoding=encoding, stats=stats)
+        except Exception as e:
+            results.append((file_path, e))
+        else:
+            results.append((file_path, metadata))
+    return results, stats
+
+
+def _parse_file_chunk_timed(
+    file_paths: list[str | bytes | os.PathLike],
+    encoding: str | None,
+    collect_stats: bool,
+) -> tuple[
+    list[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception, float]],
+    ParseStats | None,
+]:
+    """
+    Parse a group of files as _parse_file_chunk, also giving the time taken for each
+
+    :param file_paths: Paths to the python sources
+    :param encoding: Text encoding of the files
+    :param collect_stats: Gather ParseStats for the files
+    :return: list of path, metadata or exception, seconds taken tuples
+             and the stats if gathered
+    """
+    stats = ParseStats() if collect_stats else None
+    results: list[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception, float]] = []
+    for file_path in file_paths:
+        start = perf_counter()
+        try:
+            metadata: ScriptMetadata | Exception = parse_file(
+                file_path, encoding=encoding, stats=stats
+            )
+        except Exception as e:
+            metadata = e
+        results.append((file_path, metadata, perf_counter() - start))
+    return results, stats
+
+
+def _iter_parallel(
+    task: Callable[
+        [list[str | bytes | os.PathLike], str | None, bool],
+        tuple[list, ParseStats | None],
+    ],
+    file_paths: Iterable[str | bytes | os.PathLike],
+    encoding: str | None,
+    workers: int | None,
+    executor: str,
+    chunksize: int,
+    stats: ParseStats | None = None,
+) -> Generator:
+    """
+    Run a chunk task such as _parse_file_chunk over file paths in a pool
+
+    The arguments are checked immediately, the pool is only started
+    once the returned generator is iterated.
+
+    :param task: Function taking a list of paths, an encoding and whether to
+                 gather stats, returning a list of results and the stats
+    :param file_paths: Paths to the python sources
+    :param encoding: Text encoding of the files
+    :param workers: Maximum number of workers, None uses the pool default
+    :param executor: "thread" for a thread pool, "process" for a process pool
+    :param chunksize: Number of files to parse in each task
+    :param stats: ParseStats object to add the stats of each task to
+    :return: generator of the items of the lists returned by each task
+    """
+    # concurrent.futures is slow to import, only import it if it is needed
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+    pool_type: type[ThreadPoolExecutor] | type[ProcessPoolExecutor]
+    if executor == "thread":
+        pool_type = ThreadPoolExecutor
+    elif executor == "process":
+        pool_type = ProcessPoolExecutor
+    else:
+        raise ValueError(
+            f"Unknown executor {executor!r}, expected 'thread' or 'process'."
+        )
+
+    if workers is not None and workers < 1:
+        raise ValueError(f"workers must be at least 1, not {workers!r}.")
+
+    if chunksize < 1:
+        raise ValueError(f"chunksize must be at least 1, not {chunksize!r}.")
+
+    return _run_parallel(
+        task, file_paths, encoding, workers, pool_type, chunksize, stats
+    )
+
+
+def _run_parallel(
+    task: Callable[
+        [list[str | bytes | os.PathLike], str | None, bool],
+        tuple[list, ParseStats | None],
+    ],
+    file_paths: Iterable[str | bytes | os.PathLike],
+    encoding: str | None,
+    workers: int | None,
+    pool_type: type[ThreadPoolExecutor] | type[ProcessPoolExecutor],
+    chunksize: int,
+    stats: ParseStats | None,
+) -> Generator:
+    """
+    Implementation of _iter_parallel, run once the arguments are checked
+
+    :param pool_type: Executor class to create the pool with
+    :yields: the items of the lists returned by each task
+    """
+    from concurrent.futures import FIRST_COMPLETED, Future, wait
+
+    # Limit the number of tasks in flight so paths can be consumed lazily
+    max_pending = (workers or os.cpu_count() or 1) * 4
+
+    collect_stats = stats is not None
+
+    pool = pool_type(max_workers=workers)
+    try:
+        pending: set[Future] = set()
+        chunk: list[str | bytes | os.PathLike] = []
+
+        for file_path in file_paths:
+            chunk.append(file_path)
+            if len(chunk) == chunksize:
+                pending.add(pool.submit(task, chunk, encoding, collect_stats))
+                chunk = []
+
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        results, task_stats = future.result()
+                        if task_stats is not None:
+                            stats += task_stats
+                        yield from results
+
+        if chunk:
+            pending.add(pool.submit(task, chunk, encoding, collect_stats))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                results, task_stats = future.result()
+                if task_stats is not None:
+                    stats += task_stats
+                yield from results
+    finally:
+        # Don't run the remaining tasks if the generator is closed early
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def parse_files(
+    file_paths: Iterable[str | bytes | os.PathLike],
+    *,
+    encoding: str | None = "utf-8",
+    workers: int | None = None,
+    executor: str = "thread",
+    chunksize: int = 16,
+    stats: ParseStats | None = None,
+) -> Iterator[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception]]:
+    """
+    Parse many python source files for inline metadata blocks in parallel
+
+    Files are grouped into tasks of 'chunksize' paths to reduce the per task
+    overhead of the pool. 'file_paths' is consumed lazily and results are
+    yielded as each task completes so the order will not match the order
+    of 'file_paths'.
+
+    Errors such as a missing file or a duplicate block are not raised,
+    the exception is yielded in place of the metadata.
+
+    :param file_paths: Paths to the python sources
+    :param encoding: Text encoding of the files, None to detect it
+    :param workers: Maximum number of workers, None uses the pool default
+    :param executor: "thread" for a thread pool, "process" for a process pool
+    :param chunksize: Number of files to parse in each task
+    :param stats: ParseStats object to add the counters and timings of every
+                  file to. Timings are summed over all workers.
+    :yields: tuples of path, metadata or the exception raised while parsing
+    """
+    return _iter_parallel(
+        _parse_file_chunk,
+        file_paths,
+        encoding,
+        workers,
+        executor,
+        chunksize,
+        stats,
+    )
+
+
+async def parse_files_async(
+    file_paths: Iterable[str | bytes | os.PathLike],
+    *,
+    limit: int = 8,
+    encoding: str | None = "utf-8",
+) -> AsyncIterator[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception]]:
+    """
+    Parse many python source files in worker threads without blocking the event loop
+
+    At most 'limit' files are parsed at once. Results are yielded as each file
+    completes so the order will not match the order of 'file_paths'.
+
+    Errors such as a missing file or a duplicate block are not raised,
+    the exception is yielded in place of the metadata.
+
+    :param file_paths: Paths to the python sources
+    :param limit: Maximum number of files to parse concurrently
+    :param encoding: Text encoding of the files, None to detect it
+    :yields: tuples of path, metadata or the exception raised while parsing
+    """
+    # asyncio is slow to import, only import it if it is needed
+    import asyncio
+
+    if limit < 1:
+        raise ValueError(f"limit must be at least 1, not {limit!r}.")
+
+    async def parse_one(file_path):
+        try:
+            return file_path, await asyncio.to_thread(parse_file, file_path, encoding=encoding)
+        except Exception as e:
+            return file_path, e
+
+    pending: set[asyncio.Task] = set()
+    try:
+        for file_path in file_paths:
+            pending.add(asyncio.ensure_future(parse_one(file_path)))
+
+            if len(pending) >= limit:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield task.result()
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+# Directories that are skipped by scan_tree unless 'exclude' is given
+_DEFAULT_EXCLUDE = (
+    ".git",
+    ".hg",
+    ".svn",
+    "__pycache__",
+    ".venv",
+    "venv",
+    ".tox",
+    ".nox",
+    ".mypy_cache",
+    ".pytest_cache",
+    ".ruff_cache",
+    "node_modules",
+)
+
+
+def _iter_tree_stats(
+    root: str | os.PathLike,
+    include: tuple[str, ...],
+    exclude: tuple[str, ...],
+    follow_symlinks: bool,
+) -> Iterator[tuple[str, os.stat_result]]:
+    """
+    Walk a directory tree with os.scandir yielding matching files and their stats
+
+    The stat results come from the directory entries, so on Windows no extra
+    system calls are needed. Subdirectories that can not be read are skipped.
+
+    :param root: Directory to search
+    :param include: Glob patterns a file name must match to be yielded
+    :param exclude: Glob patterns for file and directory names to skip
+    :param follow_symlinks: Follow symbolic links to files and directories
+    :yields: tuples of path, stat result of matching files
+    :raises OSError: if the root directory can not be read
+    """
+    # fnmatch imports 're', only import it if it is needed
+    from fnmatch import fnmatch
+
+    root = os.fspath(root)
+    stack = [root]
+
+    # (st_dev, st_ino) of visited directories to avoid symlink loops
+    seen_dirs: set[tuple[int, int]] = set()
+    if follow_symlinks:
+        root_stat = os.stat(root)
+        seen_dirs.add((root_stat.st_dev, root_stat.st_ino))
+
+    while stack:
+        dir_path = stack.pop()
+        try:
+            scanner = os.scandir(dir_path)
+        except OSError:
+            # Only unreadable subdirectories are skipped
+            if dir_path == root:
+                raise
+            continue
+
+        with scanner:
+            subdirs = []
+            for entry in scanner:
+                name = entry.name
+                if any(fnmatch(name, pattern) for pattern in exclude):
+                    continue
+
+                try:
+                    if entry.is_dir(follow_symlinks=follow_symlinks):
+                        if follow_symlinks:
+                            stat = entry.stat()
+                            key = (stat.st_dev, stat.st_ino)
+                            if key in seen_dirs:
+                                continue
+                            seen_dirs.add(key)
+                        subdirs.append(entry.path)
+
+                    elif (
+                        entry.is_file(follow_symlinks=follow_symlinks)
+                        and any(fnmatch(name, pattern) for pattern in include)
+                    ):
+                        yield entry.path, entry.stat(follow_symlinks=follow_symlinks)
+                except OSError:
+                    continue
+
+        # Reverse so directories are visited in scandir order
+        stack.extend(reversed(subdirs))
+
+
+def _iter_tree(
+    root: str | os.PathLike,
+    include: tuple[str, ...],
+    exclude: tuple[str, ...],
+    follow_symlinks: bool,
+) -> Iterator[str]:
+    """
+    Walk a directory tree with os.scandir yielding matching file paths
+
+    Empty files are skipped using the stat information from the directory
+    entry. Subdirectories that can not be read are skipped.
+
+    :param root: Directory to search
+    :param include: Glob patterns a file name must match to be yielded
+    :param exclude: Glob patterns for file and directory names to skip
+    :param follow_symlinks: Follow symbolic links to files and directories
+    :yields: paths of matching files
+    """
+    for path, stat_result in _iter_tree_stats(root, include, exclude, follow_symlinks):
+        if stat_result.st_size > 0:
+            yield path
+
+
+def scan_tree(
+    root: str | os.PathLike,
+    *,
+    include: tuple[str, ...] = ("*.py",),
+    exclude: tuple[str, ...] = _DEFAULT_EXCLUDE,
+    follow_symlinks: bool = False,
+    encoding: str | None = "utf-8",
+    workers: int | None = None,
+    executor: str = "thread",
+    chunksize: int = 16,
+    stats: ParseStats | None = None,
+) -> Iterator[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception]]:
+    """
+    Search a directory tree for python sources containing metadata blocks
+
+    The tree is walked with os.scandir and matching files are parsed
+    in parallel with parse_files while the walk continues.
+    Only files with at least one metadata block, or that raised an
+    exception while parsing, are yielded.
+
+    :param root: Directory to search
+    :param include: Glob patterns a file name must match to be parsed
+    :param exclude: Glob patterns for file and directory names to skip,
+                    by default VCS, cache and virtual environment folders
+    :param follow_symlinks: Follow symbolic links to files and directories
+    :param encoding: Text encoding of the files, None to detect it
+    :param workers: Maximum number of workers, None uses the pool default
+    :param executor: "thread" for a thread pool, "process" for a process pool
+    :param chunksize: Number of files to parse in each task
+    :param stats: ParseStats object to add the counters and timings of every
+                  parsed file to. Timings are summed over all workers.
+    :yields: tuples of path, metadata or the exception raised while parsing
+    :raises OSError: if the root directory can not be read
+    """
+    paths = _iter_tree(root, include, exclude, follow_symlinks)
+
+    for file_path, metadata in parse_files(
+        paths,
+        encoding=encoding,
+        workers=workers,
+        executor=executor,
+        chunksize=chunksize,
+        stats=stats,
+    ):
+        if isinstance(metadata, Exception) or metadata.blocks:
+            yield file_path, metadata
+
+
+def _iter_buffer_lines(
+    data: bytes,
+    encoding: str | None,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield the lines to give to the parser for the contents of a file read into memory
+
+    :param data: contents of the file
+    :param encoding: Text encoding of the data, None to detect it
+    :yields: tuples of line number, line
+    """
+    start_pos = 0
+    if encoding is None:
+        encoding, start_pos = _detect_encoding(data)
+        # Search after the BOM, 'utf-8-sig' is not needed for the lines
+        if start_pos:
+            encoding = "utf-8"
+
+    if codecs.lookup(encoding).name in _BYTES_SAFE_ENCODINGS:
+        yield from _iter_candidate_lines_bytes(
+            data,
+            encoding=encoding,
+            start_pos=start_pos,
+            universal_newlines=True,
+        )
+    else:
+        yield from _iter_translated_lines(
+            data, encoding=encoding, start_line=1, start_pos=start_pos
+        )
+
+
+def _iter_stream_lines(
+    stream: IO[bytes],
+    encoding: str | None,
+    stats: ParseStats | None = None,
+) -> Iterator[tuple[int, str]]:
+    """
+    Yield the lines to give to the parser for a binary stream, reading it in chunks
+
+    :param stream: binary file object such as an archive member
+    :param encoding: Text encoding of the data, None to detect it
+    :param stats: ParseStats to add the number of bytes read to
+    :yields: tuples of line number, line
+    """
+    if encoding is None:
+        # Only the first two lines are needed, 'utf-8-sig' removes any BOM
+        head = stream.readline()
+        head += stream.readline()
+        encoding, _ = _detect_encoding(head)
+    else:
+        head = stream.read(_TRANSLATE_CHUNK_SIZE)
+
+    def read_chunks() -> Iterator[bytes]:
+        chunk = head
+        while chunk:
+            if stats is not None:
+                stats.bytes_read += len(chunk)
+            yield chunk
+            chunk = stream.read(_TRANSLATE_CHUNK_SIZE)
+
+    yield from _iter_chunk_lines(read_chunks(), encoding=encoding)
+
+
+def _iter_archive_members(
+    archive_path: str | os.PathLike,
+    include: tuple[str, ...],
+) -> Iterator[tuple[str, Callable[[], IO[bytes]]]]:
+    """
+    Yield the regular file members of a zip or tar archive with matching names
+
+    Zip archives are listed from the central directory, tar archives are read
+    in a single pass. Only the data of matching members is decompressed.
+
+    :param archive_path: Path to a zip (including wheels) or tar archive
+    :param include: Glob patterns the base name of a member must match
+    :yields: tuples of member name, function opening the member as a binary stream
+    """
+    # These modules are slow to import, only import them if they are needed
+    import tarfile
+    import zipfile
+    from fnmatch import fnmatch
+    from functools import partial
+
+    def matches(member_name):
+        base_name = member_name.rpartition("/")[2]
+        return any(fnmatch(base_name, pattern) for pattern in include)
+
+    if zipfile.is_zipfile(archive_path):
+        with zipfile.ZipFile(archive_path) as zf:
+            for info in zf.infolist():
+                if not info.is_dir() and matches(info.filename):
+                    yield info.filename, partial(zf.open, info)
+        return
+
+    try:
+        tf = tarfile.open(archive_path, mode="r:*")
+    except tarfile.ReadError:
+        raise ValueError(
+            f"{os.fsdecode(archive_path)!r} is not a zip or tar archive."
+        ) from None
+
+    def open_tar_member(tar_info: tarfile.TarInfo) -> IO[bytes]:
+        member = tf.extractfile(tar_info)
+        if member is None:
+            # Only returned for members that are not files or links
+            raise ValueError(f"Archive member {tar_info.name!r} has no data.")
+        return member
+
+    with tf:
+        for tar_info in tf:
+            if tar_info.isfile() and matches(tar_info.name):
+                yield tar_info.name, partial(open_tar_member, tar_info)
+
+
+def parse_archive(
+    archive_path: str | os.PathLike,
+    *,
+    include: tuple[str, ...] = ("*.py",),
+    encoding: str | None = "utf-8",
+    collect_warnings: bool = True,
+    stats: ParseStats | None = None,
+) -> Iterator[tuple[str, ScriptMetadata | Exception]]:
+    """
+    Parse the python sources inside a zip, wheel or tar archive without extracting it
+
+    Each matching member is decompressed and decoded in chunks as it is parsed,
+    so members are never held in memory in full. For zip archives and wheels the
+    members are found from the central directory so members that don't match
+    are never read. Compressed tar archives such as sdists are read in a single
+    pass. Line endings are translated as in text mode.
+
+    Errors such as a duplicate block or an invalid encoding in a member are
+    not raised, the exception is yielded in place of the metadata.
+
+    :param archive_path: Path to the archive
+    :param include: Glob patterns the base name of a member must match to be parsed
+    :param encoding: Text encoding of the members, None to detect it
+    :param collect_warnings: Set to False to skip creating warnings
+    :param stats: ParseStats object to add the counters and timings of every
+                  parsed member to. Members are read as they are parsed, so
+                  reading is counted as scan_time.
+    :yields: tuples of member name, metadata or the exception raised while parsing
+    :raises ValueError: if the file is not a zip or tar archive
+    """
+    for member_name, open_member in _iter_archive_members(archive_path, include):
+        try:
+            with open_member() as member:
+                lines = _iter_stream_lines(member, encoding, stats)
+                if stats is None:
+                    parsed = _iter_parse_numbered(lines, collect_warnings=collect_warnings)
+                else:
+                    parsed = _iter_parse_stats(
+                        lines, stats, collect_warnings=collect_warnings
+                    )
+                metadata: ScriptMetadata | Exception = _collect_metadata(parsed)
+        except Exception as e:
+            metadata = e
+        yield member_name, metadata
@@ -0,0 +1,232 @@
+# MIT License
+#
+# Copyright (c) 2023-2025 David C Ellis
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Command line batch parser, writing one JSON object per file to stdout.
+
+usage: python -m ducktools.scriptmetadata [options] PATH [PATH ...]
+
+PATH may be a file, a directory to search or '-' to read paths from stdin.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+
+from . import (
+    _DEFAULT_EXCLUDE,
+    ParseStats,
+    ScriptMetadata,
+    __version__,
+    _iter_parallel,
+    _iter_tree_stats,
+    _parse_file_chunk_timed,
+)
+
+TYPE_CHECKING = False
+if TYPE_CHECKING:
+    from collections.abc import Iterable, Iterator
+
+
+def _get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python -m ducktools.scriptmetadata",
+        description=(
+            "Parse inline script metadata from python files, "
+            "writing one JSON object per file to stdout."
+        ),
+    )
+    parser.add_argument(
+        "paths",
+        nargs="+",
+        metavar="PATH",
+        help="File or directory to parse, '-' reads paths from stdin, one per line",
+    )
+    parser.add_argument(
+        "-j", "--workers",
+        type=int,
+        default=None,
+        help="Number of parallel workers (default: pool default)",
+    )
+    parser.add_argument(
+        "--executor",
+        choices=["thread", "process"],
+        default="thread",
+        help="Use a thread or process pool (default: thread)",
+    )
+    parser.add_argument(
+        "--chunksize",
+        type=int,
+        default=16,
+        help="Number of files given to a worker at a time (default: 16)",
+    )
+    parser.add_argument(
+        "--encoding",
+        default="utf-8",
+        help=(
+            "Text encoding of the files, 'detect' reads the encoding from "
+            "a BOM or coding cookie (default: utf-8)"
+        ),
+    )
+    parser.add_argument(
+        "--include",
+        action="append",
+        metavar="PATTERN",
+        help="Glob pattern for files to parse in directories (default: *.py)",
+    )
+    parser.add_argument(
+        "--only-metadata",
+        action="store_true",
+        help="Only output files with metadata blocks or errors",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="Write the total ParseStats counters and timings as JSON to stderr",
+    )
+    parser.add_argument(
+        "--version",
+        action="version",
+        version=f"%(prog)s {__version__}",
+    )
+    return parser
+
+
+def _iter_paths(
+    paths: Iterable[str],
+    include: tuple[str, ...],
+) -> Iterator[str]:
+    """
+    Expand the command line paths into file paths
+
+    :param paths: Files, directories or '-' for paths from stdin
+    :param include: Glob patterns for files to parse in directories
+    :yields: file paths
+    """
+    for path in paths:
+        if path == "-":
+            for line in sys.stdin:
+                line = line.rstrip("\r\n")
+                if line:
+                    yield line
+        elif os.path.isdir(path):
+            # Empty files are included, every matching file gets a record
+            for file_path, _ in _iter_tree_stats(path, include, _DEFAULT_EXCLUDE, False):
+                yield file_path
+        else:
+            yield path
+
+
+def _to_record(
+    file_path: str | bytes | os.PathLike,
+    metadata: ScriptMetadata | Exception,
+    seconds: float,
+) -> dict:
+    """
+    Convert a parse result to a JSON compatible dict
+
+    :param file_path: Path of the parsed file
+    :param metadata: Metadata or the exception raised while parsing
+    :param seconds: Time taken to parse the file
+    :return: dict for json.dumps
+    """
+    record: dict = {"path": os.fsdecode(file_path)}
+    if isinstance(metadata, Exception):
+        record["error"] = {
+            "type": type(metadata).__name__,
+            "message": str(metadata),
+        }
+    else:
+        record["blocks"] = metadata.blocks
+        record["warnings"] = [
+            {"line": w.line_number, "code": w.code, "message": w.message}
+            for w in metadata.warnings
+        ]
+    record["time_ms"] = round(seconds * 1000, 4)
+    return record
+
+
+def main(argv: list[str] | None = None) -> int:
+    """
+    Run the command line batch parser
+
+    :param argv: Command line arguments, None uses sys.argv
+    :return: exit code, 1 if any file raised an error otherwise 0
+    """
+    parser = _get_parser()
+    args = parser.parse_args(argv)
+
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.chunksize < 1:
+        parser.error("--chunksize must be at least 1")
+
+    include = tuple(args.include) if args.include else ("*.py",)
+    encoding = None if args.encoding == "detect" else args.encoding
+    stats = ParseStats() if args.stats else None
+
+    results = _iter_parallel(
+        _parse_file_chunk_timed,
+        _iter_paths(args.paths, include),
+        encoding,
+        args.workers,
+        args.executor,
+        args.chunksize,
+        stats,
+    )
+
+    exit_code = 0
+    out = sys.stdout
+    # Only flush every record for a terminal, otherwise leave it to the buffer
+    interactive = out.isatty()
+    try:
+        for file_path, metadata, seconds in results:
+            if isinstance(metadata, Exception):
+                exit_code = 1
+            elif args.only_metadata and not metadata.blocks:
+                continue
+
+            out.write(json.dumps(_to_record(file_path, metadata, seconds)))
+            out.write("\n")
+            if interactive:
+                out.flush()
+        out.flush()
+    except BrokenPipeError:
+        # Output was closed early, eg: piped into 'head'
+        # Redirect stdout so the interpreter doesn't fail flushing it at exit
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        return 1
+    finally:
+        results.close()
+
+    if stats is not None:
+        sys.stderr.write(json.dumps({"stats": stats.as_dict()}))
+        sys.stderr.write("\n")
+
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
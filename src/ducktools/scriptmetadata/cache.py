@@ -0,0 +1,678 @@
+# MIT License
+#
+# Copyright (c) 2023-2025 David C Ellis
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Caches for parsed metadata, keyed on the stat signature of the source file.
+
+This module is not imported by ducktools.scriptmetadata
+so it adds nothing to the import time if it is not used.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from . import (
+    MetadataWarning,
+    ScriptMetadata,
+    WarningCode,
+    _collect_metadata,
+    _iter_buffer_lines,
+    _iter_parse_numbered,
+    parse_file,
+    parse_files,
+    parse_source,
+)
+
+try:
+    from _collections_abc import Callable, Iterable, Iterator
+except ImportError:  # pragma: nocover
+    from collections.abc import Callable, Iterable, Iterator
+
+__all__ = [
+    "MetadataCache",
+    "MemoryCache",
+    "ContentCache",
+]
+
+
+# Maximum number of parameters to use in a single 'IN' query
+_QUERY_BATCH_SIZE = 500
+
+# Stored as the database user_version, tables from any other version are rebuilt
+_SCHEMA_VERSION = 1
+
+
+def _stat_signature(stat_result: os.stat_result) -> tuple[int, int, int]:
+    """
+    Get the values from a stat result that are used to detect a changed file
+
+    :param stat_result: result of os.stat for the file
+    :return: tuple of size, mtime_ns, inode
+    """
+    return stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino
+
+
+def _copy_warning(warning: MetadataWarning, line_offset: int = 0) -> MetadataWarning:
+    line_number = warning.line_number + line_offset
+    if warning.code == WarningCode.OTHER:
+        return MetadataWarning(line_number, warning.message)
+    return MetadataWarning(
+        line_number, code=warning.code, block_names=warning.block_names
+    )
+
+
+def _copy_metadata(metadata: ScriptMetadata) -> ScriptMetadata:
+    """
+    Copy metadata so changes to the copy can not affect a cached value
+
+    :param metadata: metadata object to copy
+    :return: new metadata object with copied blocks and warnings
+    """
+    # noinspection PyArgumentList
+    return ScriptMetadata(
+        dict(metadata.blocks),
+        [_copy_warning(w) for w in metadata.warnings],
+    )
+
+
+class MetadataCache:
+    """
+    Persistent cache of parsed metadata stored in an SQLite database
+
+    Entries are keyed on the absolute path of the source file and the encoding
+    it was parsed with and are only used if the size, mtime_ns and inode of the
+    file are unchanged.
+
+    If max_size is given, the least recently used entries are evicted
+    once the total size of the stored metadata exceeds it. Lookups only
+    write to the database when max_size is given, the times of cache hits
+    are kept in memory and written with the next put, evict or close.
+
+    The SQLite connection may only be used by the thread that created
+    the cache, open a MetadataCache for each thread that needs one.
+
+    :param db_path: Path to the SQLite database file, or ":memory:"
+    :param max_size: Maximum total size in bytes of stored metadata
+    """
+    def __init__(
+        self,
+        db_path: str | os.PathLike,
+        *,
+        max_size: int | None = None,
+    ):
+        self.db_path = db_path
+        self.max_size = max_size
+
+        # Total size of stored metadata, None if it needs to be recalculated
+        self._total_size: int | None = None
+
+        # Last used times of cache hits not yet written to the database
+        self._pending_used: dict[tuple[str, str], int] = {}
+
+        self._connection = sqlite3.connect(db_path)
+        with self._connection:
+            (user_version,) = self._connection.execute(
+                "PRAGMA user_version"
+            ).fetchone()
+            if user_version != _SCHEMA_VERSION:
+                # Entries from older versions can not be read, discard them
+                self._connection.execute("DROP INDEX IF EXISTS metadata_last_used")
+                self._connection.execute("DROP TABLE IF EXISTS metadata")
+                self._connection.execute(f"PRAGMA user_version = {_SCHEMA_VERSION}")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS metadata ("
+                "path TEXT NOT NULL, "
+                "encoding TEXT NOT NULL, "
+                "size INTEGER NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, "
+                "inode INTEGER NOT NULL, "
+                "data BLOB NOT NULL, "
+                "data_size INTEGER NOT NULL, "
+                "last_used INTEGER NOT NULL, "
+                "PRIMARY KEY (path, encoding)"
+                ")"
+            )
+            self._connection.execute(
+                "CREATE INDEX IF NOT EXISTS metadata_last_used ON metadata (last_used)"
+            )
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.db_path!r}, max_size={self.max_size!r})"
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __len__(self):
+        (count,) = self._connection.execute("SELECT COUNT(*) FROM metadata").fetchone()
+        return count
+
+    @staticmethod
+    def _key(file_path: str | bytes | os.PathLike) -> str:
+        return os.fsdecode(os.path.abspath(file_path))
+
+    def _stored_size(self) -> int:
+        (total,) = self._connection.execute(
+            "SELECT COALESCE(SUM(data_size), 0) FROM metadata"
+        ).fetchone()
+        return total
+
+    def _write_last_used(self) -> None:
+        # Must be called inside a transaction
+        if self._pending_used:
+            self._connection.executemany(
+                "UPDATE metadata SET last_used = ? WHERE path = ? AND encoding = ?",
+                (
+                    (last_used, key, encoding)
+                    for (key, encoding), last_used in self._pending_used.items()
+                ),
+            )
+            self._pending_used.clear()
+
+    def close(self) -> None:
+        """
+        Write pending last used times and close the database connection
+        """
+        with self._connection:
+            self._write_last_used()
+        self._connection.close()
+
+    def get(
+        self,
+        file_path: str | bytes | os.PathLike,
+        *,
+        encoding: str = "utf-8",
+    ) -> ScriptMetadata | None:
+        """
+        Get the cached metadata for a file if the file is unchanged
+
+        :param file_path: Path to the python source
+        :param encoding: Text encoding the file was parsed with
+        :return: cached metadata or None if there is no valid entry
+        """
+        # A direct query, get_many's batching is slower for a single file
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            return None
+
+        key = self._key(file_path)
+        row = self._connection.execute(
+            "SELECT size, mtime_ns, inode, data FROM metadata "
+            "WHERE path = ? AND encoding = ?",
+            (key, encoding),
+        ).fetchone()
+        if row is None or row[:3] != _stat_signature(stat_result):
+            return None
+
+        if self.max_size is not None:
+            self._pending_used[key, encoding] = time.time_ns()
+        return ScriptMetadata.from_bytes(row[3])
+
+    def get_many(
+        self,
+        file_paths: Iterable[str | bytes | os.PathLike],
+        *,
+        encoding: str = "utf-8",
+    ) -> dict[str | bytes | os.PathLike, ScriptMetadata]:
+        """
+        Get the cached metadata for all unchanged files in file_paths
+
+        Files that are missing, changed or not in the cache are left out
+        of the result.
+
+        :param file_paths: Paths to the python sources
+        :param encoding: Text encoding the files were parsed with
+        :return: dict of the given paths to cached metadata
+        """
+        signatures: dict[str, tuple[str | bytes | os.PathLike, tuple[int, int, int]]] = {}
+        for file_path in file_paths:
+            try:
+                stat_result = os.stat(file_path)
+            except OSError:
+                continue
+            signatures[self._key(file_path)] = file_path, _stat_signature(stat_result)
+
+        results: dict[str | bytes | os.PathLike, ScriptMetadata] = {}
+        # Hits are only recorded if they may be needed for eviction
+        track_used = self.max_size is not None
+        now = time.time_ns()
+
+        keys = list(signatures)
+        for i in range(0, len(keys), _QUERY_BATCH_SIZE):
+            batch = keys[i:i + _QUERY_BATCH_SIZE]
+            rows = self._connection.execute(
+                "SELECT path, size, mtime_ns, inode, data FROM metadata "
+                f"WHERE encoding = ? AND path IN ({', '.join('?' * len(batch))})",
+                [encoding, *batch],
+            )
+            for key, size, mtime_ns, inode, data in rows:
+                file_path, signature = signatures[key]
+                if signature == (size, mtime_ns, inode):
+                    results[file_path] = ScriptMetadata.from_bytes(data)
+                    if track_used:
+                        self._pending_used[key, encoding] = now
+
+        return results
+
+    def put(
+        self,
+        file_path: str | bytes | os.PathLike,
+        metadata: ScriptMetadata,
+        *,
+        encoding: str = "utf-8",
+        stat_result: os.stat_result | None = None,
+    ) -> None:
+        """
+        Store the metadata for a file
+
+        :param file_path: Path to the python source
+        :param metadata: Parsed metadata for the file
+        :param encoding: Text encoding the file was parsed with
+        :param stat_result: os.stat result for the file taken *before* parsing,
+                            if not given the file will be checked now.
+        """
+        if stat_result is None:
+            stat_result = os.stat(file_path)
+
+        key = self._key(file_path)
+        data = metadata.to_bytes()
+        size, mtime_ns, inode = _stat_signature(stat_result)
+
+        with self._connection:
+            self._write_last_used()
+            if self._total_size is not None:
+                row = self._connection.execute(
+                    "SELECT data_size FROM metadata WHERE path = ? AND encoding = ?",
+                    (key, encoding),
+                ).fetchone()
+                self._total_size += len(data) - (row[0] if row else 0)
+
+            self._connection.execute(
+                "INSERT OR REPLACE INTO metadata "
+                "(path, encoding, size, mtime_ns, inode, data, data_size, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, encoding, size, mtime_ns, inode, data, len(data), time.time_ns()),
+            )
+
+        if self.max_size is not None:
+            if self._total_size is None:
+                self._total_size = self._stored_size()
+            if self._total_size > self.max_size:
+                self.evict(self.max_size)
+
+    def evict(self, max_size: int) -> int:
+        """
+        Remove least recently used entries until the stored metadata
+        takes up at most max_size bytes
+
+        :param max_size: Maximum total size in bytes of stored metadata
+        :return: Number of entries removed
+        """
+        with self._connection:
+            self._write_last_used()
+
+        total = self._stored_size()
+        self._total_size = total
+
+        if total <= max_size:
+            return 0
+
+        removed: list[tuple[str, str]] = []
+        rows = self._connection.execute(
+            "SELECT path, encoding, data_size FROM metadata ORDER BY last_used"
+        ).fetchall()
+        for key, encoding, data_size in rows:
+            if total <= max_size:
+                break
+            removed.append((key, encoding))
+            total -= data_size
+
+        with self._connection:
+            self._connection.executemany(
+                "DELETE FROM metadata WHERE path = ? AND encoding = ?",
+                removed,
+            )
+        self._total_size = total
+
+        return len(removed)
+
+    def invalidate(self, file_path: str | bytes | os.PathLike) -> None:
+        """
+        Remove the entries for a file
+
+        :param file_path: Path to the python source
+        """
+        with self._connection:
+            self._connection.execute(
+                "DELETE FROM metadata WHERE path = ?", (self._key(file_path),)
+            )
+        self._total_size = None
+
+    def clear(self) -> None:
+        """
+        Remove all entries
+        """
+        with self._connection:
+            self._connection.execute("DELETE FROM metadata")
+        self._pending_used.clear()
+        self._total_size = 0
+
+    def parse_file(
+        self,
+        file_path: str | bytes | os.PathLike,
+        *,
+        encoding: str = "utf-8",
+    ) -> ScriptMetadata:
+        """
+        Parse a python source file for inline metadata blocks,
+        only reading the file if it has changed since it was cached.
+
+        :param file_path: Path to the python source
+        :param encoding: Text encoding of the file
+        :return: Embedded metadata object with blocks and warnings
+        """
+        metadata = self.get(file_path, encoding=encoding)
+        if metadata is None:
+            # Stat before parsing, if the file changes during parsing
+            # the entry will not match the file on the next lookup
+            stat_result = os.stat(file_path)
+            metadata = parse_file(file_path, encoding=encoding)
+            self.put(file_path, metadata, encoding=encoding, stat_result=stat_result)
+
+        return metadata
+
+    def parse_files(
+        self,
+        file_paths: Iterable[str | bytes | os.PathLike],
+        *,
+        encoding: str = "utf-8",
+        **kwargs,
+    ) -> Iterator[tuple[str | bytes | os.PathLike, ScriptMetadata | Exception]]:
+        """
+        Parse many python source files, yielding cached results first and then
+        parsing changed files with ducktools.scriptmetadata.parse_files.
+
+        :param file_paths: Paths to the python sources
+        :param encoding: Text encoding of the files
+        :param kwargs: Additional arguments for parse_files
+        :yields: tuples of path, metadata or the exception raised while parsing
+        """
+        file_paths = list(file_paths)
+        cached = self.get_many(file_paths, encoding=encoding)
+        yield from cached.items()
+
+        stat_results = {}
+        for file_path in file_paths:
+            if file_path not in cached:
+                try:
+                    stat_results[file_path] = os.stat(file_path)
+                except OSError as e:
+                    yield file_path, e
+
+        for file_path, metadata in parse_files(stat_results, encoding=encoding, **kwargs):
+            if isinstance(metadata, ScriptMetadata):
+                self.put(
+                    file_path,
+                    metadata,
+                    encoding=encoding,
+                    stat_result=stat_results[file_path],
+                )
+            yield file_path, metadata
+
+
+class MemoryCache:
+    """
+    In process least recently used cache of parsed metadata
+
+    Every lookup checks the size, mtime_ns and inode of the file with os.stat
+    and the file is parsed again if any of these have changed.
+    Copies of the cached metadata are returned so callers can not modify
+    the cached values.
+
+    All methods are safe to call from multiple threads.
+
+    :param max_entries: Maximum number of files to keep in the cache
+    """
+    def __init__(self, max_entries: int = 128):
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[
+            tuple[str, str], tuple[tuple[int, int, int], ScriptMetadata]
+        ] = OrderedDict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(max_entries={self.max_entries!r})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def parse_file(
+        self,
+        file_path: str | bytes | os.PathLike,
+        *,
+        encoding: str = "utf-8",
+    ) -> ScriptMetadata:
+        """
+        Parse a python source file for inline metadata blocks,
+        only reading the file if it has changed since it was cached.
+
+        :param file_path: Path to the python source
+        :param encoding: Text encoding of the file
+        :return: Embedded metadata object with blocks and warnings
+        """
+        key = os.fsdecode(os.path.abspath(file_path)), encoding
+        signature = _stat_signature(os.stat(file_path))
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return _copy_metadata(entry[1])
+
+        # Parse outside of the lock so other files can be looked up
+        metadata = parse_file(file_path, encoding=encoding)
+
+        with self._lock:
+            self._entries[key] = signature, metadata
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return _copy_metadata(metadata)
+
+    def invalidate(self, file_path: str | bytes | os.PathLike) -> None:
+        """
+        Remove the entries for a file
+
+        :param file_path: Path to the python source
+        """
+        path_key = os.fsdecode(os.path.abspath(file_path))
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path_key]:
+                del self._entries[key]
+
+    def clear(self) -> None:
+        """
+        Remove all entries
+        """
+        with self._lock:
+            self._entries.clear()
+
+
+def _shift_metadata(metadata: ScriptMetadata, offset: int) -> ScriptMetadata:
+    """
+    Get metadata with the line numbers of warnings moved by offset
+
+    :param metadata: parsed metadata
+    :param offset: number of lines to add to each warning line number
+    :return: metadata with the same blocks dict, or the same object if unchanged
+    """
+    if offset == 0 or not metadata.warnings:
+        return metadata
+
+    # noinspection PyArgumentList
+    return ScriptMetadata(
+        metadata.blocks,
+        [_copy_warning(w, offset) for w in metadata.warnings],
+    )
+
+
+class ContentCache:
+    """
+    In process cache of parsed metadata keyed on a hash of the source content
+
+    Identical sources, such as copies of a templated script, are only parsed
+    once. Sources are hashed with BLAKE2b, which is much faster than parsing.
+    Unlike MemoryCache the same ScriptMetadata object is returned for all
+    sources with the same content, so the results of a large scan only take
+    up memory once for each distinct script. Returned metadata must not
+    be modified.
+
+    Sources that raise an error while parsing are not cached.
+
+    All methods are safe to call from multiple threads.
+
+    :param max_entries: Maximum number of distinct sources to keep in the cache
+    """
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+
+        # Number of lookups that found or did not find a cached result
+        self.hits = 0
+        self.misses = 0
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple, ScriptMetadata] = OrderedDict()
+
+    def __repr__(self):
+        return f"{type(self).__name__}(max_entries={self.max_entries!r})"
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _get_or_parse(
+        self,
+        key: tuple,
+        parse: Callable[[], ScriptMetadata],
+    ) -> ScriptMetadata:
+        """
+        Get the metadata for a content key, parsing and storing it if missing
+
+        :param key: hashable key identifying the content
+        :param parse: function to parse the content on a miss
+        :return: shared metadata object for the content
+        """
+        with self._lock:
+            metadata = self._entries.get(key)
+            if metadata is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return metadata
+            self.misses += 1
+
+        # Parse outside of the lock so other sources can be looked up
+        metadata = parse()
+
+        with self._lock:
+            # If another thread stored the same content first, share its result
+            metadata = self._entries.setdefault(key, metadata)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+        return metadata
+
+    def parse_source(
+        self,
+        script_text: str,
+        *,
+        start_line: int = 1,
+    ) -> ScriptMetadata:
+        """
+        Parse a source code string for inline metadata blocks,
+        reusing the result for any source with the same text.
+
+        The warnings of the result have the correct line numbers for
+        start_line, the blocks are shared with other results.
+
+        :param script_text: Source of python script as string
+        :param start_line: Line number where file parsing starts - used for warnings
+        :return: Embedded metadata object with blocks and warnings
+        """
+        digest = hashlib.blake2b(
+            script_text.encode("utf-8", "surrogatepass"), digest_size=16
+        ).digest()
+        # Parse with the caller's start_line so errors have the correct line
+        # numbers, results are stored as if parsed from line 1
+        metadata = self._get_or_parse(
+            ("source", digest),
+            lambda: _shift_metadata(
+                parse_source(script_text, start_line=start_line), 1 - start_line
+            ),
+        )
+        return _shift_metadata(metadata, start_line - 1)
+
+    def parse_file(
+        self,
+        file_path: str | bytes | os.PathLike,
+        *,
+        encoding: str | None = "utf-8",
+    ) -> ScriptMetadata:
+        """
+        Parse a python source file for inline metadata blocks,
+        reusing the result for any file with the same bytes.
+
+        The file is always read, use MemoryCache or MetadataCache
+        to skip reading unchanged files.
+
+        :param file_path: Path to the python source
+        :param encoding: Text encoding of the file, None to detect it
+        :return: Embedded metadata object with blocks and warnings
+        """
+        with open(file_path, mode="rb") as f:
+            data = f.read()
+
+        digest = hashlib.blake2b(data, digest_size=16).digest()
+        return self._get_or_parse(
+            ("file", encoding, digest),
+            lambda: _collect_metadata(
+                _iter_parse_numbered(_iter_buffer_lines(data, encoding))
+            ),
+        )
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset the hit and miss counts
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
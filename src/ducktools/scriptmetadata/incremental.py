@@ -0,0 +1,240 @@
+# MIT License
+#
+# Copyright (c) 2023-2025 David C Ellis
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Incremental parsing of a document that is edited, for editor integrations.
+"""
+from __future__ import annotations
+
+from . import (
+    MetadataWarning,
+    ScriptMetadata,
+    _collect_metadata,
+    _iter_parse_numbered,
+    _ParserState,
+)
+
+__all__ = [
+    "IncrementalDocument",
+    "LineKind",
+]
+
+
+class LineKind:
+    """
+    Classification of a line of source code
+    """
+    CODE = 0
+    COMMENT = 1
+    OPENER = 2
+    CLOSER = 3
+
+
+def _classify(line: str) -> int:
+    if not line.startswith("#"):
+        return LineKind.CODE
+    stripped = line.rstrip()
+    if stripped == "# ///":
+        return LineKind.CLOSER
+    if stripped.startswith("# /// "):
+        return LineKind.OPENER
+    return LineKind.COMMENT
+
+
+def _split_lines(text: str) -> list[str]:
+    """
+    Split text on '\\n' only, keeping line endings as parse_source does
+
+    :param text: text to split
+    :return: list of lines
+    """
+    parts = text.split("\n")
+    lines = [part + "\n" for part in parts[:-1]]
+    if parts[-1]:
+        lines.append(parts[-1])
+    return lines
+
+
+class IncrementalDocument:
+    """
+    Source code document that is parsed again only from the point of an edit
+
+    Each line is classified as code, comment, opening or closing line.
+    The parser state is stored after each run of lines that starts with an
+    opening line and ends with a code line, on an edit the parser restarts
+    after the last code line before the edit using the stored state.
+    Lines outside of these runs are never passed to the parser.
+
+    Lines are split on '\\n' only and line numbers start at 1.
+
+    A document must not be edited from several threads at once.
+
+    :param text: Initial text of the document
+    :param collect_warnings: Set to False to skip creating warnings,
+                             duplicate blocks still raise ValueError
+    """
+    def __init__(self, text: str = "", *, collect_warnings: bool = True):
+        self.collect_warnings = collect_warnings
+
+        self._lines = _split_lines(text)
+        self._kinds = bytearray(_classify(line) for line in self._lines)
+
+        # Runs of parsed lines as (first index, last index, results, state after)
+        self._runs: list[
+            tuple[
+                int,
+                int,
+                list[tuple[str | None, str | None, list[MetadataWarning], int, int]],
+                _ParserState,
+            ]
+        ] = []
+        self._eof_results: list[
+            tuple[str | None, str | None, list[MetadataWarning], int, int]
+        ] = []
+
+        # Error raised while parsing and the index of the run that raised it
+        self._error: ValueError | None = None
+        self._error_index = 0
+
+        self._reparse(0)
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}("
+            f"<{len(self._lines)} lines>, collect_warnings={self.collect_warnings!r})"
+        )
+
+    @property
+    def text(self) -> str:
+        return "".join(self._lines)
+
+    @property
+    def line_count(self) -> int:
+        return len(self._lines)
+
+    @property
+    def metadata(self) -> ScriptMetadata:
+        """
+        Metadata for the current text, the same as parse_source would give
+
+        :raises ValueError: if the document has a duplicate block
+        """
+        if self._error is not None:
+            raise self._error
+
+        results = [result for run in self._runs for result in run[2]]
+        results.extend(self._eof_results)
+        return _collect_metadata(results)
+
+    def line_kind(self, line_number: int) -> int:
+        """
+        Get the classification of a line
+
+        :param line_number: Line number, starting from 1
+        :return: LineKind value
+        """
+        if not 1 <= line_number <= len(self._lines):
+            raise IndexError(f"Line {line_number} is not in the document.")
+        return self._kinds[line_number - 1]
+
+    def edit(self, start_line: int, end_line: int, new_text: str) -> None:
+        """
+        Replace lines from start_line up to but not including end_line with new_text
+
+        If start_line == end_line the text is inserted before start_line.
+        If new_text does not end with a newline it is joined to the line
+        following the replaced lines.
+
+        :param start_line: First line to replace, starting from 1
+        :param end_line: Line after the last line to replace
+        :param new_text: Replacement text
+        """
+        line_count = len(self._lines)
+        if not 1 <= start_line <= end_line <= line_count + 1:
+            raise IndexError(
+                f"Invalid edit range {start_line}-{end_line} "
+                f"for a document of {line_count} lines."
+            )
+
+        start, end = start_line - 1, end_line - 1
+
+        # Text inserted after a final line with no newline joins onto that line
+        if start > 0 and not self._lines[start - 1].endswith("\n"):
+            start -= 1
+            new_text = self._lines[start] + new_text
+
+        # Text without a final newline joins onto the following line
+        if new_text and not new_text.endswith("\n") and end < line_count:
+            new_text += self._lines[end]
+            end += 1
+
+        new_lines = _split_lines(new_text)
+        self._lines[start:end] = new_lines
+        self._kinds[start:end] = bytes(_classify(line) for line in new_lines)
+
+        self._reparse(start)
+
+    def _reparse(self, first_changed: int) -> None:
+        # The parser is never within a block after a code line
+        restart = self._kinds.rfind(LineKind.CODE, 0, first_changed) + 1
+        if self._error is not None:
+            restart = min(restart, self._error_index)
+
+        keep = 0
+        while keep < len(self._runs) and self._runs[keep][1] < restart:
+            keep += 1
+        del self._runs[keep:]
+
+        state = self._runs[-1][3].copy() if self._runs else _ParserState()
+
+        lines, kinds = self._lines, self._kinds
+        self._error = None
+        self._eof_results = []
+
+        pos = restart
+        try:
+            while (start := kinds.find(LineKind.OPENER, pos)) != -1:
+                end = kinds.find(LineKind.CODE, start)
+                if end == -1:
+                    end = len(lines) - 1
+
+                results = list(
+                    _iter_parse_numbered(
+                        ((i + 1, lines[i]) for i in range(start, end + 1)),
+                        collect_warnings=self.collect_warnings,
+                        state=state,
+                        final=False,
+                    )
+                )
+                self._runs.append((start, end, results, state.copy()))
+                pos = end + 1
+
+            self._eof_results = list(
+                _iter_parse_numbered(
+                    (),
+                    collect_warnings=self.collect_warnings,
+                    state=state,
+                )
+            )
+        except ValueError as e:
+            self._error = e
+            self._error_index = start
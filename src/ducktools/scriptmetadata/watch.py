@@ -0,0 +1,320 @@
+# MIT License
+#
+# Copyright (c) 2023-2025 David C Ellis
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+"""
+Polling watcher keeping an index of the metadata of files in a directory tree.
+
+This module is not imported by ducktools.scriptmetadata
+so it adds nothing to the import time if it is not used.
+"""
+from __future__ import annotations
+
+import os
+import threading
+
+from . import (
+    _DEFAULT_EXCLUDE,
+    ScriptMetadata,
+    _iter_tree_stats,
+    parse_file,
+    parse_files,
+)
+
+try:
+    from _collections_abc import Iterator
+except ImportError:  # pragma: nocover
+    from collections.abc import Iterator
+
+__all__ = [
+    "MetadataWatcher",
+    "WatchEvent",
+    "EventKind",
+]
+
+
+class EventKind:
+    """
+    Type of change reported by a WatchEvent
+    """
+    ADDED = "added"
+    CHANGED = "changed"
+    REMOVED = "removed"
+
+
+class WatchEvent:
+    """
+    Change to a file found by MetadataWatcher.poll
+
+    :param kind: EventKind.ADDED, EventKind.CHANGED or EventKind.REMOVED
+    :param path: Path of the file
+    :param metadata: New metadata of the file, the exception raised while
+                     parsing it, or None if the file was removed
+    """
+    __slots__ = ("kind", "path", "metadata")
+    __match_args__ = ("kind", "path", "metadata")
+
+    kind: str
+    path: str
+    metadata: ScriptMetadata | Exception | None
+
+    def __init__(
+        self,
+        kind: str,
+        path: str,
+        metadata: ScriptMetadata | Exception | None,
+    ):
+        self.kind = kind
+        self.path = path
+        self.metadata = metadata
+
+    def __repr__(self):
+        return (
+            f"{type(self).__name__}("
+            f"kind={self.kind!r}, path={self.path!r}, metadata={self.metadata!r})"
+        )
+
+    def __eq__(self, other):
+        if self.__class__ is other.__class__:
+            return (
+                self.kind == other.kind
+                and self.path == other.path
+                and self.metadata == other.metadata
+            )
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+
+def _same_result(
+    old: ScriptMetadata | Exception,
+    new: ScriptMetadata | Exception,
+) -> bool:
+    if isinstance(old, Exception) and isinstance(new, Exception):
+        return type(old) is type(new) and old.args == new.args
+    if isinstance(old, Exception) or isinstance(new, Exception):
+        return False
+    return old == new
+
+
+class MetadataWatcher:
+    """
+    In memory index of the metadata of python sources in a directory tree,
+    kept up to date by polling.
+
+    Each poll walks the tree with os.scandir and only parses files that are
+    new or whose size, mtime or inode have changed since the last poll.
+    The first poll reports every file as added.
+
+    Queries may be made from other threads while a poll is running,
+    they see the index as it was before the poll until it completes.
+
+    :param root: Directory to watch
+    :param include: Glob patterns a file name must match to be indexed
+    :param exclude: Glob patterns for file and directory names to skip,
+                    by default VCS, cache and virtual environment folders
+    :param follow_symlinks: Follow symbolic links to files and directories
+    :param encoding: Text encoding of the files, None to detect it
+    :param workers: Maximum number of threads used to parse changed files
+    """
+    def __init__(
+        self,
+        root: str | os.PathLike,
+        *,
+        include: tuple[str, ...] = ("*.py",),
+        exclude: tuple[str, ...] = _DEFAULT_EXCLUDE,
+        follow_symlinks: bool = False,
+        encoding: str | None = "utf-8",
+        workers: int | None = None,
+    ):
+        self.root = os.fspath(root)
+        self.include = include
+        self.exclude = exclude
+        self.follow_symlinks = follow_symlinks
+        self.encoding = encoding
+        self.workers = workers
+
+        # Only one poll may update the index at a time
+        self._poll_lock = threading.Lock()
+        self._lock = threading.Lock()
+
+        self._signatures: dict[str, tuple[int, int, int]] = {}
+        self._results: dict[str, ScriptMetadata | Exception] = {}
+        # Paths of the files containing each block name
+        self._block_paths: dict[str, set[str]] = {}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.root!r})"
+
+    def __len__(self):
+        with self._lock:
+            return len(self._results)
+
+    def __contains__(self, path):
+        with self._lock:
+            return path in self._results
+
+    @property
+    def index(self) -> dict[str, ScriptMetadata]:
+        """
+        Metadata of every indexed file that parsed without an error
+        """
+        with self._lock:
+            return {
+                path: result
+                for path, result in self._results.items()
+                if isinstance(result, ScriptMetadata)
+            }
+
+    @property
+    def errors(self) -> dict[str, Exception]:
+        """
+        Exceptions raised while parsing indexed files
+        """
+        with self._lock:
+            return {
+                path: result
+                for path, result in self._results.items()
+                if isinstance(result, Exception)
+            }
+
+    def get(self, path: str) -> ScriptMetadata | Exception | None:
+        """
+        Get the indexed metadata of a file
+
+        :param path: Path of the file as reported in events
+        :return: metadata, the exception raised while parsing or None if not indexed
+        """
+        with self._lock:
+            return self._results.get(path)
+
+    def find(self, block_name: str) -> dict[str, ScriptMetadata]:
+        """
+        Get the files containing a metadata block
+
+        :param block_name: Name of the block, eg: "script"
+        :return: dict of path to metadata for files with the block, sorted by path
+        """
+        with self._lock:
+            return {
+                path: self._results[path]  # type: ignore[misc]
+                for path in sorted(self._block_paths.get(block_name, ()))
+            }
+
+    def poll(self) -> list[WatchEvent]:
+        """
+        Check the tree for changed files and update the index
+
+        Files whose stat signature changed but whose metadata did not are
+        updated silently without an event.
+
+        :return: list of events for added, changed and removed files
+        """
+        with self._poll_lock:
+            return self._poll()
+
+    def _poll(self) -> list[WatchEvent]:
+        signatures: dict[str, tuple[int, int, int]] = {}
+        for path, stat_result in _iter_tree_stats(
+            self.root, self.include, self.exclude, self.follow_symlinks
+        ):
+            signatures[path] = (
+                stat_result.st_size, stat_result.st_mtime_ns, stat_result.st_ino
+            )
+
+        old_signatures = self._signatures
+        to_parse = [
+            path for path, signature in signatures.items()
+            if old_signatures.get(path) != signature
+        ]
+        removed = [path for path in old_signatures if path not in signatures]
+
+        # Stats are taken before parsing, a file changed while it is being
+        # parsed has a new signature and is parsed again on the next poll
+        parsed: dict[str, ScriptMetadata | Exception] = {}
+        if len(to_parse) == 1:
+            # Don't start a thread pool for the common case of a single edit
+            path = to_parse[0]
+            try:
+                parsed[path] = parse_file(path, encoding=self.encoding)
+            except Exception as e:
+                parsed[path] = e
+        elif to_parse:
+            # parse_files gives back the str paths it was given
+            for file_path, result in parse_files(
+                to_parse, encoding=self.encoding, workers=self.workers
+            ):
+                parsed[os.fsdecode(file_path)] = result
+
+        events: list[WatchEvent] = []
+        with self._lock:
+            for path in sorted(removed):
+                self._remove(path)
+                events.append(WatchEvent(EventKind.REMOVED, path, None))
+
+            for path in sorted(parsed):
+                result = parsed[path]
+                old = self._results.get(path)
+                if old is None:
+                    events.append(WatchEvent(EventKind.ADDED, path, result))
+                elif not _same_result(old, result):
+                    events.append(WatchEvent(EventKind.CHANGED, path, result))
+                else:
+                    continue
+                self._remove(path)
+                self._results[path] = result
+                if isinstance(result, ScriptMetadata):
+                    for block_name in result.blocks:
+                        self._block_paths.setdefault(block_name, set()).add(path)
+
+            self._signatures = signatures
+
+        return events
+
+    def _remove(self, path: str) -> None:
+        old = self._results.pop(path, None)
+        if isinstance(old, ScriptMetadata):
+            for block_name in old.blocks:
+                paths = self._block_paths[block_name]
+                paths.discard(path)
+                if not paths:
+                    del self._block_paths[block_name]
+
+    def watch(
+        self,
+        interval: float = 1.0,
+        *,
+        stop: threading.Event | None = None,
+    ) -> Iterator[WatchEvent]:
+        """
+        Poll the tree every 'interval' seconds, yielding events as they are found
+
+        :param interval: Seconds to wait between the end of one poll and the next
+        :param stop: Event that ends the watch when set, otherwise the watch
+                     continues until the generator is closed
+        :yields: events for added, changed and removed files
+        """
+        if stop is None:
+            stop = threading.Event()
+
+        while not stop.is_set():
+            yield from self.poll()
+            stop.wait(interval)
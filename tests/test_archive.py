@@ -0,0 +1,132 @@
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import ParseStats, parse_archive, parse_file
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+
+def _expected(path):
+    try:
+        return parse_file(path)
+    except ValueError as e:
+        return e.args
+
+
+def _results(archive):
+    return {
+        name: (metadata.args if isinstance(metadata, Exception) else metadata)
+        for name, metadata in parse_archive(archive)
+    }
+
+
+@pytest.fixture
+def expected():
+    return {f"pkg/{path.name}": _expected(path) for path in example_paths}
+
+
+@pytest.mark.parametrize("suffix", [".zip", ".whl"])
+def test_zip(suffix, expected, tmp_path):
+    archive = tmp_path / f"archive{suffix}"
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("pkg/", "")
+        for path in example_paths:
+            zf.write(path, f"pkg/{path.name}")
+        zf.writestr("pkg/README.md", "# /// script\n# ///\n")
+
+    assert _results(archive) == expected
+
+
+@pytest.mark.parametrize("mode", ["w", "w:gz", "w:bz2", "w:xz"])
+def test_tar(mode, expected, tmp_path):
+    archive = tmp_path / "archive.tar"
+    with tarfile.open(archive, mode) as tf:
+        for path in example_paths:
+            tf.add(path, f"pkg/{path.name}")
+        tf.add(example_folder, "pkg/dir.py", recursive=False)
+
+    assert _results(archive) == expected
+
+
+def test_include(tmp_path):
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("tool.py", "# /// script\n# a = 1\n# ///\n")
+        zf.writestr("bin/tool", "# /// script\n# b = 2\n# ///\n")
+
+    results = dict(parse_archive(archive, include=("tool",)))
+    assert list(results) == ["bin/tool"]
+    assert results["bin/tool"].blocks == {"script": "b = 2\n"}
+
+
+def test_unmatched_members_not_read(tmp_path):
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_STORED) as zf:
+        zf.writestr("tool.py", "# /// script\n# ///\n")
+        zf.writestr("data.txt", "unmatched member data")
+
+    # Reading the corrupted member would fail the CRC check
+    data = archive.read_bytes()
+    archive.write_bytes(data.replace(b"unmatched member data", b"corrupted member data"))
+    with zipfile.ZipFile(archive) as zf:
+        with pytest.raises(zipfile.BadZipFile):
+            zf.read("data.txt")
+
+    results = dict(parse_archive(archive))
+    assert results["tool.py"].blocks == {"script": ""}
+
+
+def test_members_streamed(tmp_path, monkeypatch):
+    # Larger than a chunk, with '\r\n' pairs split between chunks
+    source = "x = 1\r\n" * 20_000 + "# /// script\r\n# a = 1\r\n# ///\r\n"
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("big.py", source)
+
+    # Members are parsed from a stream instead of being read in full
+    monkeypatch.setattr(zipfile.ZipFile, "read", None)
+    stats = ParseStats()
+    results = dict(parse_archive(archive, encoding=None, stats=stats))
+    assert results["big.py"].blocks == {"script": "a = 1\n"}
+    assert stats.bytes_read == len(source)
+
+
+def test_errors_yielded(tmp_path):
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        zf.writestr("duplicate.py", "# /// script\n# ///\nx\n# /// script\n# ///\n")
+        zf.writestr(
+            "latin1.py",
+            "# coding: latin-1\n# /// script\n# a = 'é'\n# ///\n".encode("latin-1"),
+        )
+        zf.writestr("crlf.py", b"# /// script\r\n# a = 1\r\n# ///\r\n")
+
+    results = dict(parse_archive(archive, encoding=None))
+    assert isinstance(results["duplicate.py"], ValueError)
+    assert results["latin1.py"].blocks == {"script": "a = 'é'\n"}
+    assert results["crlf.py"].blocks == {"script": "a = 1\n"}
+
+    results = dict(parse_archive(archive))
+    assert isinstance(results["latin1.py"], UnicodeDecodeError)
+
+
+def test_stats(tmp_path):
+    archive = tmp_path / "archive.zip"
+    with zipfile.ZipFile(archive, "w") as zf:
+        for path in example_paths:
+            zf.write(path, path.name)
+
+    stats = ParseStats()
+    list(parse_archive(archive, stats=stats))
+    assert stats.bytes_read == sum(path.stat().st_size for path in example_paths)
+
+
+def test_not_an_archive(tmp_path):
+    path = tmp_path / "script.py"
+    path.write_text("# /// script\n# ///\n")
+    with pytest.raises(ValueError, match="not a zip or tar archive"):
+        list(parse_archive(path))
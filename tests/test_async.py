@@ -0,0 +1,85 @@
+import asyncio
+import io
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import (
+    aiter_parse,
+    iter_parse,
+    parse_file,
+    parse_files_async,
+)
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+
+async def _alines(lines):
+    for line in lines:
+        await asyncio.sleep(0)
+        yield line
+
+
+async def _collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+def _sync_result(src, **kwargs):
+    try:
+        return list(iter_parse(io.StringIO(src), **kwargs))
+    except ValueError as e:
+        return e
+
+
+@pytest.mark.parametrize("test_file", example_paths, ids=lambda p: p.name)
+@pytest.mark.parametrize("as_bytes", [False, True])
+def test_aiter_parse_matches_iter_parse(test_file, as_bytes):
+    src = test_file.read_text()
+    lines = src.splitlines(keepends=True)
+    if as_bytes:
+        lines = [line.encode("utf-8") for line in lines]
+
+    expected = _sync_result(src, start_line=5)
+    if isinstance(expected, ValueError):
+        with pytest.raises(ValueError) as exc_info:
+            asyncio.run(_collect(aiter_parse(_alines(lines), start_line=5)))
+        assert exc_info.value.args == expected.args
+    else:
+        assert asyncio.run(_collect(aiter_parse(_alines(lines), start_line=5))) == expected
+
+
+def test_aiter_parse_stream_reader():
+    src = (example_folder / "pep-723-sample.py").read_bytes()
+
+    async def run():
+        reader = asyncio.StreamReader()
+        reader.feed_data(src)
+        reader.feed_eof()
+        return await _collect(aiter_parse(reader))
+
+    assert asyncio.run(run()) == list(iter_parse(io.StringIO(src.decode("utf-8"))))
+
+
+@pytest.mark.parametrize("limit", [1, 3, 100])
+def test_parse_files_async(limit):
+    results = asyncio.run(_collect(parse_files_async(example_paths, limit=limit)))
+    results = dict(results)
+
+    assert results.keys() == set(example_paths)
+    for path, result in results.items():
+        try:
+            expected = parse_file(path)
+        except ValueError as e:
+            assert type(result) is ValueError
+            assert result.args == e.args
+        else:
+            assert result == expected
+
+
+def test_parse_files_async_missing(tmp_path):
+    missing = tmp_path / "missing.py"
+    [(path, result)] = asyncio.run(_collect(parse_files_async([missing])))
+
+    assert path == missing
+    assert isinstance(result, FileNotFoundError)
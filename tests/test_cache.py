@@ -0,0 +1,275 @@
+import shutil
+import sqlite3
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import parse_file, parse_source
+from ducktools.scriptmetadata.cache import ContentCache, MemoryCache, MetadataCache
+
+example_folder = Path(__file__).parent / "example_files"
+
+
+@pytest.fixture
+def script(tmp_path):
+    pth = tmp_path / "script.py"
+    shutil.copy(example_folder / "pep-723-sample.py", pth)
+    return pth
+
+
+@pytest.fixture
+def cache(tmp_path):
+    with MetadataCache(tmp_path / "cache.sqlite") as c:
+        yield c
+
+
+class TestMetadataCache:
+    def test_roundtrip(self, cache, script):
+        assert cache.get(script) is None
+
+        metadata = cache.parse_file(script)
+        assert metadata == parse_file(script)
+        assert cache.get(script) == metadata
+        assert len(cache) == 1
+
+    def test_warnings_roundtrip(self, cache):
+        test_file = example_folder / "multiple_block_warnings.py"
+        metadata = cache.parse_file(test_file)
+
+        assert metadata.warnings
+        cached = cache.get(test_file)
+        assert cached == metadata
+        assert [w.code for w in cached.warnings] == [w.code for w in metadata.warnings]
+
+    def test_changed_file(self, cache, script):
+        cache.parse_file(script)
+
+        script.write_text("# /// script\n# changed\n# ///\n")
+        assert cache.get(script) is None
+        assert cache.parse_file(script).blocks == {"script": "changed\n"}
+
+    def test_persistent(self, tmp_path, script):
+        db = tmp_path / "persist.sqlite"
+        with MetadataCache(db) as c:
+            metadata = c.parse_file(script)
+
+        with MetadataCache(db) as c:
+            assert c.get(script) == metadata
+
+    def test_old_schema_rebuilt(self, tmp_path, script):
+        db = tmp_path / "old.sqlite"
+        # Table layout written by earlier versions without a user_version
+        with sqlite3.connect(db) as connection:
+            connection.execute(
+                "CREATE TABLE metadata ("
+                "path TEXT NOT NULL, encoding TEXT NOT NULL, size INTEGER NOT NULL, "
+                "mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, data TEXT NOT NULL, "
+                "PRIMARY KEY (path, encoding))"
+            )
+            stat = script.stat()
+            connection.execute(
+                "INSERT INTO metadata VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    str(script.absolute()), "utf-8",
+                    stat.st_size, stat.st_mtime_ns, stat.st_ino,
+                    '{"blocks": {"script": ""}, "warnings": [[1, "old"]]}',
+                ),
+            )
+        connection.close()
+
+        with MetadataCache(db) as c:
+            assert len(c) == 0
+            assert c.get(script) is None
+            assert c.parse_file(script) == parse_file(script)
+
+        with sqlite3.connect(db) as connection:
+            (user_version,) = connection.execute("PRAGMA user_version").fetchone()
+        connection.close()
+        assert user_version > 0
+
+    def test_encoding_in_key(self, cache, tmp_path):
+        pth = tmp_path / "latin.py"
+        pth.write_bytes("# /// script\n# café\n# ///\n".encode("latin-1"))
+
+        assert cache.parse_file(pth, encoding="latin-1").blocks == {"script": "café\n"}
+        assert cache.get(pth) is None
+        with pytest.raises(UnicodeDecodeError):
+            cache.parse_file(pth, encoding="utf-8")
+
+        assert cache.get(pth, encoding="latin-1") is not None
+        cache.invalidate(pth)
+        assert len(cache) == 0
+
+    def test_get_many(self, cache, script, tmp_path):
+        other = tmp_path / "other.py"
+        shutil.copy(example_folder / "basic_alternate_example.py", other)
+        cache.parse_file(script)
+
+        missing = tmp_path / "missing.py"
+        assert cache.get_many([script, other, missing]) == {script: parse_file(script)}
+
+    def test_parse_files(self, cache, script):
+        repeated = example_folder / "invalid_repeated_block.py"
+
+        first = dict(cache.parse_files([script, repeated]))
+        assert first[script] == parse_file(script)
+        assert isinstance(first[repeated], ValueError)
+
+        assert cache.get_many([script, repeated]) == {script: first[script]}
+
+    def test_invalidate_clear(self, cache, script):
+        cache.parse_file(script)
+        cache.invalidate(script)
+        assert cache.get(script) is None
+
+        cache.parse_file(script)
+        cache.clear()
+        assert len(cache) == 0
+
+    def test_lru_eviction(self, tmp_path):
+        paths = []
+        for i in range(4):
+            pth = tmp_path / f"script_{i}.py"
+            pth.write_text(f"# /// script\n# {'x' * 100}{i}\n# ///\n")
+            paths.append(pth)
+
+        with MetadataCache(tmp_path / "lru.sqlite", max_size=450) as c:
+            c.parse_file(paths[0])
+            c.parse_file(paths[1])
+            c.parse_file(paths[2])
+            # Use the first entry so the second is the least recently used
+            assert c.get(paths[0]) is not None
+            c.parse_file(paths[3])
+
+            assert set(c.get_many(paths)) == {paths[0], paths[2], paths[3]}
+
+    @pytest.mark.parametrize("max_size", [None, 10_000])
+    def test_hits_not_written(self, tmp_path, script, max_size):
+        with MetadataCache(tmp_path / "hits.sqlite", max_size=max_size) as c:
+            c.parse_file(script)
+            changes = c._connection.total_changes
+            assert c.get(script) is not None
+            assert c.get_many([script])
+            assert list(c.parse_files([script]))
+            assert c._connection.total_changes == changes
+
+            # Hits are only tracked for eviction and written in one update
+            c.evict(10_000)
+            expected = 0 if max_size is None else 1
+            assert c._connection.total_changes == changes + expected
+
+
+class TestMemoryCache:
+    def test_cached(self, script):
+        cache = MemoryCache()
+        metadata = cache.parse_file(script)
+        assert metadata == parse_file(script)
+
+        # Cached values are copies
+        metadata.blocks.clear()
+        metadata.warnings.append("Modified")
+        assert cache.parse_file(script) == parse_file(script)
+        assert len(cache) == 1
+
+    def test_revalidate(self, script):
+        cache = MemoryCache()
+        cache.parse_file(script)
+
+        script.write_text("# /// script\n# changed\n# ///\n")
+        assert cache.parse_file(script).blocks == {"script": "changed\n"}
+
+    def test_lru_eviction(self, tmp_path):
+        paths = []
+        for i in range(3):
+            pth = tmp_path / f"script_{i}.py"
+            pth.write_text(f"# /// script\n# {i}\n# ///\n")
+            paths.append(pth)
+
+        cache = MemoryCache(max_entries=2)
+        cache.parse_file(paths[0])
+        cache.parse_file(paths[1])
+        cache.parse_file(paths[0])
+        cache.parse_file(paths[2])
+
+        assert len(cache) == 2
+        assert [k[0] for k in cache._entries] == [str(paths[0]), str(paths[2])]
+
+    def test_invalidate_clear(self, script):
+        cache = MemoryCache()
+        cache.parse_file(script)
+        cache.invalidate(script)
+        assert len(cache) == 0
+
+        cache.parse_file(script)
+        cache.clear()
+        assert len(cache) == 0
+
+
+class TestContentCache:
+    def test_shared_file(self, script, tmp_path):
+        copy = tmp_path / "copy.py"
+        shutil.copy(script, copy)
+
+        cache = ContentCache()
+        metadata = cache.parse_file(script)
+        assert metadata == parse_file(script)
+        assert cache.parse_file(copy) is metadata
+        assert (cache.hits, cache.misses) == (1, 1)
+
+        copy.write_text("# /// script\n# changed\n# ///\n")
+        assert cache.parse_file(copy).blocks == {"script": "changed\n"}
+        assert len(cache) == 2
+
+    @pytest.mark.parametrize("encoding", ["utf-8", None])
+    def test_files(self, encoding):
+        cache = ContentCache()
+        for path in sorted(example_folder.glob("*.py")):
+            try:
+                expected = parse_file(path, encoding=encoding)
+            except ValueError:
+                with pytest.raises(ValueError):
+                    cache.parse_file(path, encoding=encoding)
+            else:
+                assert cache.parse_file(path, encoding=encoding) == expected
+
+    def test_source_start_line(self):
+        source = (example_folder / "multiple_block_warnings.py").read_text()
+        cache = ContentCache()
+
+        metadata = cache.parse_source(source)
+        assert metadata.warnings
+        assert cache.parse_source(source) is metadata
+
+        shifted = cache.parse_source(source, start_line=10)
+        assert shifted == parse_source(source, start_line=10)
+        assert shifted.blocks is metadata.blocks
+        # The cached result is unchanged
+        assert cache.parse_source(source) == parse_source(source)
+        assert cache.hits == 3
+
+    def test_errors_not_cached(self):
+        source = "# /// script\n# ///\nx\n# /// script\n# ///\n"
+        cache = ContentCache()
+        for start_line in [1, 5]:
+            with pytest.raises(ValueError, match=f"Line {start_line + 3}:"):
+                cache.parse_source("\n" * (start_line - 1) + source)
+        assert len(cache) == 0
+
+    def test_error_start_line(self):
+        source = "# /// script\n# ///\nx\n# /// script\n# ///\n"
+        cache = ContentCache()
+        with pytest.raises(ValueError) as expected:
+            parse_source(source, start_line=10)
+        with pytest.raises(ValueError, match="Line 13:") as result:
+            cache.parse_source(source, start_line=10)
+        assert result.value.args == expected.value.args
+
+    def test_lru_eviction(self):
+        cache = ContentCache(max_entries=2)
+        for source in ["a\n", "b\n", "a\n", "c\n"]:
+            cache.parse_source(source)
+        assert len(cache) == 2
+        assert cache.hits == 1
+
+        cache.clear()
+        assert len(cache) == cache.hits == cache.misses == 0
@@ -0,0 +1,103 @@
+import io
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import parse_file
+from ducktools.scriptmetadata.__main__ import main
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+
+def _run(capsys, *args):
+    exit_code = main([str(arg) for arg in args])
+    out = capsys.readouterr().out
+    records = [json.loads(line) for line in out.splitlines()]
+    return exit_code, {record["path"]: record for record in records}
+
+
+def _expected(path):
+    try:
+        return parse_file(path)
+    except ValueError:
+        return None
+
+
+def test_files(capsys):
+    exit_code, records = _run(capsys, *example_paths)
+
+    assert len(records) == len(example_paths)
+    for path in example_paths:
+        record = records[str(path)]
+        assert record["time_ms"] >= 0
+
+        expected = _expected(path)
+        if expected is None:
+            assert record["error"]["type"] == "ValueError"
+            assert exit_code == 1
+        else:
+            assert record["blocks"] == expected.blocks
+            assert record["warnings"] == [
+                {"line": w.line_number, "code": w.code, "message": w.message}
+                for w in expected.warnings
+            ]
+
+
+@pytest.mark.parametrize("workers", ["1", "4"])
+def test_directory(capsys, workers):
+    _, records = _run(capsys, example_folder, "-j", workers, "--chunksize", "3")
+    assert set(records) == {str(path) for path in example_paths}
+
+
+def test_directory_empty_file(tmp_path, capsys):
+    empty = tmp_path / "empty.py"
+    empty.write_text("")
+
+    exit_code, records = _run(capsys, tmp_path)
+    assert exit_code == 0
+    assert set(records) == {str(empty)}
+    assert records[str(empty)]["blocks"] == {}
+
+
+def test_stdin(capsys, monkeypatch):
+    paths = example_paths[:3]
+    monkeypatch.setattr(sys, "stdin", io.StringIO("".join(f"{p}\n" for p in paths)))
+    _, records = _run(capsys, "-")
+    assert set(records) == {str(path) for path in paths}
+
+
+def test_only_metadata(tmp_path, capsys):
+    no_metadata = tmp_path / "no_metadata.py"
+    no_metadata.write_text("print('hello')\n")
+    metadata = tmp_path / "metadata.py"
+    metadata.write_text("# /// script\n# ///\n")
+
+    _, records = _run(capsys, tmp_path, "--only-metadata")
+    assert set(records) == {str(metadata)}
+
+
+def test_missing_file(tmp_path, capsys):
+    missing = tmp_path / "missing.py"
+    exit_code, records = _run(capsys, missing)
+
+    assert exit_code == 1
+    assert records[str(missing)]["error"]["type"] == "FileNotFoundError"
+
+
+def test_invalid_workers(capsys):
+    with pytest.raises(SystemExit):
+        main(["-j", "0", str(example_folder)])
+
+
+def test_module_entry_point():
+    result = subprocess.run(
+        [sys.executable, "-m", "ducktools.scriptmetadata", "--executor", "process", str(example_paths[0])],
+        capture_output=True,
+        text=True,
+    )
+    record = json.loads(result.stdout)
+    assert record["path"] == str(example_paths[0])
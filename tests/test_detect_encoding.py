@@ -0,0 +1,163 @@
+import codecs
+import io
+import json
+import tokenize
+
+import pytest
+
+from ducktools.scriptmetadata import (
+    _BYTES_SAFE_ENCODINGS,
+    _detect_encoding,
+    parse_file,
+)
+from ducktools.scriptmetadata.__main__ import main
+
+ENGINES = ["auto", "statemachine", "regex", "bytes"]
+
+headers = [
+    b"",
+    b"\n",
+    b"print()\n",
+    b"# -*- coding: latin-1 -*-\n",
+    b"# vim: set fileencoding=cp1251 :\n",
+    b"#!/usr/bin/env python\n# coding=shift_jis\n",
+    b"#!/usr/bin/env python\n\n# coding: latin-1\n",
+    b"\n# coding: koi8-r\n",
+    b"print()\n# coding: latin-1\n",
+    b"# coding: UTF-8\n",
+    b"# coding: utf_8\n",
+    b"# coding: latin_1\n",
+    b"# coding: iso-latin-1-unix\n",
+    b"# coding:latin-1",
+    b"# encoding: cp1252\r\n",
+    b"# no coding here\n# coding utf-8\n",
+    b"# codingcoding: cp1252\n",
+    b"\xef\xbb\xbf",
+    b"\xef\xbb\xbfprint()\n",
+    b"\xef\xbb\xbf# coding: utf-8\n",
+    b"\xef\xbb\xbf#\n# coding: utf-8\n",
+]
+
+bad_headers = [
+    b"# coding: unknown-encoding\n",
+    b"\xef\xbb\xbf# coding: latin-1\n",
+    b"# \xff\n",
+    b"#\n\xff\n",
+]
+
+
+@pytest.mark.parametrize("header", headers)
+def test_matches_tokenize(header):
+    expected, _ = tokenize.detect_encoding(io.BytesIO(header).readline)
+    if header.endswith(b"\n"):
+        header += b"x = 1\n"
+    encoding, bom_len = _detect_encoding(header)
+    assert encoding == expected
+    assert bom_len == (3 if header.startswith(codecs.BOM_UTF8) else 0)
+
+
+@pytest.mark.parametrize("header", bad_headers)
+def test_bad_header(header):
+    with pytest.raises(SyntaxError):
+        tokenize.detect_encoding(io.BytesIO(header).readline)
+    with pytest.raises(SyntaxError):
+        _detect_encoding(header)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize(
+    "encoding, text",
+    [
+        ("cp1251", "Привет"),
+        ("latin-1", "café"),
+        ("shift_jis", "ソース表示"),
+        ("koi8-r", "данные"),
+        ("utf-16", "ūnicode"),
+    ],
+)
+def test_parse_file_cookie(engine, encoding, text, tmp_path):
+    source = (
+        f"# -*- coding: {encoding} -*-\n"
+        f"# {text}\n"
+        f"# /// script\n"
+        f"# name = '{text}'\n"
+        f"# ///\n"
+    )
+    path = tmp_path / "script.py"
+    if encoding == "utf-16":
+        # UTF-16 is not ASCII compatible so the cookie is not valid UTF-8
+        path.write_bytes(source.encode("utf-16"))
+        with pytest.raises(SyntaxError):
+            parse_file(path, encoding=None, engine=engine)
+        return
+
+    path.write_bytes(source.encode(encoding))
+
+    metadata = parse_file(path, encoding=None, engine=engine)
+    assert metadata.blocks == {"script": f"name = '{text}'\n"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("newline", ["\n", "\r\n"])
+def test_parse_file_bom(engine, newline, tmp_path):
+    source = "# /// script\n# name = 'é'\n# ///\n"
+    path = tmp_path / "script.py"
+    path.write_text(source, encoding="utf-8-sig", newline=newline)
+
+    # The BOM is not part of the first line so the block is found
+    metadata = parse_file(path, encoding=None, engine=engine)
+    assert metadata.blocks == {"script": "name = 'é'\n"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_parse_file_large(engine, tmp_path):
+    # Larger than the size where auto memory maps the file
+    source = "# coding: cp1251\n" + "x = 1\n" * 20_000 + "# /// script\n# a = 'ж'\n# ///\n"
+    path = tmp_path / "large.py"
+    path.write_bytes(source.encode("cp1251"))
+
+    metadata = parse_file(path, encoding=None, engine=engine)
+    assert metadata.blocks == {"script": "a = 'ж'\n"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_parse_file_default(engine, tmp_path):
+    source = "# /// script\n# a = 'é'\n# ///\n"
+    path = tmp_path / "script.py"
+    path.write_text(source, encoding="utf-8")
+
+    metadata = parse_file(path, encoding=None, engine=engine)
+    assert metadata == parse_file(path, engine=engine)
+
+
+# Encoding every character with errors="ignore" is slow as nearly every
+# character outside of the BMP is an error, so these are only checked
+# for the encodings that can encode them
+BMP_TEXT = "".join(chr(c) for c in range(0x80, 0x10000) if not 0xD800 <= c <= 0xDFFF)
+SUPPLEMENTARY_TEXT = "".join(chr(c) for c in range(0x10000, 0x110000))
+
+
+@pytest.mark.parametrize("encoding", sorted(_BYTES_SAFE_ENCODINGS))
+def test_bytes_safe_encodings(encoding):
+    # The bytes engine searches for these bytes without decoding,
+    # they must never appear as part of a non ASCII character
+    unsafe = set(b"\n\r #/")
+
+    # The encodings are stateless so characters that can't be encoded
+    # can be dropped without changing the encoding of the others
+    assert not unsafe.intersection(BMP_TEXT.encode(encoding, errors="ignore"))
+
+    # The other encodings only map characters in the BMP
+    if encoding in ("utf-8", "gb18030"):
+        assert not unsafe.intersection(SUPPLEMENTARY_TEXT.encode(encoding))
+
+
+def test_cli_detect(tmp_path, capsys):
+    path = tmp_path / "script.py"
+    path.write_bytes(
+        "# coding: cp1251\n# /// script\n# a = 'ж'\n# ///\n".encode("cp1251")
+    )
+
+    assert main(["--encoding", "detect", str(path)]) == 0
+    record = json.loads(capsys.readouterr().out)
+    assert record["blocks"] == {"script": "a = 'ж'\n"}
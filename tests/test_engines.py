@@ -0,0 +1,153 @@
+from pathlib import Path
+
+import pytest
+
+from ducktools import scriptmetadata
+from ducktools.scriptmetadata import parse_file, parse_iterable, parse_source
+import compliance_data
+
+ENGINES = ["auto", "statemachine", "regex", "bytes"]
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+compliance_paths = [
+    Path(getattr(compliance_data, name).__file__) for name in dir(compliance_data)
+]
+
+# Sources where the engines find lines in different ways
+edge_sources = [
+    "",
+    "\n",
+    "# /// script",
+    "# /// script\n",
+    "# /// script\n# ///",
+    "# /// script\n# ///\n",
+    "# /// script\n# a = 1\n# ///\nprint()",
+    "print()\n# /// script\n# a = 1\n# ///\n#\n",
+    "print()\n# /// script\n# a = 1\n",
+    "x\n# /// script\n# ///\n# /// tool\n# ///\n",
+    "x\n# /// script\n#\t\n# ///   \n\n# /// bad!\n# ///\n",
+    "# /// script\n# ///\nx\n\n\n# /// script\n# ///\n",
+    "#\n# ///\n# /// tool\n# /// inner\n# ///\n#",
+    "é\n# /// script\n# name = 'é'\n# ///\n",
+]
+
+
+def _result(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except ValueError as e:
+        return e.args
+
+
+def _reference(path):
+    with open(path, encoding="utf-8") as f:
+        return _result(parse_iterable, f)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize(
+    "path", compliance_paths + example_paths, ids=lambda p: p.name
+)
+def test_parse_file(engine, path):
+    assert _result(parse_file, path, engine=engine) == _reference(path)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize(
+    "path", compliance_paths + example_paths, ids=lambda p: p.name
+)
+def test_parse_source(engine, path):
+    source = path.read_text()
+    assert _result(parse_source, source, engine=engine) == _reference(path)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("source", edge_sources)
+def test_edge_cases(engine, source, tmp_path):
+    expected = _result(parse_iterable, source.splitlines(keepends=True))
+    assert _result(parse_source, source, engine=engine) == expected
+    assert _result(parse_source, source, start_line=5, engine=engine) == _result(
+        parse_iterable, source.splitlines(keepends=True), start_line=5
+    )
+
+    path = tmp_path / "source.py"
+    for newline in ["\n", "\r\n", "\r"]:
+        path.write_text(source, encoding="utf-8", newline=newline)
+        assert _result(parse_file, path, engine=engine) == expected
+
+
+# Files where carriage returns first appear part way through
+mixed_newline_sources = [
+    b"# /// script\n# a = 1\n# ///\nx\r# /// tool\r# ///\r",
+    b"x\ny\rz\n# /// script\n# ///\n",
+    b"x\n# /// script\n# a = 1\r\n# ///\r\n",
+    b"x\n# /// script\n# a = 1\r# ///\ny\n",
+    b"x\n# /// script\n# ///\n\r# /// script\n# ///\n",
+    b"x\n# /// script\n# ///\ny\rz\n",
+]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("source", mixed_newline_sources)
+def test_mixed_newlines(engine, source, tmp_path):
+    path = tmp_path / "source.py"
+    path.write_bytes(source)
+    assert _result(parse_file, path, engine=engine) == _reference(path)
+
+
+@pytest.mark.parametrize("source", mixed_newline_sources)
+def test_mixed_newlines_small_chunks(source, tmp_path, monkeypatch):
+    # Lines and '\r\n' pairs split between the chunks that are decoded
+    monkeypatch.setattr(scriptmetadata, "_TRANSLATE_CHUNK_SIZE", 3)
+    path = tmp_path / "source.py"
+    path.write_bytes(source)
+    assert _result(parse_file, path, engine="bytes") == _reference(path)
+
+
+@pytest.mark.parametrize("engine", ["auto", "bytes"])
+@pytest.mark.parametrize("newline", [b"\n", b"\r\n"])
+def test_stop_early_skips_rest_of_file(engine, newline, tmp_path):
+    # Data after the block is not read, so the invalid line is never decoded
+    source = b"# /// script\n# ///\nx\n" + b"y\n" * 100_000 + b"\xff\r\n"
+    path = tmp_path / "source.py"
+    path.write_bytes(source.replace(b"\n", newline))
+
+    metadata = parse_file(path, blocks={"script"}, stop_early=True, engine=engine)
+    assert metadata.blocks == {"script": ""}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_large_file(engine, tmp_path):
+    # Larger than the size where auto memory maps the file
+    source = "x = 1\n" * 20_000 + "# /// script\n# a = 1\n# ///\n"
+    path = tmp_path / "large.py"
+    path.write_text(source)
+
+    metadata = parse_file(path, engine=engine)
+    assert metadata.blocks == {"script": "a = 1\n"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_other_encoding(engine, tmp_path):
+    source = "# /// script\n# name = 'é'\n# ///\n"
+    path = tmp_path / "utf16.py"
+    path.write_text(source, encoding="utf-16")
+
+    metadata = parse_file(path, encoding="utf-16", engine=engine)
+    assert metadata.blocks == {"script": "name = 'é'\n"}
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_stop_early(engine):
+    source = "# /// script\n# ///\nx\n# /// script\n# ///\n"
+    metadata = parse_source(source, blocks={"script"}, stop_early=True, engine=engine)
+    assert metadata.blocks == {"script": ""}
+
+
+def test_unknown_engine(tmp_path):
+    with pytest.raises(ValueError, match="Unknown engine"):
+        parse_source("", engine="fast")
+    with pytest.raises(ValueError, match="Unknown engine"):
+        parse_file(tmp_path / "missing.py", engine="fast")
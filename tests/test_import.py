@@ -0,0 +1,29 @@
+import importlib.util
+import subprocess
+import sys
+from pathlib import Path
+
+# The list of slow modules is kept in the import time check script
+_import_time_path = Path(__file__).parents[1] / "perf" / "import_time.py"
+_spec = importlib.util.spec_from_file_location("import_time", _import_time_path)
+import_time = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(import_time)
+
+
+def test_no_slow_imports():
+    code = (
+        "import sys\n"
+        "before = set(sys.modules)\n"
+        "import ducktools.scriptmetadata\n"
+        "print('\\n'.join(sorted(set(sys.modules) - before)))\n"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    imported = set(result.stdout.splitlines())
+
+    assert "ducktools.scriptmetadata" in imported
+    assert imported.isdisjoint(import_time.SLOW_MODULES)
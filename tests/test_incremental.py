@@ -0,0 +1,135 @@
+import random
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import parse_source
+from ducktools.scriptmetadata.incremental import IncrementalDocument, LineKind
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+# Lines used to build random edits
+edit_lines = [
+    "# /// script\n",
+    "# /// tool\n",
+    "# /// invalid name!\n",
+    "# ///\n",
+    "# requires-python = '>=3.12'\n",
+    "#\n",
+    "#not metadata\n",
+    "print('hello')\n",
+    "\n",
+]
+
+
+def _assert_matches(doc):
+    try:
+        expected = parse_source(doc.text)
+    except ValueError as e:
+        with pytest.raises(ValueError) as exc_info:
+            doc.metadata
+        assert exc_info.value.args == e.args
+    else:
+        assert doc.metadata == expected
+
+
+@pytest.mark.parametrize("test_file", example_paths, ids=lambda p: p.name)
+def test_matches_parse_source(test_file):
+    doc = IncrementalDocument(test_file.read_text())
+    _assert_matches(doc)
+
+
+@pytest.mark.parametrize("test_file", example_paths, ids=lambda p: p.name)
+def test_random_edits(test_file):
+    rng = random.Random(test_file.name)
+    doc = IncrementalDocument(test_file.read_text())
+
+    for _ in range(50):
+        start = rng.randint(1, doc.line_count + 1)
+        end = rng.randint(start, min(start + 3, doc.line_count + 1))
+        new_text = "".join(rng.choices(edit_lines, k=rng.randint(0, 4)))
+        if rng.random() < 0.2:
+            new_text = new_text.rstrip("\n")
+
+        doc.edit(start, end, new_text)
+        _assert_matches(doc)
+
+
+def test_edit_text():
+    doc = IncrementalDocument("a\nb\nc")
+    doc.edit(2, 3, "x\ny\n")
+    assert doc.text == "a\nx\ny\nc"
+
+    # Insert without a newline joins the following line
+    doc.edit(1, 1, "z")
+    assert doc.text == "za\nx\ny\nc"
+
+    # Insert after a final line without a newline joins that line
+    doc.edit(5, 5, "d\n")
+    assert doc.text == "za\nx\ny\ncd\n"
+
+    # Delete lines
+    doc.edit(2, 4, "")
+    assert doc.text == "za\ncd\n"
+
+
+def test_edit_range():
+    doc = IncrementalDocument("a\nb\n")
+    with pytest.raises(IndexError):
+        doc.edit(0, 1, "")
+    with pytest.raises(IndexError):
+        doc.edit(2, 1, "")
+    with pytest.raises(IndexError):
+        doc.edit(3, 4, "")
+
+
+def test_line_kinds():
+    src = (
+        "# /// script\n"
+        "# dependencies = []\n"
+        "# ///\n"
+        "import sys\n"
+    )
+    doc = IncrementalDocument(src)
+    kinds = [doc.line_kind(i) for i in range(1, doc.line_count + 1)]
+    assert kinds == [LineKind.OPENER, LineKind.COMMENT, LineKind.CLOSER, LineKind.CODE]
+
+    with pytest.raises(IndexError):
+        doc.line_kind(5)
+
+
+def test_close_block_by_edit():
+    src = (
+        "# /// script\n"
+        "# dependencies = []\n"
+        "import sys\n"
+    )
+    doc = IncrementalDocument(src)
+    assert doc.metadata.blocks == {}
+    assert len(doc.metadata.warnings) == 1
+
+    doc.edit(3, 3, "# ///\n")
+    assert doc.metadata.blocks == {"script": "dependencies = []\n"}
+    assert doc.metadata.warnings == []
+
+
+def test_duplicate_block_removed_by_edit():
+    src = (
+        "# /// script\n"
+        "# ///\n"
+        "\n"
+        "# /// script\n"
+        "# ///\n"
+    )
+    doc = IncrementalDocument(src)
+    with pytest.raises(ValueError):
+        doc.metadata
+
+    # Edit after the duplicate block must still parse it again
+    doc.edit(6, 6, "print()\n")
+    with pytest.raises(ValueError):
+        doc.metadata
+
+    doc.edit(4, 6, "")
+    assert doc.metadata.blocks == {"script": ""}
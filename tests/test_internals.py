@@ -1,9 +1,17 @@
 from ducktools.scriptmetadata import (
     _is_valid_type,
+    has_metadata_file,
+    has_metadata_source,
+    iter_parse,
+    iter_spans,
     parse_file,
+    parse_iterable,
+    parse_source,
     ScriptMetadata,
     MetadataWarning,
+    WarningCode,
 )
+import io
 from pathlib import Path
 
 
@@ -106,6 +114,43 @@ def test_metadata_str():
     assert str(ex) == "Line 1: Mismatch"
 
 
+class TestWarningCodes:
+    def test_codes(self):
+        metadata = parse_file(example_folder / "pep-723-sample-noclose.py")
+        assert [w.code for w in metadata.warnings] == [WarningCode.UNCLOSED_BLOCK]
+        assert metadata.warnings[0].block_names == ("script",)
+
+        metadata = parse_file(example_folder / "multiple_block_warnings.py")
+        assert [w.code for w in metadata.warnings] == [WarningCode.NEW_BLOCK_BEFORE_CLOSE]
+        assert metadata.warnings[0].block_names == ("text", "some-toml")
+
+        metadata = parse_file(example_folder / "invalid_block_name.py")
+        assert [w.code for w in metadata.warnings] == [WarningCode.INVALID_BLOCK_NAME]
+
+    def test_lazy_message(self):
+        warning = MetadataWarning(3, code=WarningCode.UNCLOSED_BLOCK, block_names=("script",))
+        assert warning._message is None
+        assert warning.message.startswith("Potential unclosed block 'script' detected.")
+        assert warning._message is not None
+
+    def test_eq_repr(self):
+        warning = MetadataWarning(3, code=WarningCode.UNCLOSED_BLOCK, block_names=("script",))
+        rebuilt = eval(repr(warning), {"MetadataWarning": MetadataWarning})
+
+        assert rebuilt == warning
+        assert rebuilt != MetadataWarning(4, warning.message)
+        assert warning != "Not a warning"
+
+    def test_message_required(self):
+        with pytest.raises(TypeError):
+            MetadataWarning(1)
+
+    def test_slots(self):
+        warning = MetadataWarning(1, "Mismatch")
+        with pytest.raises(AttributeError):
+            warning.extra = "value"
+
+
 def test_valid_types():
     assert _is_valid_type("pyproject")
     assert _is_valid_type("test-example123")
@@ -114,3 +159,252 @@ def test_valid_types():
     assert not _is_valid_type("pyproject.toml")
     assert not _is_valid_type("random$extra!characters")
     assert not _is_valid_type("\"internalquotes\"")
+
+
+class TestBytesParser:
+    # parse_file searches the raw bytes, this should always match
+    # the output of the line by line text parser
+    @pytest.mark.parametrize(
+        "test_file",
+        sorted(example_folder.glob("*.py")),
+        ids=lambda p: p.name,
+    )
+    def test_matches_text_parser(self, test_file):
+        with open(test_file, "r", encoding="utf-8") as f:
+            try:
+                text_metadata = parse_iterable(f)
+            except ValueError as e:
+                with pytest.raises(ValueError) as exc_info:
+                    parse_file(test_file)
+                assert exc_info.value.args == e.args
+                return
+
+        assert parse_file(test_file) == text_metadata
+
+    def test_crlf_file(self, tmp_path):
+        src = (example_folder / "pep-723-sample.py").read_text()
+        test_file = tmp_path / "crlf.py"
+        test_file.write_bytes(src.encode("utf-8").replace(b"\n", b"\r\n"))
+
+        assert parse_file(test_file) == parse_file(example_folder / "pep-723-sample.py")
+
+    def test_empty_file(self, tmp_path):
+        test_file = tmp_path / "empty.py"
+        test_file.write_bytes(b"")
+
+        assert parse_file(test_file) == ScriptMetadata({}, [])
+
+    def test_unclosed_block_line_numbers(self, tmp_path):
+        src = "import sys\n\n# /// script\n# data\nprint('hi')\n# /// tool\n# data"
+        test_file = tmp_path / "unclosed.py"
+        test_file.write_text(src)
+
+        metadata = parse_file(test_file)
+        assert [w.line_number for w in metadata.warnings] == [5, 7]
+
+
+class TestSourceParser:
+    # parse_source searches the string, this should always match
+    # the output of the line by line text parser
+    @pytest.mark.parametrize(
+        "test_file",
+        sorted(example_folder.glob("*.py")),
+        ids=lambda p: p.name,
+    )
+    @pytest.mark.parametrize("start_line", [1, 10])
+    def test_matches_text_parser(self, test_file, start_line):
+        src = test_file.read_text()
+        try:
+            text_metadata = parse_iterable(io.StringIO(src), start_line=start_line)
+        except ValueError as e:
+            with pytest.raises(ValueError) as exc_info:
+                parse_source(src, start_line=start_line)
+            assert exc_info.value.args == e.args
+            return
+
+        assert parse_source(src, start_line=start_line) == text_metadata
+
+    def test_crlf_source(self):
+        # Strings are only split on '\n' so '\r' remains in the block text
+        src = "# /// script\r\n# data\r\n# ///\r\n"
+        assert parse_source(src).blocks == {"script": "data\r\n"}
+
+
+def test_second_block_after_close():
+    # Closing line data from the first block must not leak into the second
+    src = "# /// a\n# x\n# ///\ncode\n# /// b\n# y\n# ///\n"
+    assert parse_source(src).blocks == {"a": "x\n", "b": "y\n"}
+
+
+class TestSpans:
+    @pytest.mark.parametrize(
+        "test_file",
+        sorted(example_folder.glob("*.py")),
+        ids=lambda p: p.name,
+    )
+    @pytest.mark.parametrize("as_bytes", [False, True])
+    def test_matches_parse_source(self, test_file, as_bytes):
+        src = test_file.read_text()
+        source = src.encode("utf-8") if as_bytes else src
+
+        try:
+            metadata = parse_source(src)
+        except ValueError as e:
+            with pytest.raises(ValueError) as exc_info:
+                list(iter_spans(source))
+            assert exc_info.value.args == e.args
+            return
+
+        blocks = {}
+        warnings = []
+        for span, warning_list in iter_spans(source):
+            if span:
+                blocks[span.name] = span.text(source)
+            warnings.extend(warning_list)
+
+        assert metadata == ScriptMetadata(blocks, warnings)
+
+    def test_span_locations(self):
+        src = b"import sys\n# /// script\n# data\n# ///\nprint(sys.argv)\n"
+        [(span, warnings)] = list(iter_spans(src))
+
+        assert warnings == []
+        assert span.name == "script"
+        assert (span.start_line, span.end_line) == (2, 4)
+
+        raw = span.raw(src)
+        assert isinstance(raw, memoryview)
+        assert raw == b"# /// script\n# data\n# ///\n"
+        assert src[span.body_start:span.body_end] == b"# data\n"
+        assert span.text(src) == "data\n"
+
+
+class TestStopEarly:
+    src = (
+        "# /// script\n# dependencies = []\n# ///\n"
+        "import sys\n"
+        "# /// tool\n# tool data\n# ///\n"
+        "import os\n"
+        "# /// script\n# duplicate\n# ///\n"
+    )
+
+    def test_blocks_filter(self):
+        src = "# /// script\n# data\n# ///\n\n# /// tool\n# tool data\n# ///\n"
+        assert parse_source(src, blocks={"tool"}).blocks == {"tool": "tool data\n"}
+
+    def test_stop_early_skips_duplicate(self):
+        with pytest.raises(ValueError):
+            parse_source(self.src)
+
+        metadata = parse_source(self.src, blocks={"script"}, stop_early=True)
+        assert metadata.blocks == {"script": "dependencies = []\n"}
+
+    @pytest.mark.parametrize("use_path", [False, True])
+    def test_stop_early_file(self, tmp_path, use_path):
+        test_file = tmp_path / "script.py"
+        test_file.write_text(self.src)
+
+        if use_path:
+            metadata = parse_file(test_file, blocks=["script", "tool"], stop_early=True)
+        else:
+            with test_file.open() as f:
+                metadata = parse_iterable(f, blocks=["script", "tool"], stop_early=True)
+
+        assert metadata.blocks == {"script": "dependencies = []\n", "tool": "tool data\n"}
+
+    def test_stop_early_stops_reading(self):
+        read_lines = []
+
+        def lines():
+            for line in self.src.splitlines(keepends=True):
+                read_lines.append(line)
+                yield line
+
+        parse_iterable(lines(), blocks={"script"}, stop_early=True)
+        # Stops after the first non-comment line following the block
+        assert read_lines[-1] == "import sys\n"
+
+    def test_stop_early_requires_blocks(self):
+        with pytest.raises(ValueError):
+            parse_source(self.src, stop_early=True)
+
+
+class TestHasMetadata:
+    @pytest.mark.parametrize(
+        "test_file",
+        sorted(example_folder.glob("*.py")),
+        ids=lambda p: p.name,
+    )
+    def test_matches_parse_file(self, test_file):
+        try:
+            expected = bool(parse_file(test_file).blocks)
+        except ValueError:
+            # Duplicate blocks are not checked
+            expected = True
+
+        assert has_metadata_file(test_file) is expected
+        assert has_metadata_file(str(test_file)) is expected
+        assert has_metadata_source(test_file.read_text()) is expected
+        assert has_metadata_source(test_file.read_bytes()) is expected
+
+    def test_unclosed(self):
+        assert not has_metadata_source("# /// script\n# data\nprint('no close')\n# ///\n")
+
+    def test_invalid_name(self):
+        assert not has_metadata_source("# /// !script!\n# data\n# ///\n")
+
+    @pytest.mark.parametrize("newline", ["\r\n", "\r"])
+    def test_newlines(self, newline, tmp_path):
+        test_file = tmp_path / "script.py"
+        test_file.write_text("x\n# /// script\n# data\n# ///\n", newline=newline)
+        assert has_metadata_file(test_file)
+        assert has_metadata_source(test_file.read_bytes())
+
+    def test_other_encoding(self, tmp_path):
+        test_file = tmp_path / "script.py"
+        test_file.write_text("# /// script\n# name = 'é'\n# ///\n", encoding="utf-16")
+        assert has_metadata_file(test_file, encoding="utf-16")
+
+    def test_max_bytes(self, tmp_path):
+        src = "import sys\n" * 100 + "# /// script\n# data\n# ///\n"
+        test_file = tmp_path / "script.py"
+        test_file.write_text(src)
+
+        assert has_metadata_file(test_file)
+        assert not has_metadata_file(test_file, max_bytes=1000)
+        # Closing line is cut off
+        assert not has_metadata_source(src, max_bytes=len(src) - 1)
+        assert has_metadata_source(src, max_bytes=len(src))
+
+
+class TestNoWarnings:
+    @pytest.mark.parametrize(
+        "test_file",
+        sorted(example_folder.glob("*.py")),
+        ids=lambda p: p.name,
+    )
+    def test_same_blocks(self, test_file):
+        try:
+            expected = parse_file(test_file)
+        except ValueError as e:
+            with pytest.raises(ValueError) as exc_info:
+                parse_file(test_file, collect_warnings=False)
+            assert exc_info.value.args == e.args
+            return
+
+        src = test_file.read_text()
+        results = [
+            parse_file(test_file, collect_warnings=False),
+            parse_source(src, collect_warnings=False),
+            parse_iterable(io.StringIO(src), collect_warnings=False),
+        ]
+
+        for metadata in results:
+            assert metadata.blocks == expected.blocks
+            assert metadata.warnings == []
+
+    def test_iter_parse(self):
+        src = "# /// !bad!\n# /// script\n# /// other\n# ///\n\n# /// unclosed\n"
+        assert list(iter_parse(io.StringIO(src), collect_warnings=False)) == [
+            ("script", "/// other\n", []),
+        ]
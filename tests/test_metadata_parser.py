@@ -0,0 +1,71 @@
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import MetadataParser, parse_source
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+
+def _feed_chunks(data, size, **kwargs):
+    parser = MetadataParser(**kwargs)
+    results = []
+    for i in range(0, len(data), size):
+        results.extend(parser.feed(data[i:i + size]))
+    results.extend(parser.close())
+    return parser, results
+
+
+@pytest.mark.parametrize("test_file", example_paths, ids=lambda p: p.name)
+@pytest.mark.parametrize("encoding", [None, "utf-8", "utf-16"])
+@pytest.mark.parametrize("size", [1, 7, 4096])
+def test_matches_parse_source(test_file, encoding, size):
+    src = test_file.read_text()
+    data = src if encoding is None else src.encode(encoding)
+    kwargs = {} if encoding is None else {"encoding": encoding}
+
+    try:
+        expected = parse_source(src)
+    except ValueError as e:
+        with pytest.raises(ValueError) as exc_info:
+            _feed_chunks(data, size, **kwargs)
+        assert exc_info.value.args == e.args
+        return
+
+    parser, results = _feed_chunks(data, size, **kwargs)
+    assert parser.metadata == expected
+    assert {name: text for name, text, _ in results if name} == expected.blocks
+
+
+def test_blocks_emitted_on_feed():
+    parser = MetadataParser()
+    assert parser.feed(b"# /// script\n# da") == []
+    assert parser.feed(b"ta\n# ///\n") == []
+    assert parser.feed(b"import sys\n") == [("script", "data\n", [])]
+    assert parser.close() == []
+
+
+def test_multibyte_split():
+    data = "# /// script\n# name = 'ünïcödé'\n# ///\n".encode("utf-8")
+    parser, _ = _feed_chunks(data, 1)
+    assert parser.metadata.blocks == {"script": "name = 'ünïcödé'\n"}
+
+
+def test_unclosed_at_eof():
+    parser, _ = _feed_chunks("\n# /// script\n# data", 3, start_line=10)
+    assert parser.metadata.blocks == {}
+    assert [w.line_number for w in parser.metadata.warnings] == [12]
+
+
+def test_errors():
+    parser = MetadataParser()
+    parser.feed("# /// script\n")
+    with pytest.raises(TypeError):
+        parser.feed(b"# ///\n")
+
+    parser.close()
+    with pytest.raises(ValueError):
+        parser.feed("more\n")
+    with pytest.raises(ValueError):
+        parser.close()
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import parse_file, parse_files
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+
+def _expected(path):
+    try:
+        return parse_file(path)
+    except ValueError as e:
+        return e
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+@pytest.mark.parametrize("chunksize", [1, 4, 100])
+def test_matches_parse_file(executor, chunksize):
+    results = dict(
+        parse_files(example_paths, workers=2, executor=executor, chunksize=chunksize)
+    )
+
+    assert results.keys() == set(example_paths)
+
+    for path, result in results.items():
+        expected = _expected(path)
+        if isinstance(expected, ValueError):
+            assert type(result) is ValueError
+            assert result.args == expected.args
+        else:
+            assert result == expected
+
+
+def test_missing_file(tmp_path):
+    missing = tmp_path / "missing.py"
+    [(path, result)] = parse_files([missing])
+
+    assert path == missing
+    assert isinstance(result, FileNotFoundError)
+
+
+def test_no_files():
+    assert list(parse_files([])) == []
+
+
+def test_invalid_arguments():
+    # Arguments are checked when parse_files is called, not on first iteration
+    with pytest.raises(ValueError):
+        parse_files(example_paths, executor="fibers")
+
+    with pytest.raises(ValueError):
+        parse_files(example_paths, chunksize=0)
+
+    with pytest.raises(ValueError):
+        parse_files(example_paths, workers=0)
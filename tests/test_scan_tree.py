@@ -0,0 +1,89 @@
+import os
+import shutil
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import parse_file, scan_tree
+
+example_folder = Path(__file__).parent / "example_files"
+
+
+@pytest.fixture
+def tree(tmp_path):
+    shutil.copy(example_folder / "pep-723-sample.py", tmp_path / "script.py")
+    (tmp_path / "no_block.py").write_text("print('Hello')\n")
+    (tmp_path / "empty.py").write_text("")
+
+    sub = tmp_path / "sub" / "deeper"
+    sub.mkdir(parents=True)
+    shutil.copy(example_folder / "basic_alternate_example.py", sub / "alternate.py")
+    shutil.copy(example_folder / "invalid_repeated_block.py", sub / "repeated.py")
+    shutil.copy(example_folder / "pep-723-sample.py", sub / "script.txt")
+
+    venv = tmp_path / ".venv"
+    venv.mkdir()
+    shutil.copy(example_folder / "pep-723-sample.py", venv / "hidden.py")
+
+    return tmp_path
+
+
+def test_scan_tree(tree):
+    results = dict(scan_tree(tree))
+
+    assert set(results) == {
+        str(tree / "script.py"),
+        str(tree / "sub" / "deeper" / "alternate.py"),
+        str(tree / "sub" / "deeper" / "repeated.py"),
+    }
+
+    assert results[str(tree / "script.py")] == parse_file(tree / "script.py")
+    assert isinstance(results[str(tree / "sub" / "deeper" / "repeated.py")], ValueError)
+
+
+@pytest.mark.parametrize("follow_symlinks", [False, True])
+def test_scan_tree_missing_root(tmp_path, follow_symlinks):
+    with pytest.raises(FileNotFoundError):
+        list(scan_tree(tmp_path / "missing", follow_symlinks=follow_symlinks))
+
+
+@pytest.mark.skipif(
+    not hasattr(os, "geteuid") or os.geteuid() == 0,
+    reason="Requires a non root user on a posix system",
+)
+def test_scan_tree_unreadable_subdirectory(tree):
+    locked = tree / "locked"
+    locked.mkdir()
+    shutil.copy(example_folder / "pep-723-sample.py", locked / "script.py")
+    locked.chmod(0)
+    try:
+        results = dict(scan_tree(tree))
+    finally:
+        locked.chmod(0o700)
+
+    assert str(tree / "script.py") in results
+    assert str(locked / "script.py") not in results
+
+
+def test_scan_tree_include_exclude(tree):
+    results = dict(scan_tree(tree, include=("*.py", "*.txt"), exclude=("deeper",)))
+
+    assert set(results) == {
+        str(tree / "script.py"),
+        str(tree / ".venv" / "hidden.py"),
+    }
+
+
+@pytest.mark.skipif(not hasattr(os, "symlink"), reason="Requires symlinks")
+def test_scan_tree_symlink_loop(tree):
+    try:
+        os.symlink(tree, tree / "sub" / "loop", target_is_directory=True)
+    except OSError:
+        pytest.skip("Unable to create symlinks")
+
+    unfollowed = dict(scan_tree(tree))
+    followed = dict(scan_tree(tree, follow_symlinks=True))
+
+    # The link leads back to the root which has already been visited
+    assert len(unfollowed) == 3
+    assert set(followed) == set(unfollowed)
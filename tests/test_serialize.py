@@ -0,0 +1,119 @@
+import pickle
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import (
+    MetadataWarning,
+    ScriptMetadata,
+    WarningCode,
+    parse_file,
+    parse_source,
+)
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+
+def _parse(path):
+    try:
+        return parse_file(path)
+    except ValueError:
+        pytest.skip("duplicate block")
+
+
+def _assert_same(rebuilt, metadata):
+    assert rebuilt == metadata
+    assert type(rebuilt) is type(metadata)
+    for new, old in zip(rebuilt.warnings, metadata.warnings):
+        assert (new.code, new.block_names) == (old.code, old.block_names)
+
+
+@pytest.mark.parametrize("path", example_paths, ids=lambda p: p.name)
+def test_roundtrip(path):
+    metadata = _parse(path)
+    _assert_same(ScriptMetadata.from_bytes(metadata.to_bytes()), metadata)
+
+
+@pytest.mark.parametrize("protocol", range(pickle.HIGHEST_PROTOCOL + 1))
+def test_pickle(protocol):
+    metadata = _parse(example_folder / "multiple_block_warnings.py")
+    _assert_same(pickle.loads(pickle.dumps(metadata, protocol)), metadata)
+
+
+def test_smaller_than_generic_pickle():
+    metadata = _parse(example_folder / "multiple_block_warnings.py")
+    # Pickle the slots directly as pickle would without __reduce__
+    state = (metadata.blocks, metadata.warnings)
+    assert len(pickle.dumps(metadata)) < len(pickle.dumps(state))
+
+
+def test_names_stored_once():
+    name = "a-long-block-name"
+    metadata = parse_source(
+        f"# /// {name}\n# ///\n"
+        f"# /// other\n# /// {name}\n"
+    )
+    assert metadata.warnings
+    assert metadata.to_bytes().count(name.encode()) == 1
+
+
+def test_warning_messages():
+    coded = MetadataWarning(3, code=WarningCode.UNCLOSED_BLOCK, block_names=("script",))
+    # Accessing the message stores the formatted text
+    coded_formatted = MetadataWarning(
+        4, code=WarningCode.UNCLOSED_BLOCK, block_names=("tool",)
+    )
+    assert coded_formatted.message
+    metadata = ScriptMetadata(
+        {"script": "a = 1\n", "empty": "", "none": None, "ünïcode": "\udcff\n"},
+        [
+            MetadataWarning(1, "custom message"),
+            MetadataWarning(-5, "before the start"),
+            MetadataWarning(2, "custom", code=WarningCode.UNCLOSED_BLOCK, block_names=("x",)),
+            coded,
+            coded_formatted,
+        ],
+    )
+
+    data = metadata.to_bytes()
+    assert b"Potential unclosed block" not in data
+
+    rebuilt = ScriptMetadata.from_bytes(data)
+    _assert_same(rebuilt, metadata)
+    assert rebuilt.warnings[2].message == "custom"
+
+
+def test_subclass():
+    class SubMetadata(ScriptMetadata):
+        __slots__ = ()
+
+    metadata = SubMetadata({"script": ""}, [])
+    _assert_same(SubMetadata.from_bytes(memoryview(metadata.to_bytes())), metadata)
+
+
+@pytest.mark.parametrize(
+    "data, match",
+    [
+        (b"", "not serialized"),
+        (b"SMD", "not serialized"),
+        (b"{}", "not serialized"),
+        (b"SMD\x63", "Unsupported .* version 99"),
+        (b"SMD\x01", "Invalid"),
+        (b"SMD\x01\x01\x05ab", "Invalid"),
+        (b"SMD\x01\x00\x01\x00\x00\x00", "Invalid"),
+        (b"SMD\x01\x01\x00\x00\x00", "Invalid"),
+        (b"SMD\x01\x00\x00\x00\x00", "trailing"),
+    ],
+)
+def test_invalid_data(data, match):
+    with pytest.raises(ValueError, match=match):
+        ScriptMetadata.from_bytes(data)
+
+
+def test_truncated():
+    data = _parse(example_folder / "multiple_block_warnings.py").to_bytes()
+    for end in range(len(data)):
+        with pytest.raises(ValueError):
+            ScriptMetadata.from_bytes(data[:end])
+
@@ -0,0 +1,180 @@
+import json
+import pickle
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import (
+    ParseStats,
+    iter_parse,
+    parse_file,
+    parse_files,
+    parse_iterable,
+    parse_source,
+)
+from ducktools.scriptmetadata.__main__ import main
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+ENGINES = ["auto", "statemachine", "regex", "bytes"]
+
+source = (
+    "import sys\n"
+    "# /// script\n"
+    "# dependencies = []\n"
+    "# ///\n"
+    "\n"
+    "# /// bad!\n"
+    "x = 1\n"
+    "# /// tool\n"
+    "# a = 1\n"
+)
+
+
+def _check_times(stats):
+    for name in ["open_time", "read_time", "scan_time", "join_time"]:
+        assert getattr(stats, name) >= 0
+    assert stats.total_time == pytest.approx(
+        stats.open_time + stats.read_time + stats.scan_time + stats.join_time
+    )
+
+
+def test_parse_source():
+    stats = ParseStats()
+    metadata = parse_source(source, engine="bytes", stats=stats)
+
+    assert metadata == parse_source(source)
+    assert stats.bytes_read == len(source)
+    # The first line is skipped by the search for opening lines
+    assert stats.lines_scanned == 8
+    assert stats.candidate_lines == 6
+    assert stats.blocks == 1
+    assert stats.warnings == 2
+    assert stats.scan_time > 0
+    assert stats.open_time == stats.read_time == 0
+    _check_times(stats)
+
+
+def test_iter_parse():
+    stats = ParseStats()
+    lines = source.splitlines(keepends=True)
+    results = list(iter_parse(lines, stats=stats))
+
+    assert results == list(iter_parse(lines))
+    assert stats.bytes_read == len(source)
+    assert stats.lines_scanned == len(lines)
+    assert stats.blocks == 1
+    assert stats.warnings == 2
+
+
+def test_parse_iterable_accumulates():
+    stats = ParseStats()
+    lines = source.splitlines(keepends=True)
+    parse_iterable(lines, stats=stats)
+    parse_iterable(lines, stats=stats)
+
+    assert stats.lines_scanned == 2 * len(lines)
+    assert stats.blocks == 2
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("path", example_paths, ids=lambda p: p.name)
+def test_parse_file(engine, path):
+    stats = ParseStats()
+    try:
+        metadata = parse_file(path, engine=engine, stats=stats)
+    except ValueError:
+        return
+
+    assert metadata == parse_file(path)
+    assert stats.bytes_read == path.stat().st_size
+    assert stats.blocks == len(metadata.blocks)
+    assert stats.warnings == len(metadata.warnings)
+    assert stats.open_time > 0
+    _check_times(stats)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("encoding", ["utf-8", None])
+@pytest.mark.parametrize(
+    "data",
+    [
+        source.replace("\n", "\r\n").encode(),
+        # Detected encoding that can not be searched as bytes
+        ("# coding: cp775\n" + source).encode("cp775"),
+    ],
+    ids=["crlf", "cp775"],
+)
+def test_bytes_read_once(engine, encoding, data, tmp_path):
+    path = tmp_path / "script.py"
+    path.write_bytes(data)
+
+    stats = ParseStats()
+    parse_file(path, encoding=encoding, engine=engine, stats=stats)
+    assert stats.bytes_read == len(data)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_stop_early(engine, tmp_path):
+    path = tmp_path / "script.py"
+    path.write_text(source)
+
+    stats = ParseStats()
+    parse_file(path, blocks={"script"}, stop_early=True, engine=engine, stats=stats)
+
+    assert stats.blocks == 1
+    assert stats.scan_time > 0
+    # The unclosed tool block is never reached
+    assert stats.warnings == 0
+
+
+def test_add():
+    first = ParseStats(lines_scanned=1, blocks=1, scan_time=0.5)
+    second = ParseStats(lines_scanned=2, warnings=3, scan_time=0.25)
+
+    assert first + second == ParseStats(
+        lines_scanned=3, blocks=1, warnings=3, scan_time=0.75
+    )
+
+    first += second
+    assert first.as_dict() == {
+        "lines_scanned": 3,
+        "bytes_read": 0,
+        "candidate_lines": 0,
+        "blocks": 1,
+        "warnings": 3,
+        "open_time": 0.0,
+        "read_time": 0.0,
+        "scan_time": 0.75,
+        "join_time": 0.0,
+    }
+    assert repr(first).startswith("ParseStats(lines_scanned=3, ")
+
+
+def test_pickle():
+    stats = ParseStats(lines_scanned=1, scan_time=0.5)
+    assert pickle.loads(pickle.dumps(stats)) == stats
+
+
+@pytest.mark.parametrize("executor", ["thread", "process"])
+def test_parse_files(executor):
+    expected = ParseStats()
+    for path in example_paths:
+        try:
+            parse_file(path, stats=expected)
+        except ValueError:
+            pass
+
+    stats = ParseStats()
+    list(parse_files(example_paths, executor=executor, chunksize=2, stats=stats))
+
+    for name in ["lines_scanned", "bytes_read", "candidate_lines", "blocks", "warnings"]:
+        assert getattr(stats, name) == getattr(expected, name)
+
+
+def test_cli_stats(capsys):
+    main(["--stats", *map(str, example_paths)])
+    err = capsys.readouterr().err
+    stats = json.loads(err)["stats"]
+    assert stats["bytes_read"] == sum(p.stat().st_size for p in example_paths)
@@ -0,0 +1,192 @@
+import sys
+import threading
+from pathlib import Path
+
+import pytest
+
+from ducktools.scriptmetadata import (
+    iter_parse,
+    parse_file,
+    parse_source,
+)
+from ducktools.scriptmetadata.cache import ContentCache, MemoryCache
+from ducktools.scriptmetadata.watch import MetadataWatcher
+
+THREADS = 8
+ENGINES = ["auto", "statemachine", "regex", "bytes"]
+
+example_folder = Path(__file__).parent / "example_files"
+example_paths = sorted(example_folder.glob("*.py"))
+
+
+@pytest.fixture(autouse=True)
+def frequent_switches():
+    # With the GIL, switch threads often to give races a chance to show up
+    interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)
+    yield
+    sys.setswitchinterval(interval)
+
+
+def _result(func, *args, **kwargs):
+    try:
+        return func(*args, **kwargs)
+    except ValueError as e:
+        return e.args
+
+
+def run_threads(func, threads=THREADS):
+    """
+    Run func(index) in each thread at the same time, collecting the results
+    and re-raising the first exception
+    """
+    barrier = threading.Barrier(threads)
+    results = [None] * threads
+    errors = []
+
+    def worker(index):
+        barrier.wait()
+        try:
+            results[index] = func(index)
+        except BaseException as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+
+    if errors:
+        raise errors[0]
+    return results
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_parse_file(engine):
+    expected = [_result(parse_file, path, engine=engine) for path in example_paths]
+
+    def parse_all(_):
+        return [
+            _result(parse_file, path, engine=engine)
+            for _ in range(5)
+            for path in example_paths
+        ]
+
+    for results in run_threads(parse_all):
+        assert results == expected * 5
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_parse_source(engine):
+    # Every thread parses the same string objects
+    sources = [path.read_text() for path in example_paths]
+    expected = [_result(parse_source, source, engine=engine) for source in sources]
+
+    def parse_all(index):
+        return [
+            _result(parse_source, source, engine=engine, start_line=index + 1)
+            for source in sources
+        ]
+
+    for index, results in enumerate(run_threads(parse_all)):
+        for result, base in zip(results, expected):
+            if isinstance(base, tuple):
+                assert isinstance(result, tuple)
+            else:
+                assert result.blocks == base.blocks
+                assert [w.line_number for w in result.warnings] == [
+                    w.line_number + index for w in base.warnings
+                ]
+
+
+def _iter_parse_summary(lines):
+    return [
+        (name, text, [str(w) for w in warnings])
+        for name, text, warnings in iter_parse(lines)
+    ]
+
+
+def test_iter_parse_shared_lines():
+    source = (example_folder / "multiple_block_warnings.py").read_text()
+    lines = source.splitlines(keepends=True)
+    expected = _iter_parse_summary(lines)
+
+    def parse(_):
+        return [_iter_parse_summary(lines) for _ in range(20)]
+
+    for results in run_threads(parse):
+        assert results == [expected] * 20
+
+
+def test_shared_warning_messages():
+    # Messages are formatted on first use, possibly by several threads at once
+    path = example_folder / "multiple_block_warnings.py"
+    metadata = parse_file(path)
+    expected = [str(w) for w in parse_file(path).warnings]
+
+    results = run_threads(lambda _: [str(w) for w in metadata.warnings])
+    assert results == [expected] * THREADS
+
+
+def test_memory_cache():
+    cache = MemoryCache(max_entries=3)
+    expected = {path: _result(parse_file, path) for path in example_paths}
+
+    def parse_all(_):
+        return [
+            (path, _result(cache.parse_file, path))
+            for _ in range(5)
+            for path in example_paths
+        ]
+
+    for results in run_threads(parse_all):
+        for path, result in results:
+            assert result == expected[path]
+    assert len(cache) <= 3
+
+
+def test_content_cache():
+    cache = ContentCache(max_entries=4)
+    sources = [path.read_text() for path in example_paths]
+    expected = [_result(parse_source, source) for source in sources]
+
+    def parse_all(_):
+        return [
+            [_result(cache.parse_source, source) for source in sources]
+            for _ in range(5)
+        ]
+
+    for results in run_threads(parse_all):
+        assert results == [expected] * 5
+    assert len(cache) <= 4
+    # Every lookup is counted once
+    assert cache.hits + cache.misses == THREADS * 5 * len(sources)
+
+
+def test_watcher_queries_during_poll(tmp_path):
+    for i in range(50):
+        (tmp_path / f"script_{i}.py").write_text(
+            f"# /// script\n# index = {i}\n# ///\n"
+        )
+    watcher = MetadataWatcher(tmp_path)
+    done = threading.Event()
+
+    def work(index):
+        if index == 0:
+            try:
+                return len(watcher.poll())
+            finally:
+                done.set()
+        seen = []
+        while not done.is_set():
+            found = watcher.find("script")
+            # The index is updated all at once
+            seen.append(len(found))
+        return seen
+
+    results = run_threads(work, threads=4)
+    assert results[0] == 50
+    for seen in results[1:]:
+        assert set(seen) <= {0, 50}
+    assert len(watcher.find("script")) == 50
@@ -0,0 +1,121 @@
+import os
+import threading
+
+import pytest
+
+from ducktools.scriptmetadata import parse_file
+from ducktools.scriptmetadata.watch import EventKind, MetadataWatcher, WatchEvent
+
+SCRIPT = "# /// script\n# dependencies = []\n# ///\n"
+TOOL = "# /// tool\n# a = 1\n# ///\n"
+
+
+def _write(path, text):
+    # Bump the mtime so a rewrite within the timestamp resolution is seen
+    mtime = path.stat().st_mtime_ns + 1_000_000 if path.exists() else None
+    path.write_text(text)
+    if mtime is not None:
+        os.utime(path, ns=(mtime, mtime))
+
+
+@pytest.fixture
+def tree(tmp_path):
+    (tmp_path / "pkg").mkdir()
+    (tmp_path / ".venv").mkdir()
+    _write(tmp_path / "a.py", SCRIPT)
+    _write(tmp_path / "pkg" / "b.py", SCRIPT + "\n" + TOOL)
+    _write(tmp_path / "pkg" / "notes.txt", SCRIPT)
+    _write(tmp_path / ".venv" / "c.py", SCRIPT)
+    return tmp_path
+
+
+def test_first_poll(tree):
+    watcher = MetadataWatcher(tree)
+    events = watcher.poll()
+
+    a, b = str(tree / "a.py"), str(tree / "pkg" / "b.py")
+    assert events == [
+        WatchEvent(EventKind.ADDED, a, parse_file(a)),
+        WatchEvent(EventKind.ADDED, b, parse_file(b)),
+    ]
+    assert len(watcher) == 2
+    assert a in watcher
+    assert watcher.index == {a: parse_file(a), b: parse_file(b)}
+    assert list(watcher.find("script")) == [a, b]
+    assert list(watcher.find("tool")) == [b]
+    assert watcher.find("missing") == {}
+
+    assert watcher.poll() == []
+
+
+def test_changes(tree):
+    watcher = MetadataWatcher(tree)
+    watcher.poll()
+
+    a, b = tree / "a.py", tree / "pkg" / "b.py"
+    new = tree / "pkg" / "new.py"
+    _write(a, TOOL)
+    b.unlink()
+    _write(new, "")
+
+    events = watcher.poll()
+    assert [(e.kind, e.path) for e in events] == [
+        (EventKind.REMOVED, str(b)),
+        (EventKind.CHANGED, str(a)),
+        (EventKind.ADDED, str(new)),
+    ]
+    assert events[0].metadata is None
+    assert events[1].metadata.blocks == {"tool": "a = 1\n"}
+
+    assert list(watcher.find("tool")) == [str(a)]
+    assert watcher.find("script") == {}
+    assert watcher.get(str(b)) is None
+    assert watcher.get(str(new)).blocks == {}
+
+
+def test_touch_without_change(tree):
+    watcher = MetadataWatcher(tree)
+    watcher.poll()
+
+    path = tree / "a.py"
+    _write(path, path.read_text())
+    assert watcher.poll() == []
+    assert list(watcher.find("script")) == [str(path), str(tree / "pkg" / "b.py")]
+
+
+def test_errors(tree):
+    watcher = MetadataWatcher(tree)
+    watcher.poll()
+
+    path = tree / "a.py"
+    _write(path, SCRIPT + "x\n" + SCRIPT)
+    (event,) = watcher.poll()
+    assert event.kind == EventKind.CHANGED
+    assert isinstance(event.metadata, ValueError)
+    assert list(watcher.errors) == [str(path)]
+    assert str(path) not in watcher.index
+    assert list(watcher.find("script")) == [str(tree / "pkg" / "b.py")]
+
+    # The same error again is not a change
+    _write(path, SCRIPT + "y\n" + SCRIPT)
+    assert watcher.poll() == []
+
+    _write(path, SCRIPT)
+    (event,) = watcher.poll()
+    assert event.metadata == parse_file(path)
+    assert watcher.errors == {}
+
+
+def test_watch(tree):
+    watcher = MetadataWatcher(tree)
+    stop = threading.Event()
+    events = []
+
+    for event in watcher.watch(0.01, stop=stop):
+        events.append(event)
+        if len(events) == 2:
+            _write(tree / "a.py", TOOL)
+        elif len(events) == 3:
+            stop.set()
+
+    assert [e.kind for e in events] == ["added", "added", "changed"]